@@ -3,31 +3,27 @@ from airflow.operators.python import PythonOperator
 from airflow.operators.empty import EmptyOperator  # Corrigé
 from datetime import datetime, timedelta
 import pendulum, sys, os, logging, time
-from scripts_data.scraper import scrape_reviews
-from scripts_data.cleaner import clean_data
-from scripts_data.main import main as run_full_scraper_pipeline
-from api.bq_insert_clean_data import insert_clean_reviews_to_bq
 from dotenv import load_dotenv
 
-from monitoring.metrics import ANALYSIS_DURATION, push_metrics_to_gateway
+# Airflow réimporte ce fichier à chaque cycle de parsing : les modules du projet (pandas, bigquery,
+# anthropic, bs4...) ne sont importés que dans les callables, à l'exécution des tâches.
+# Budget de temps d'import vérifié par tests/test_import_time.py
 
 MONITORING_JOB = "verbatim_pipeline"
 MONITORING_INSTANCE = os.getenv("MONITORING_INSTANCE", "dev")
+PROJECT_ENV_PATH = "/opt/airflow/project/.env"
 
 # Chargement des variables d'environnement
-load_dotenv("/opt/airflow/project/.env")
+load_dotenv(PROJECT_ENV_PATH)
 
 # Ajout des chemins 
 sys.path.append("/opt/airflow/project/scripts_data")
 sys.path.append("/opt/airflow/project/api")
 
-try:
-    from api.analyze_and_insert import process_and_insert_all
-    PROCESS_AVAILABLE = True
-except FileNotFoundError as e:
-    logging.error(f" Fichier manquant empêchant l'import : {e}")
-    process_and_insert_all = None
-    PROCESS_AVAILABLE = False
+# Sans .env (clé API, credentials), l'analyse est remplacée par une tâche vide
+PROCESS_AVAILABLE = os.path.exists(PROJECT_ENV_PATH)
+if not PROCESS_AVAILABLE:
+    logging.error(f" Fichier manquant empêchant l'analyse : {PROJECT_ENV_PATH}")
 
 print("***Fichier .env chargé")
 print("***Mode scraping :", os.getenv("SCRAPER_MODE"))
@@ -36,23 +32,38 @@ print("***Fichier d’entrée :", os.getenv("INPUT_CSV"))
 
 # Wrappers pour les fonctions de scraping et d'analyse afin de les adapter à Airflow
 def wrapper_run_scraper(**context):
+    from scripts_data.scraper import scrape_reviews
+
     scrape_date = context["ds"]
     print(f"Wrapper Scraper : scrape_date = {scrape_date}")
     scrape_reviews()
 
 
+def wrapper_clean_data(input_file, output_file):
+    from scripts_data.cleaner import clean_data
+
+    return clean_data(input_file=input_file, output_file=output_file)
+
+
+def wrapper_insert_clean_reviews(**context):
+    from api.bq_insert_clean_data import insert_clean_reviews_to_bq
+
+    return insert_clean_reviews_to_bq()
+
+
 def wrapper_process_and_insert(**context):
+    from api.analyze_and_insert import process_and_insert_all
+    from monitoring.metrics import ANALYSIS_DURATION
+
     scrape_date = context["ds"]
-    print(f"Wrapper Analyse/Insert : scrape_date = {scrape_date}")
+    analysis_mode = context["params"].get("analysis_mode", "interactive")
+    print(f"Wrapper Analyse/Insert : scrape_date = {scrape_date}, mode = {analysis_mode}")
     print("Fichier de credentials GCP : ", os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
-    if process_and_insert_all:
-        start_time = time.time()
-        process_and_insert_all(scrape_date=scrape_date)
-        end_time = time.time()
-        duration = end_time - start_time
-        ANALYSIS_DURATION.observe(duration)
-    else:
-        raise RuntimeError("Fonction d’analyse non disponible. Vérifiez le fichier de credentials.")
+    start_time = time.time()
+    process_and_insert_all(scrape_date=scrape_date, mode=analysis_mode)
+    end_time = time.time()
+    duration = end_time - start_time
+    ANALYSIS_DURATION.observe(duration)
 
 
 # Paramètres par défaut
@@ -72,6 +83,8 @@ with DAG(
     start_date=datetime(2025, 6, 1, tzinfo=pendulum.timezone("Europe/Paris")),
     catchup=False,
     tags=['trustpilot', 'nlp', 'bq'],
+    # "batch" : analyse via l'API Message Batches (moins chère, sans contrainte de latence)
+    params={"analysis_mode": os.getenv("ANALYSIS_MODE", "interactive")},
     doc_md="""
     ### Pipeline Trustpilot
     Ce DAG scrape les avis Trustpilot de Leroy Merlin, les nettoie, les insère dans BigQuery, puis les analyse via Claude.
@@ -87,7 +100,7 @@ with DAG(
     # Nettoyage
     clean_task = PythonOperator(
         task_id='clean_reviews',
-        python_callable=clean_data,
+        python_callable=wrapper_clean_data,
     op_kwargs={
         "input_file": "/opt/airflow/project/data/avis_boutique.csv",
         "output_file": "/opt/airflow/project/data/avis_boutique_clean.csv",
@@ -97,7 +110,7 @@ with DAG(
     # Insertion des avis nettoyés dans BQ
     insert_task = PythonOperator(
     task_id="insert_clean_reviews_to_bq",
-    python_callable=insert_clean_reviews_to_bq,
+    python_callable=wrapper_insert_clean_reviews,
     )
 
     # Analyse / Insertion ou Dummy si process indisponible
@@ -110,6 +123,8 @@ with DAG(
         analyze_insert_task = EmptyOperator(task_id='skip_analyze_insert_due_to_missing_cred') # Corrigé
 
 def wrapper_push_metrics(**context):
+    from monitoring.metrics import push_metrics_to_gateway
+
     push_metrics_to_gateway(job_name=MONITORING_JOB, instance=MONITORING_INSTANCE)
 
 
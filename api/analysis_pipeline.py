@@ -0,0 +1,299 @@
+"""Analyse d'une date en pipeline par étapes : lecture → classification → écriture.
+
+- un lecteur parcourt les verbatims BigQuery page par page et alimente une file bornée ;
+- un pool de workers consomme cette file et classifie les avis (Claude ou classify_fn) ;
+- un écrivain regroupe les lignes topic_analysis et les insère par lots dans BigQuery.
+
+Les files sont bornées : une étape plus rapide que la suivante se bloque au lieu d'accumuler les
+avis en mémoire (contre-pression). La profondeur des files et le débit de chaque étape sont exportés
+(pipeline_queue_depth, pipeline_stage_throughput) pour repérer le goulot d'étranglement.
+
+Activation dans run_analysis (mode interactive) : ANALYSIS_PIPELINE=1. L'échéance et le budget de tokens
+de run_analysis s'appliquent avis par avis dans les workers ; les verbatims étant lus en flux, les avis
+non admis sont reportés dans l'ordre de lecture, sans tri par priorité. Les avis reportés par une
+exécution précédente (enregistrement de continuation) sont lus et classés en premier.
+"""
+import os, queue, threading, time
+from api.analyze_and_insert import (
+    TOPIC_ANALYSIS_TABLE_ID, analysis_version, build_topic_rows, delete_previous_rows, get_project_id, load_topic_ids,
+    open_checkpoint,
+)
+from api.bq_connect import get_verbatims_by_ids, iter_verbatims_by_date
+from api.claude_interface import classify_with_claude
+from api.scheduler import AnalysisScheduler, clear_continuation, load_continuation, write_continuation
+from api.topic_aggregates import refresh_topic_aggregates
+from monitoring.metrics import (
+    PIPELINE_QUEUE_DEPTH, PIPELINE_STAGE_ITEMS, PIPELINE_STAGE_THROUGHPUT, log_analysis_metrics,
+)
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+PIPELINE_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.getenv("CLAUDE_CONCURRENCY", "4")))
+# Lignes topic_analysis par insertion, et délai maximal avant d'écrire un lot incomplet
+INSERT_BATCH_ROWS = int(os.getenv("BQ_INSERT_BATCH_ROWS", "500"))
+INSERT_FLUSH_SECONDS = float(os.getenv("BQ_INSERT_FLUSH_SECONDS", "2"))
+
+_END = object()  # fin de flux, transmise d'une étape à la suivante
+
+
+class StageMeter:
+    """Compte les éléments traités par une étape et publie son débit moyen depuis le démarrage."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.count = 0
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def tick(self, n: int = 1):
+        with self._lock:
+            self.count += n
+            elapsed = time.time() - self.start
+        PIPELINE_STAGE_ITEMS.labels(stage=self.stage).inc(n)
+        if elapsed > 0:
+            PIPELINE_STAGE_THROUGHPUT.labels(stage=self.stage).set(self.count / elapsed)
+
+
+def _put(q: queue.Queue, name: str, item):
+    q.put(item)  # bloque tant que la file est pleine : contre-pression vers l'étape amont
+    PIPELINE_QUEUE_DEPTH.labels(queue=name).set(q.qsize())
+
+
+def _get(q: queue.Queue, name: str, timeout: float | None = None):
+    item = q.get(timeout=timeout)
+    PIPELINE_QUEUE_DEPTH.labels(queue=name).set(q.qsize())
+    return item
+
+
+def resumed_first(verbatims, continuation: dict | None):
+    """Avis de l'enregistrement de continuation (dans son ordre), puis le reste du flux sans eux."""
+    if not continuation:
+        yield from verbatims
+        return
+    resumed = get_verbatims_by_ids(continuation["review_ids"])
+    yield from resumed
+    resumed_ids = {v["review_id"] for v in resumed}
+    yield from (v for v in verbatims if v["review_id"] not in resumed_ids)
+
+
+def _read(verbatims, verbatim_queue: queue.Queue, workers: int, failures: list, checkpoint, stats: dict,
+          stop: threading.Event):
+    meter = StageMeter("read")
+    try:
+        for v in verbatims:
+            if stop.is_set():
+                break
+            if checkpoint is not None and checkpoint.is_done(v["review_id"]):
+                stats["skipped"] += 1
+                continue
+            _put(verbatim_queue, "verbatims", v)
+            meter.tick()
+    except Exception as e:
+        failures.append(e)
+        print(f"❌ Lecture des verbatims interrompue : {e}")
+    finally:
+        for _ in range(workers):
+            _put(verbatim_queue, "verbatims", _END)
+
+
+def _classify(classify_fn, verbatim_queue: queue.Queue, result_queue: queue.Queue, meter: StageMeter,
+              scheduler: AnalysisScheduler, stop: threading.Event):
+    while True:
+        v = _get(verbatim_queue, "verbatims")
+        if v is _END:
+            _put(result_queue, "results", _END)
+            return
+        if stop.is_set():  # écrivain arrêté : la file est vidée sans classer
+            continue
+        if not scheduler.admit(v):
+            _put(result_queue, "results", {"verbatim": v, "deferred": True})
+            continue
+        start = time.time()
+        try:
+            themes, error = classify_fn(v["content"], rating=v.get("rating")), None
+        except Exception as e:
+            themes, error = None, e
+        duration = time.time() - start
+        scheduler.record(duration)
+        _put(result_queue, "results", {"verbatim": v, "themes": themes, "error": error, "duration": duration})
+        meter.tick()
+
+
+class BatchWriter:
+    """Regroupe les lignes de plusieurs avis et les insère par lots dans topic_analysis."""
+
+    def __init__(self, client, label_to_id: dict, batch_rows: int, stats: dict, version: str, checkpoint=None):
+        self.client = client
+        self.label_to_id = label_to_id
+        self.version = version
+        self.checkpoint = checkpoint
+        self.batch_rows = batch_rows
+        self.stats = stats
+        self.pending = []  # (résultat, lignes, thèmes inconnus)
+        self.pending_rows = 0
+        self.last_flush = time.time()
+        self.analyzed_review_ids = []
+        self.meter = StageMeter("write")
+
+    def add(self, result: dict):
+        v = result["verbatim"]
+        if result["error"] is not None:
+            self.stats["errors"] += 1
+            print(f"❌ Erreur lors de l'analyse du verbatim {v['review_id']} : {result['error']}")
+            log_analysis_metrics(verbatim_text=v["content"], duration=result["duration"], error=True)
+            return
+        if not result["themes"]:
+            self.stats["empty"] += 1
+            log_analysis_metrics(verbatim_text=v["content"], duration=result["duration"], error=False, empty=True,
+                                 classification_duration=result["duration"])
+            if self.checkpoint is not None:
+                self.checkpoint.mark_done([v["review_id"]], status="empty")
+            return
+        rows, unknown = build_topic_rows(v["review_id"], result["themes"], self.label_to_id, self.version)
+        self.pending.append((result, rows, unknown))
+        self.pending_rows += len(rows)
+        if self.pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush_if_stale(self, max_age: float):
+        if self.pending and time.time() - self.last_flush >= max_age:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending:
+            return
+        rows = [row for _, review_rows, _ in self.pending for row in review_rows]
+        start = time.time()
+        errors = []
+        if rows:
+            try:
+                # Nouvelle analyse de ces avis : leurs lignes précédentes sont remplacées
+                delete_previous_rows(self.client, sorted({row["review_id"] for row in rows}))
+            except Exception as e:
+                errors = [f"Suppression des lignes précédentes impossible : {e}"]
+            else:
+                errors = self.client.insert_rows_json(TOPIC_ANALYSIS_TABLE_ID, rows, row_ids=[r["id"] for r in rows])
+        insert_duration = (time.time() - start) / len(self.pending)
+        if errors:
+            print(f"Erreurs d'insertion : {errors}")
+        else:
+            print(f"{len(rows)} lignes insérées pour {len(self.pending)} avis")
+
+        inserted = [result["verbatim"]["review_id"] for result, review_rows, _ in self.pending
+                    if review_rows and not errors]
+        self.analyzed_review_ids.extend(inserted)
+        if self.checkpoint is not None:
+            self.checkpoint.mark_done(inserted)
+        for result, review_rows, unknown in self.pending:
+            log_analysis_metrics(
+                verbatim_text=result["verbatim"]["content"],
+                duration=result["duration"] + insert_duration,
+                error=False,
+                empty=False,
+                new_topics=unknown,
+                bq_error=bool(errors),
+                classification_duration=result["duration"],
+                insert_duration=insert_duration,
+            )
+        self.meter.tick(len(self.pending))
+        self.pending, self.pending_rows = [], 0
+
+
+def _stop_threads(threads: list, stop: threading.Event, result_queue: queue.Queue):
+    """Arrête le lecteur et les workers : les résultats restants sont vidés pour débloquer les _put, puis join."""
+    stop.set()
+    while any(thread.is_alive() for thread in threads):
+        try:
+            _get(result_queue, "results", timeout=0.1)
+        except queue.Empty:
+            pass
+    for thread in threads:
+        thread.join()
+
+
+def run_pipelined_analysis(scrape_date: str, classify_fn=None, workers: int = None, queue_size: int = None,
+                           batch_rows: int = None, verbatims=None, client=None, checkpoint_dir: str | None = None,
+                           scheduler: AnalysisScheduler = None) -> dict:
+    """Analyse les verbatims d'une date en pipeline et renvoie le même bilan que run_analysis.
+    verbatims (itérable) remplace la lecture BigQuery ; client remplace le client BigQuery d'écriture ;
+    checkpoint_dir comme pour run_analysis ; scheduler (par défaut, échéance et budget de l'environnement)
+    admet chaque avis avant sa classification, les autres sont reportés (voir api/scheduler.py)."""
+    from google.cloud import bigquery
+
+    scheduler = scheduler or AnalysisScheduler()
+    classify_fn = classify_fn or classify_with_claude
+    workers = max(1, workers or PIPELINE_WORKERS)
+    queue_size = queue_size or PIPELINE_QUEUE_SIZE
+    stats = {"scrape_date": scrape_date, "verbatims": 0, "analyzed": 0, "empty": 0, "errors": 0, "skipped": 0,
+             "deferred": 0}
+
+    verbatim_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    source = iter_verbatims_by_date(scrape_date) if verbatims is None else verbatims
+    # Avis reportés par une exécution précédente interrompue : lus en premier (erreurs de lecture dans _read)
+    source = resumed_first(source, load_continuation(scrape_date, "interactive"))
+    client = client or bigquery.Client(project=get_project_id())
+    checkpoint = open_checkpoint(scrape_date, "interactive", checkpoint_dir)
+    writer = BatchWriter(client, load_topic_ids(), batch_rows or INSERT_BATCH_ROWS, stats,
+                         analysis_version("interactive"), checkpoint)
+    read_failures = []
+    deferred = []
+    classify_meter = StageMeter("classify")
+    stop = threading.Event()
+
+    threads = [threading.Thread(target=_read,
+                                args=(source, verbatim_queue, workers, read_failures, checkpoint, stats, stop),
+                                name="pipeline-reader", daemon=True)]
+    threads += [threading.Thread(target=_classify,
+                                 args=(classify_fn, verbatim_queue, result_queue, classify_meter, scheduler, stop),
+                                 name=f"pipeline-classifier-{i}", daemon=True) for i in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+
+    # Écrivain dans le thread appelant : s'arrête quand tous les workers ont signalé leur fin.
+    # Si une écriture échoue, les autres threads sont arrêtés et joints avant de propager l'erreur.
+    try:
+        finished_workers = 0
+        while finished_workers < workers:
+            try:
+                result = _get(result_queue, "results", timeout=INSERT_FLUSH_SECONDS)
+            except queue.Empty:
+                writer.flush_if_stale(INSERT_FLUSH_SECONDS)
+                continue
+            if result is _END:
+                finished_workers += 1
+                continue
+            stats["verbatims"] += 1
+            if result.get("deferred"):
+                deferred.append(result["verbatim"])
+                continue
+            writer.add(result)
+            writer.flush_if_stale(INSERT_FLUSH_SECONDS)
+        writer.flush()
+    finally:
+        _stop_threads(threads, stop, result_queue)
+    stats["verbatims"] += stats["skipped"]
+
+    elapsed = time.time() - start
+    print(f"⚡ {stats['verbatims']} verbatims traités en pipeline en {elapsed:.1f} s ({workers} workers)")
+
+    # Mise à jour des agrégats quotidiens, limitée aux cellules (jour, thème) touchées par ce lot
+    try:
+        refresh_topic_aggregates(writer.analyzed_review_ids)
+    except Exception as e:
+        print(f"❌ Erreur lors de la mise à jour des agrégats : {e}")
+
+    try:
+        if deferred:
+            stats["deferred"] = len(deferred)
+            write_continuation(scrape_date, "interactive", deferred, scheduler.stop_reason)
+        elif not read_failures:  # lecture interrompue : l'enregistrement reste pour la relance
+            clear_continuation(scrape_date, "interactive")
+    except OSError as e:
+        print(f"❌ Impossible de mettre à jour l'enregistrement de continuation : {e}")
+
+    if read_failures:
+        raise read_failures[0]
+    stats["analyzed"] = len(writer.analyzed_review_ids)
+    return stats
@@ -0,0 +1,35 @@
+"""Schéma de topic_analysis : colonne source et migration qui l'ajoute.
+
+Chaque ligne topic_analysis indique son origine (colonne source) : Claude ou classifieur local distillé.
+Les lignes antérieures à la colonne (NULL) viennent toutes de Claude. Seules les lignes Claude alimentent
+les agrégats des dashboards, l'entraînement du modèle local et la pré-sélection des thèmes.
+
+La colonne est ajoutée une fois pour toutes, avant le premier déploiement qui écrit source :
+    python -m api.analysis_schema
+"""
+from google.cloud import bigquery
+
+TOPIC_ANALYSIS_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.topic_analysis"
+
+SOURCE_CLAUDE = "claude"
+SOURCE_LOCAL = "local"
+# Filtre SQL des lignes Claude (alias ta pour topic_analysis)
+CLAUDE_ROWS_FILTER = f"COALESCE(ta.source, '{SOURCE_CLAUDE}') = '{SOURCE_CLAUDE}'"
+
+
+def add_source_column(client=None) -> bool:
+    """Migration : ajoute la colonne source (STRING, NULLABLE) à topic_analysis si elle manque.
+    Renvoie True si le schéma a été modifié."""
+    client = client or bigquery.Client()
+    table = client.get_table(TOPIC_ANALYSIS_TABLE_ID)
+    if "source" in {field.name for field in table.schema}:
+        print("Colonne source déjà présente dans topic_analysis")
+        return False
+    table.schema = [*table.schema, bigquery.SchemaField("source", "STRING")]
+    client.update_table(table, ["schema"])
+    print("Colonne source ajoutée à topic_analysis")
+    return True
+
+
+if __name__ == "__main__":
+    add_source_column()
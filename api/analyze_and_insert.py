@@ -1,16 +1,24 @@
 ###pour airlow, décommente la ligne suivante :
-import os, time, uuid
+import os, time
 from dotenv import load_dotenv
 from api.bq_connect import get_verbatims_by_date
-from api.claude_interface import classify_with_claude
+from api.checkpoint import AnalysisCheckpoint, DEFAULT_CHECKPOINT_DIR, analysis_row_id
+from api.claude_interface import classify_with_claude, classify_many, prompt_version
+from api.claude_batch import classify_batch
+from api.prompt_packing import classify_packed
+from api.local_classifier import classify_local, local_model_version
+from api.scheduler import AnalysisScheduler, clear_continuation, load_continuation, write_continuation
+from api.taxonomy import get_label_to_id
+from api.analysis_schema import SOURCE_CLAUDE, SOURCE_LOCAL, TOPIC_ANALYSIS_TABLE_ID
+from api.topic_aggregates import refresh_topic_aggregates
 from google.cloud import bigquery
 from datetime import datetime
-from monitoring.metrics import log_analysis_metrics, monitor_start, push_metrics_to_gateway
+from monitoring.metrics import log_analysis_metrics, push_metrics_to_gateway
 from prometheus_client import push_to_gateway, REGISTRY
 
 
-if __name__ == "__main__" or os.getenv("AIRFLOW_RUN_METRICS") == "true":
-    monitor_start(port=8000)
+# Aucun exporteur Prometheus démarré à l'import (le DAG Airflow est parsé en boucle) :
+# process_and_insert_all le démarre au lancement du traitement
 
 # Charger .env avec conditions: Si on est dans un test, utilise toujours le .env local
 if "PYTEST_CURRENT_TEST" in os.environ:
@@ -34,25 +42,43 @@ def get_gcp_credentials_path():
     return gcp_credentials
 
 def load_topic_ids():
-    client = bigquery.Client(project=get_project_id())
+    """Index topic_label -> topic_id, issu du référentiel mis en cache (voir api/taxonomy.py)."""
+    return get_label_to_id()
 
-    query = """
-        SELECT topic_label, topic_id
-        FROM `trustpilot-satisfaction.reviews_dataset.topics`
-    """
-    results = client.query(query).result()
-    return {row.topic_label: row.topic_id for row in results}
 
+def _classifier_version(mode: str) -> str:
+    """Empreinte de ce qui produit les thèmes : modèle local enregistré, ou prompt Claude pour les autres modes."""
+    return local_model_version() if mode == "local" else prompt_version()
 
-def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id: dict):
-    client = bigquery.Client(project=get_project_id())
+
+def analysis_version(mode: str = "interactive") -> str:
+    """Version d'une analyse (mode + empreinte du prompt ou du modèle local) : entre dans les ids de lignes et le
+    nom du checkpoint ; les lignes d'un modèle local réentraîné ont donc d'autres ids."""
+    return f"{mode}:{_classifier_version(mode)}"
+
+
+def open_checkpoint(scrape_date: str, mode: str, checkpoint_dir: str | None = None):
+    """Checkpoint de l'analyse d'une date, ou None si la reprise est désactivée (répertoire vide)."""
+    directory = os.getenv("ANALYSIS_CHECKPOINT_DIR", "") if checkpoint_dir is None else checkpoint_dir
+    if not directory:
+        return None
+    return AnalysisCheckpoint.for_run(directory, scrape_date, mode, _classifier_version(mode))
+
+
+def analysis_source(mode: str = "interactive") -> str:
+    """Origine des lignes écrites par un mode d'analyse : classifieur local, ou Claude pour tous les autres."""
+    return SOURCE_LOCAL if mode == "local" else SOURCE_CLAUDE
+
+
+def build_topic_rows(review_id: str, theme_scores: list[dict], label_to_id: dict,
+                     version: str | None = None, source: str = SOURCE_CLAUDE) -> tuple[list[dict], list[str]]:
+    """Lignes topic_analysis d'un avis (thèmes connus, notes valides) et thèmes absents de la table topics.
+    L'id de chaque ligne est déterministe (avis, thème, version) : une relance réécrit les mêmes ids.
+    source distingue les prédictions du classifieur local des étiquettes Claude (voir analysis_source)."""
+    version = version or analysis_version()
     rows_to_insert = []
     unknown_topics = []
 
-    if len(theme_scores) == 0:
-        print("Aucun thème détecté")
-        return
-
     for item in theme_scores:
         theme = item["theme"]
         note = item["note"]
@@ -85,18 +111,51 @@ def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id:
             label = "Très positif"
 
         rows_to_insert.append({
-            "id": str(uuid.uuid4()),
+            "id": analysis_row_id(review_id, topic_id, version),
             "review_id": review_id,
             "topic_id": topic_id,  # Le thème détecté devient la valeur de topic_id
             "score_sentiment": note,
             "label_sentiment": label,
-            "score_0_1": score_0_1
+            "score_0_1": score_0_1,
+            "source": source,
         })
+    return rows_to_insert, unknown_topics
+
+
+def delete_previous_rows(client, review_ids: list[str]) -> int:
+    """Supprime les lignes topic_analysis déjà écrites pour ces avis, avant d'insérer celles d'une nouvelle
+    analyse (autre mode, prompt ou taxonomie modifiés) : l'analyse remplace ses lignes au lieu de s'y ajouter.
+    Échoue si des lignes de ces avis sont encore dans le tampon de streaming (insertion de moins d'une demi-heure
+    environ) : l'avis est alors compté en erreur et retenté plus tard, plutôt que dupliqué."""
+    job = client.query(
+        f"DELETE FROM `{TOPIC_ANALYSIS_TABLE_ID}` WHERE review_id IN UNNEST(@review_ids)",
+        job_config=bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("review_ids", "STRING", review_ids)]
+        ),
+    )
+    job.result()
+    return job.num_dml_affected_rows or 0
+
+
+def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id: dict, version: str | None = None,
+                          source: str = SOURCE_CLAUDE):
+    client = bigquery.Client(project=get_project_id())
+
+    if len(theme_scores) == 0:
+        print("Aucun thème détecté")
+        return
+
+    rows_to_insert, unknown_topics = build_topic_rows(review_id, theme_scores, label_to_id, version, source)
     if not rows_to_insert:
         print("⚠️ Aucun thème à insérer")
         return
+
+    delete_previous_rows(client, [review_id])
     
-    errors = client.insert_rows_json("trustpilot-satisfaction.reviews_dataset.topic_analysis", rows_to_insert)
+    # insertId = id de ligne : BigQuery écarte au mieux les doublons renvoyés dans la minute environ
+    # (relance immédiate de l'insertion) ; une nouvelle analyse de l'avis remplace ses lignes (ci-dessus)
+    errors = client.insert_rows_json(TOPIC_ANALYSIS_TABLE_ID, rows_to_insert,
+                                     row_ids=[r["id"] for r in rows_to_insert])
 
     if errors:
         print(f"Erreurs d'insertion : {errors}")
@@ -111,27 +170,120 @@ def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id:
         "new_topics": unknown_topics
     }
 
-def run_analysis(scrape_date: str):
-    verbatims = get_verbatims_by_date(scrape_date)
+def classify_verbatims_concurrently(verbatims: list[dict], concurrency: int, scheduler=None) -> list[dict | None]:
+    """Classification asynchrone de tous les verbatims (concurrence bornée), résultats dans l'ordre
+    (None pour un avis non admis par scheduler)."""
+    start = time.time()
+    outcomes = classify_many([v["content"] for v in verbatims], concurrency=concurrency,
+                             ratings=[v.get("rating") for v in verbatims], scheduler=scheduler)
+    print(f"⚡ {len(verbatims)} verbatims classifiés en {time.time() - start:.1f} s (concurrence : {concurrency})")
+    return outcomes
+
+
+ANALYSIS_MODES = ("interactive", "batch", "packed", "local")
+
+
+def run_analysis(scrape_date: str, classify_fn=None, mode: str = "interactive", checkpoint_dir: str | None = None,
+                 deadline_seconds: float | None = None, token_budget: int | None = None,
+                 fetch_verbatims=None) -> dict:
+    """Analyse les verbatims d'une date et renvoie un bilan du traitement.
+    classify_fn(verbatim, rating=...) permet de remplacer l'appel à Claude (ex : version limitée en concurrence
+    pour le backfill).
+    Sans classify_fn et avec CLAUDE_CONCURRENCY > 1, les appels à Claude sont faits en parallèle (asyncio).
+    mode="batch" soumet tous les verbatims de la date en un seul Message Batch (analyses nocturnes).
+    mode="packed" regroupe plusieurs verbatims par requête (voir api/prompt_packing.py).
+    mode="local" classe sans appel à Claude, avec le modèle distillé (voir api/local_classifier.py).
+    Avec ANALYSIS_PIPELINE=1, le mode interactive lit, classe et insère en parallèle par étapes
+    (voir api/analysis_pipeline.py).
+    checkpoint_dir (par défaut ANALYSIS_CHECKPOINT_DIR, vide = désactivé) : les avis terminés y sont
+    enregistrés au fil de l'eau, et une relance ignore ceux d'une exécution interrompue (voir api/checkpoint.py).
+    Les avis sont traités par priorité (ANALYSIS_PRIORITY) ; deadline_seconds et token_budget (par défaut
+    ANALYSIS_DEADLINE_SECONDS et ANALYSIS_TOKEN_BUDGET, 0 = sans limite) arrêtent l'analyse avant le timeout
+    ou le dépassement de budget, et les avis restants sont reportés (voir api/scheduler.py).
+    fetch_verbatims(scrape_date) remplace get_verbatims_by_date, qui renvoie [] sur erreur BigQuery (le backfill
+    utilise une lecture qui propage l'erreur, pour ne pas marquer la date comme terminée)."""
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Mode d'analyse inconnu : {mode} (attendu : {', '.join(ANALYSIS_MODES)})")
+    scheduler = AnalysisScheduler(deadline_seconds, token_budget)  # échéance comptée dès le début de l'analyse
+    if mode == "interactive" and os.getenv("ANALYSIS_PIPELINE", "0") == "1":
+        # Import local : analysis_pipeline importe ce module
+        from api.analysis_pipeline import run_pipelined_analysis
+        return run_pipelined_analysis(scrape_date, classify_fn=classify_fn, checkpoint_dir=checkpoint_dir,
+                                      scheduler=scheduler)
+    stats = {"scrape_date": scrape_date, "verbatims": 0, "analyzed": 0, "empty": 0, "errors": 0, "skipped": 0,
+             "deferred": 0}
+    verbatims = (fetch_verbatims or get_verbatims_by_date)(scrape_date)
+    stats["verbatims"] = len(verbatims)
     print(f"📊 Verbatims récupérés : {len(verbatims)}")
     for v in verbatims:
         print(f"- {v['review_id']}: {v['content'][:60]}...")
 
     if not verbatims:
         print("⚠️ Aucun verbatim trouvé pour la date, test avec un faux.")
-        return
+        return stats
+
+    checkpoint = open_checkpoint(scrape_date, mode, checkpoint_dir)
+    if checkpoint is not None:
+        pending = checkpoint.pending(verbatims)
+        stats["skipped"] = len(verbatims) - len(pending)
+        verbatims = pending
+        if not verbatims:
+            print(f"✅ Tous les verbatims du {scrape_date} ont déjà été traités")
+            return stats
 
     label_to_id = load_topic_ids()
+    version = analysis_version(mode)
 
     print(f"{len(verbatims)} verbatims trouvés pour la date : {scrape_date}")
+    analyzed_review_ids = []
+
+    # Avis reportés par une exécution précédente interrompue : traités en premier
+    scheduler.resume(load_continuation(scrape_date, mode))
+    concurrency = int(os.getenv("CLAUDE_CONCURRENCY", "1"))
+    per_review = mode == "interactive" and not (classify_fn is None and concurrency > 1)
+    deferred = []
+    if mode == "batch":
+        # Lot soumis en une fois : admission à l'avance, puis échéance vérifiée avant chaque étage d'escalade
+        verbatims, deferred = scheduler.split(verbatims)
+    else:
+        # Admission avis par avis (boucle, appels concurrents) ou paquet par paquet ; local : sans coût API
+        verbatims = scheduler.order(verbatims)
+
+    outcomes = None
+    if not verbatims:
+        print("⏸️ Aucun avis admis par l'ordonnanceur : classification sautée")
+    elif mode == "batch":
+        outcomes = classify_batch(verbatims, scheduler=scheduler)
+    elif mode == "packed":
+        outcomes = classify_packed(verbatims, scheduler=scheduler)
+    elif mode == "local":
+        outcomes = classify_local(verbatims)
+    elif classify_fn is None and concurrency > 1:
+        outcomes = classify_verbatims_concurrently(verbatims, concurrency, scheduler)
+    classify_fn = classify_fn or classify_with_claude
 
     for i, v in enumerate(verbatims):
+        if per_review and not scheduler.admit(v):
+            deferred = verbatims[i:]
+            break
+        if outcomes is not None and outcomes[i] is None:  # non admis par l'ordonnanceur
+            deferred.append(v)
+            continue
         print(f"\n🟦 Verbatim {i+1} :\n{v['content']}")
         
         start = time.time()  # début de chrono
+        claude_duration = 0.0  # durée de l'appel Claude déjà effectué en parallèle
 
         try:
-            theme_scores = classify_with_claude(v["content"])
+            if outcomes is not None:
+                claude_duration = outcomes[i]["duration"]
+                if outcomes[i]["error"]:
+                    raise outcomes[i]["error"]
+                theme_scores = outcomes[i]["themes"]
+            else:
+                theme_scores = classify_fn(v["content"], rating=v.get("rating"))
+                claude_duration = time.time() - start
+            classified_at = time.time()
 
             # # Afficher la réponse brute de Claude pour debug
             # print("\n Réponse brute de Claude :")
@@ -141,39 +293,75 @@ def run_analysis(scrape_date: str):
                 result = insert_topic_analysis(
                     review_id=v["review_id"],
                     theme_scores=theme_scores,
-                    label_to_id=label_to_id
+                    label_to_id=label_to_id,
+                    version=version,
+                    source=analysis_source(mode),
                 )
+                insert_duration = time.time() - classified_at
+                if result and not result["insert_errors"]:
+                    analyzed_review_ids.append(v["review_id"])
+                    if checkpoint is not None:
+                        checkpoint.mark_done([v["review_id"]])
                 # Enregistrement des métriques Prometheus
                 log_analysis_metrics(
                     verbatim_text=v["content"],
-                    duration=time.time() - start,
+                    duration=claude_duration + insert_duration,
                     error=False,
                     empty=False,
                     new_topics=result["new_topics"],
-                    bq_error=result["insert_errors"]
+                    bq_error=result["insert_errors"],
+                    classification_duration=claude_duration,
+                    insert_duration=insert_duration
                 )
 
             else:
+                stats["empty"] += 1
                 print("❌ Analyse non exploitable (voir claude_errors.log)")
+                if checkpoint is not None:
+                    checkpoint.mark_done([v["review_id"]], status="empty")
                 log_analysis_metrics(
                     verbatim_text=v["content"],
-                    duration=time.time() - start,
+                    duration=claude_duration,
                     error=False,
-                    empty=True  # Claude n’a rien renvoyé
+                    empty=True,  # Claude n’a rien renvoyé
+                    classification_duration=claude_duration
                 )
 
 
         except Exception as e:
+            stats["errors"] += 1
             print(f"❌ Erreur lors de l'analyse du verbatim {v['review_id']} : {e}")
             log_analysis_metrics(
                 verbatim_text=v["content"],
-                duration=time.time() - start,
+                duration=claude_duration + time.time() - start,
                 error=True
             )
+        if per_review:
+            scheduler.record(time.time() - start)
+
+    try:
+        if deferred:
+            stats["deferred"] = len(deferred)
+            write_continuation(scrape_date, mode, deferred, scheduler.stop_reason)
+        else:
+            clear_continuation(scrape_date, mode)
+    except OSError as e:
+        print(f"❌ Impossible de mettre à jour l'enregistrement de continuation : {e}")
+
+    # Mise à jour des agrégats quotidiens, limitée aux cellules (jour, thème) touchées par ce lot
+    try:
+        refresh_topic_aggregates(analyzed_review_ids)
+    except Exception as e:
+        print(f"❌ Erreur lors de la mise à jour des agrégats : {e}")
+
+    stats["analyzed"] = len(analyzed_review_ids)
+    return stats
 
 
-def process_and_insert_all(scrape_date: str = None):
-    """Fonction appelée dans le DAG Airflow."""
+def process_and_insert_all(scrape_date: str = None, mode: str = None):
+    """Fonction appelée dans le DAG Airflow.
+    mode : "interactive" (appel par verbatim), "batch" (Message Batches), "packed" (plusieurs avis par appel)
+    ou "local" (classifieur distillé, sans appel API), par défaut ANALYSIS_MODE."""
     from monitoring.metrics import monitor_start , push_metrics_to_gateway
     monitor_start()
 
@@ -182,9 +370,12 @@ def process_and_insert_all(scrape_date: str = None):
     
     if not scrape_date:
         scrape_date = datetime.utcnow().date().isoformat()
-    print(f"Lancement du traitement pour la date : {scrape_date}")
+    mode = mode or os.getenv("ANALYSIS_MODE", "interactive")
+    print(f"Lancement du traitement pour la date : {scrape_date} (mode : {mode})")
 
-    run_analysis(scrape_date=scrape_date)
+    # Reprise activée par défaut pour les exécutions du DAG (ANALYSIS_CHECKPOINT_DIR= pour la désactiver)
+    run_analysis(scrape_date=scrape_date, mode=mode,
+                 checkpoint_dir=os.getenv("ANALYSIS_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR))
     print(f"✅ Traitement terminé pour {scrape_date}")
 
     # Pousser les métriques vers le PushGateway
@@ -0,0 +1,152 @@
+"""Backfill : relance l'analyse (récupération → Claude → insertion) sur une plage de dates.
+
+Les dates sont traitées en parallèle, avec un plafond global d'appels simultanés à Claude.
+L'avancement est enregistré date par date dans un fichier JSON : une relance reprend là où le
+précédent backfill s'est arrêté. Seules les dates terminées sans erreur ni avis reporté sont
+ignorées ; les dates partielles sont relancées, et le checkpoint par avis de run_analysis évite
+alors de reclassifier les avis déjà insérés.
+
+Usage : python -m api.backfill 2025-01-01 2025-03-31 --workers 8 --claude-concurrency 4
+"""
+import argparse, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from api.analyze_and_insert import run_analysis, get_gcp_credentials_path
+from api.bq_connect import iter_verbatims_by_date
+from api.checkpoint import DEFAULT_CHECKPOINT_DIR
+from api.claude_interface import classify_with_claude
+from monitoring.metrics import push_metrics_to_gateway
+
+
+def date_range(start: str, end: str) -> list[str]:
+    """Liste des dates (AAAA-MM-JJ) de start à end inclus."""
+    start_date, end_date = date.fromisoformat(start), date.fromisoformat(end)
+    if start_date > end_date:
+        raise ValueError(f"Période invalide : {start} > {end}")
+    return [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+
+
+def limit_concurrency(classify_fn, max_concurrent: int):
+    """Enveloppe classify_fn pour qu'au plus max_concurrent appels tournent en même temps, toutes dates confondues."""
+    slots = threading.BoundedSemaphore(max_concurrent)
+
+    def limited(verbatim: str, **kwargs):
+        with slots:
+            return classify_fn(verbatim, **kwargs)
+
+    return limited
+
+
+class BackfillProgress:
+    """Suivi d'avancement par date, persisté dans un fichier JSON après chaque changement d'état."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.dates = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.dates = json.load(f).get("dates", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Fichier d'avancement illisible ({path}), reprise de zéro : {e}")
+
+    def is_done(self, scrape_date: str) -> bool:
+        return self.dates.get(scrape_date, {}).get("status") == "done"
+
+    def update(self, day: str, **fields):
+        with self._lock:
+            self.dates.setdefault(day, {}).update(fields)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"dates": self.dates}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def fetch_verbatims(scrape_date: str) -> list[dict]:
+    """Verbatims d'une date ; une erreur BigQuery est propagée (la date passe en échec et sera relancée)
+    au lieu de donner une date vide, marquée comme terminée."""
+    return list(iter_verbatims_by_date(scrape_date))
+
+
+def _process_date(scrape_date: str, classify_fn, progress: BackfillProgress, checkpoint_dir: str) -> dict:
+    progress.update(scrape_date, status="running", started_at=time.time())
+    start = time.time()
+    try:
+        stats = run_analysis(scrape_date, classify_fn=classify_fn, checkpoint_dir=checkpoint_dir,
+                             fetch_verbatims=fetch_verbatims)
+    except Exception as e:
+        progress.update(scrape_date, status="failed", error=str(e), duration=round(time.time() - start, 2))
+        raise
+    stats["duration"] = round(time.time() - start, 2)
+    # Avis en erreur (ex : 429 au-delà des relances) ou reportés : la date sera relancée
+    status = "partial" if stats.get("errors") or stats.get("deferred") else "done"
+    progress.update(scrape_date, status=status, **stats)
+    return stats
+
+
+def backfill(start: str, end: str, max_workers: int = 4, claude_concurrency: int = 4,
+             progress_path: str | None = None, checkpoint_dir: str | None = None) -> dict:
+    """Analyse toutes les dates de [start, end] et renvoie le bilan global (dont le débit).
+    checkpoint_dir : reprise par avis (par défaut ANALYSIS_CHECKPOINT_DIR, voir api/checkpoint.py)."""
+    get_gcp_credentials_path()
+    if checkpoint_dir is None:
+        checkpoint_dir = os.getenv("ANALYSIS_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+
+    progress_path = progress_path or f"backfill_{start}_{end}.json"
+    progress = BackfillProgress(progress_path)
+    all_dates = date_range(start, end)
+    todo = [d for d in all_dates if not progress.is_done(d)]
+    print(f"Backfill du {start} au {end} : {len(todo)} dates à traiter "
+          f"({len(all_dates) - len(todo)} déjà terminées, suivi dans {progress_path})")
+
+    classify_fn = limit_concurrency(classify_with_claude, claude_concurrency)
+    totals = {"dates_done": 0, "dates_partial": 0, "dates_failed": 0, "verbatims": 0, "analyzed": 0, "empty": 0,
+              "errors": 0}
+    started = time.time()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(_process_date, d, classify_fn, progress, checkpoint_dir): d for d in todo}
+        for future in as_completed(futures):
+            scrape_date = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                totals["dates_failed"] += 1
+                print(f"❌ Échec du backfill pour {scrape_date} : {e}")
+                continue
+            totals["dates_done"] += 1
+            if stats.get("errors") or stats.get("deferred"):
+                totals["dates_partial"] += 1
+            for key in ("verbatims", "analyzed", "empty", "errors"):
+                totals[key] += stats[key]
+            print(f"✅ {scrape_date} : {stats['analyzed']}/{stats['verbatims']} verbatims analysés "
+                  f"en {stats['duration']} s ({totals['dates_done']}/{len(todo)} dates)")
+
+    elapsed = time.time() - started
+    totals["duration"] = round(elapsed, 2)
+    totals["verbatims_per_second"] = round(totals["verbatims"] / elapsed, 2) if elapsed > 0 else 0.0
+    print(f"Backfill terminé : {totals['dates_done']} dates traitées ({totals['dates_partial']} partielles, "
+          f"à relancer), {totals['dates_failed']} en échec, "
+          f"{totals['verbatims']} verbatims en {totals['duration']} s "
+          f"({totals['verbatims_per_second']} verbatims/s)")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de l'analyse Claude sur une plage de dates")
+    parser.add_argument("start", help="Première date (AAAA-MM-JJ)")
+    parser.add_argument("end", help="Dernière date incluse (AAAA-MM-JJ)")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre de dates traitées en parallèle")
+    parser.add_argument("--claude-concurrency", type=int, default=4, help="Appels simultanés maximum à Claude")
+    parser.add_argument("--progress-file", default=None, help="Fichier JSON de suivi (reprise)")
+    args = parser.parse_args()
+
+    backfill(args.start, args.end, max_workers=args.workers,
+             claude_concurrency=args.claude_concurrency, progress_path=args.progress_file)
+    push_metrics_to_gateway(job_name="verbatim_backfill")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,17 @@ def get_verbatims_by_date(scrape_date: str) -> list[dict]:
     try:
         client = bigquery.Client()
         query = f"""
-            SELECT review_id, content
+            SELECT review_id, content, rating
             FROM `trustpilot-satisfaction.reviews_dataset.reviews`
             WHERE content IS NOT NULL
               AND scrape_date = DATE('{scrape_date}')
             
         """
         query_job = client.query(query)
-        return [{"review_id": row["review_id"], "content": row["content"]} for row in query_job.result()]
+        return [
+            {"review_id": row["review_id"], "content": row["content"], "rating": row["rating"]}
+            for row in query_job.result()
+        ]
 
     except DefaultCredentialsError:
         print(" Erreur : impossible de se connecter à BigQuery. Vérifie ton authentification avec `gcloud auth application-default login`.")
@@ -25,3 +28,36 @@ def get_verbatims_by_date(scrape_date: str) -> list[dict]:
         print(f" Erreur lors de la requête BigQuery : {e}")
         return []
 
+
+def iter_verbatims_by_date(scrape_date: str, page_size: int = 500):
+    """Comme get_verbatims_by_date, mais les lignes sont lues page par page au fil de la consommation
+    (pipeline par étapes) ; les erreurs BigQuery sont propagées."""
+    client = bigquery.Client()
+    query = """
+        SELECT review_id, content, rating
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews`
+        WHERE content IS NOT NULL
+          AND scrape_date = @scrape_date
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("scrape_date", "DATE", scrape_date),
+    ])
+    for row in client.query(query, job_config=job_config).result(page_size=page_size):
+        yield {"review_id": row["review_id"], "content": row["content"], "rating": row["rating"]}
+
+
+def get_verbatims_by_ids(review_ids: list[str]) -> list[dict]:
+    """Verbatims d'une liste d'avis, dans l'ordre de la liste ; les erreurs BigQuery sont propagées."""
+    client = bigquery.Client()
+    query = """
+        SELECT review_id, content, rating
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews`
+        WHERE content IS NOT NULL
+          AND review_id IN UNNEST(@review_ids)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("review_ids", "STRING", review_ids),
+    ])
+    rows = {row["review_id"]: row for row in client.query(query, job_config=job_config).result()}
+    return [{"review_id": r, "content": rows[r]["content"], "rating": rows[r]["rating"]}
+            for r in review_ids if r in rows]
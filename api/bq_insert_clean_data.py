@@ -1,10 +1,21 @@
 
-import pandas as pd
+import gzip, os, shutil, tempfile
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import bigquery
-import os
 
+DEFAULT_CLEAN_PATH = "/opt/airflow/project/data/avis_boutique_clean.csv"
+MAX_PARALLEL_LOADS = int(os.getenv("BQ_MAX_PARALLEL_LOADS", "4"))
+CHUNK_SIZE = 1024 * 1024
 
-from google.cloud import bigquery
+# Schéma explicite de la table reviews (évite l'autodetect à chaque chargement)
+REVIEWS_SCHEMA = [
+    bigquery.SchemaField("review_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("rating", "INTEGER"),
+    bigquery.SchemaField("content", "STRING"),
+    bigquery.SchemaField("author", "STRING"),
+    bigquery.SchemaField("publication_date", "DATE"),
+    bigquery.SchemaField("scrape_date", "DATE"),
+]
 
 def deduplicate_reviews():
     client = bigquery.Client()
@@ -51,42 +62,84 @@ def deduplicate_reviews():
     print(f" {nb_to_delete} doublons supprimés dans la table reviews")
 
 
-def insert_clean_reviews_to_bq():
-    path = "/opt/airflow/project/data/avis_boutique_clean.csv"
-    MAIN_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.reviews"
-    TEMP_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.temp_reviews" # Assurez-vous que cette table existe
+def _gzip_to_tempfile(path: str):
+    """Compresse le CSV en gzip en un seul passage, par blocs, sans le charger en mémoire."""
+    compressed = tempfile.TemporaryFile()
+    with open(path, "rb") as source_file, gzip.GzipFile(fileobj=compressed, mode="wb") as gz:
+        shutil.copyfileobj(source_file, gz, CHUNK_SIZE)
+    compressed.seek(0)
+    return compressed
 
-    if not os.path.exists(path):
-        print(f"Le fichier {path} n'existe pas.")
-        return
 
-    df = pd.read_csv(path)
+def load_staged_file(client, path: str, table_id: str) -> int:
+    """Charge un fichier CSV (compressé à la volée) dans table_id et renvoie le nombre de lignes chargées."""
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        source_format=bigquery.SourceFormat.CSV,
+        skip_leading_rows=1,
+        schema=REVIEWS_SCHEMA,
+        allow_quoted_newlines=True,
+    )
+    with _gzip_to_tempfile(path) as compressed:
+        job = client.load_table_from_file(compressed, table_id, job_config=job_config)
+        job.result()
+    return job.output_rows or 0
 
-    if df.empty:
-        print("Le fichier nettoyé est vide. Rien à insérer dans BigQuery.")
+
+def load_staged_files(client, paths: list[str], table_id: str) -> int:
+    """Vide la table temporaire puis y charge tous les fichiers en parallèle.
+    Renvoie le nombre total de lignes chargées (compté par BigQuery, sans relire les fichiers)."""
+    client.delete_table(table_id, not_found_ok=True)
+    client.create_table(bigquery.Table(table_id, schema=REVIEWS_SCHEMA))
+
+    max_workers = max(1, min(len(paths), MAX_PARALLEL_LOADS))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        loaded = list(executor.map(lambda p: load_staged_file(client, p, table_id), paths))
+
+    for path, rows in zip(paths, loaded):
+        print(f"{rows} lignes chargées depuis {path}")
+    return sum(loaded)
+
+
+def insert_clean_reviews_to_bq(paths: str | list[str] | None = None):
+    """Insère un ou plusieurs CSV nettoyés (ex : un fichier par enseigne ou par jour) dans la table reviews."""
+    MAIN_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.reviews"
+    TEMP_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.temp_reviews"
+
+    if paths is None:
+        paths = [DEFAULT_CLEAN_PATH]
+    elif isinstance(paths, str):
+        paths = [paths]
+
+    staged = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Le fichier {path} n'existe pas.")
+        elif os.path.getsize(path) == 0:
+            print(f"Le fichier {path} est vide, il est ignoré.")
+        else:
+            staged.append(path)
+
+    if not staged:
+        print("Aucun fichier nettoyé à insérer dans BigQuery.")
         return
 
     client = bigquery.Client()
 
     # --- Étape 1: Charger les nouvelles données dans la table temporaire (temp_reviews) ---
-    job_config_temp = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE, # Vider la table temporaire avant chaque chargement
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,
-        autodetect=True,
-    )
-
-    print(f"Chargement de {df.shape[0]} lignes dans la table temporaire {TEMP_TABLE_ID}...")
-    with open(path, "rb") as source_file:
-        job_temp = client.load_table_from_file(source_file, TEMP_TABLE_ID, job_config=job_config_temp)
-
+    # Schéma explicite (pas d'autodetect) et fichiers compressés en gzip, chargés en parallèle
+    print(f"Chargement de {len(staged)} fichier(s) dans la table temporaire {TEMP_TABLE_ID}...")
     try:
-        job_temp.result() # Attendre la fin du chargement dans la table temporaire
-        print(f"{job_temp.output_rows} lignes chargées dans {TEMP_TABLE_ID}.")
+        total_rows = load_staged_files(client, staged, TEMP_TABLE_ID)
+        print(f"{total_rows} lignes chargées dans {TEMP_TABLE_ID}.")
     except Exception as e:
         print(f"***Erreur lors du chargement dans la table temporaire {TEMP_TABLE_ID} : {e}")
         return
 
+    if total_rows == 0:
+        print("Le fichier nettoyé est vide. Rien à insérer dans BigQuery.")
+        return
+
     # --- Étape 2: Exécuter l'opération MERGE pour insérer/mettre à jour dans la table principale ---
     merge_query = f"""
         MERGE INTO `{MAIN_TABLE_ID}` AS T
@@ -113,15 +166,11 @@ def insert_clean_reviews_to_bq():
 
     try:
         query_job.result() # Attendre la fin de l'opération MERGE
-        print(f"Opération MERGE terminée pour {MAIN_TABLE_ID}.")
-        # Vous pouvez ajouter ici une requête pour compter les lignes insérées/mises à jour si nécessaire
+        print(f"Opération MERGE terminée pour {MAIN_TABLE_ID} : {query_job.num_dml_affected_rows} nouvelles lignes.")
     except Exception as e:
         print(f"***Erreur lors de l'opération MERGE vers {MAIN_TABLE_ID} : {e}")
         return
 
-    # --- Étape 3: Nettoyage (optionnel, car WRITE_TRUNCATE gère déjà le nettoyage avant chargement) ---
-    # Si vous voulez vider explicitement la table temporaire après le MERGE, vous pouvez ajouter:
-    # client.query(f"TRUNCATE TABLE `{TEMP_TABLE_ID}`").result()
-    # print(f"Table temporaire {TEMP_TABLE_ID} vidée.")
+    # Pas de nettoyage de la table temporaire : elle est supprimée et recréée avant chaque chargement (étape 1)
 
     print(f"Processus d'insertion dédupliquée terminé pour {MAIN_TABLE_ID}.")
@@ -0,0 +1,74 @@
+"""Reprise d'une analyse interrompue et identifiants déterministes des lignes topic_analysis.
+
+Chaque ligne topic_analysis reçoit un id uuid5(avis, thème, version de l'analyse) : une relance
+produit les mêmes ids, transmis à BigQuery comme insertId. Cette déduplication du streaming est
+best-effort et ne couvre qu'environ une minute : elle absorbe les relances immédiates d'une
+insertion, pas la relance d'une exécution. Ce rôle revient au checkpoint ci-dessous, qui doit donc
+survivre au redémarrage de la machine (répertoire persistant, pas /tmp). Une nouvelle analyse d'un
+avis (autre mode, prompt ou taxonomie modifiés : autre checkpoint) supprime ses lignes précédentes
+avant d'insérer les siennes (voir analyze_and_insert.delete_previous_rows).
+
+Les avis terminés (lignes insérées, ou aucun thème exploitable) sont ajoutés au fil de l'eau dans un
+fichier JSONL par date, mode et version du prompt. Après un arrêt brutal, la relance ne reclassifie
+que les avis absents du fichier. Les avis en erreur n'y figurent pas : ils sont retentés.
+"""
+import json, os, threading, uuid
+
+# Espace de noms fixe des ids de lignes : ne pas modifier (les ids déjà insérés en dépendent)
+ANALYSIS_ROW_NAMESPACE = uuid.UUID("8f1d6c1e-3b0a-5d8e-9a57-2c4b7e0f6a13")
+# data/checkpoints du projet : volume monté dans les conteneurs Airflow (voir docker-compose.yaml)
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "checkpoints")
+
+
+def analysis_row_id(review_id: str, topic_id, version: str) -> str:
+    """Id stable d'une ligne topic_analysis : identique d'une exécution à l'autre à version égale."""
+    return str(uuid.uuid5(ANALYSIS_ROW_NAMESPACE, f"{review_id}|{topic_id}|{version}"))
+
+
+class AnalysisCheckpoint:
+    """Avis terminés d'une analyse, persistés ligne par ligne (ajout seul, fsync à chaque écriture)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # dernière ligne tronquée par un arrêt en cours d'écriture
+                    self.done[entry["review_id"]] = entry["status"]
+        except FileNotFoundError:
+            pass
+        if self.done:
+            print(f"🔁 Reprise : {len(self.done)} avis déjà traités d'après {path}")
+
+    @classmethod
+    def for_run(cls, directory: str, scrape_date: str, mode: str, version: str) -> "AnalysisCheckpoint":
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{scrape_date}_{mode}_{version[:12]}.jsonl"))
+
+    def is_done(self, review_id: str) -> bool:
+        return review_id in self.done
+
+    def pending(self, verbatims: list[dict]) -> list[dict]:
+        """Verbatims restant à traiter."""
+        return [v for v in verbatims if v["review_id"] not in self.done]
+
+    def mark_done(self, review_ids: list[str], status: str = "inserted"):
+        """status : "inserted" (lignes écrites dans BigQuery) ou "empty" (aucun thème exploitable)."""
+        if not review_ids:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for review_id in review_ids:
+                    f.write(json.dumps({"review_id": review_id, "status": status}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            for review_id in review_ids:
+                self.done[review_id] = status
+
+    def __len__(self):
+        return len(self.done)
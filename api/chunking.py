@@ -0,0 +1,61 @@
+"""Découpage des avis trop longs avant l'envoi à Claude.
+
+Au-delà de MAX_VERBATIM_TOKENS (estimation), l'avis est découpé en morceaux aux frontières de
+phrases ; chaque morceau est classifié séparément, puis les notes par thème sont fusionnées
+(moyenne des morceaux qui mentionnent le thème). La taille des requêtes reste ainsi bornée.
+"""
+import os, re
+from api.prompt_utils import estimate_tokens
+
+MAX_VERBATIM_TOKENS = int(os.getenv("CLAUDE_MAX_VERBATIM_TOKENS", "600"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> list[str]:
+    """Phrase plus longue que la limite : découpage sur les espaces."""
+    pieces, current = [], []
+    for word in sentence.split():
+        if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_verbatim(verbatim: str, max_tokens: int = None) -> list[str]:
+    """Renvoie [verbatim] s'il tient dans la limite, sinon des morceaux de phrases consécutives."""
+    max_tokens = max_tokens or MAX_VERBATIM_TOKENS
+    if estimate_tokens(verbatim) <= max_tokens:
+        return [verbatim]
+
+    sentences = []
+    for sentence in _SENTENCE_END.split(verbatim.strip()):
+        if estimate_tokens(sentence) > max_tokens:
+            sentences.extend(_split_long_sentence(sentence, max_tokens))
+        elif sentence:
+            sentences.append(sentence)
+
+    chunks, current = [], ""
+    for sentence in sentences:
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_chunk_themes(results: list[list[dict] | None]) -> list[dict] | None:
+    """Fusionne les thèmes des morceaux : un thème par label, note moyenne des morceaux qui le citent."""
+    notes = {}
+    for themes in results:
+        for item in themes or []:
+            notes.setdefault(item["theme"], []).append(item["note"])
+
+    merged = [{"theme": theme, "note": round(sum(n) / len(n), 1)} for theme, n in notes.items()]
+    return merged if merged else None
@@ -0,0 +1,208 @@
+"""Mode batch : classification de tous les verbatims d'une date via l'API Message Batches.
+
+Pour les analyses nocturnes/hebdomadaires (sans contrainte de latence) : une seule soumission
+pour toute la date, un polling jusqu'à la fin du traitement, puis les résultats sont lus en flux.
+Les requêtes suivent le même chemin que le mode interactif : découpage des avis longs, thèmes
+pré-sélectionnés, cache des réponses (consulté avant la soumission, alimenté par les réponses
+valides) et cascade de modèles (chaque étage est un nouveau lot, limité aux avis à escalader).
+Les tokens et le coût (tarif batch) de chaque résultat sont enregistrés comme pour un appel unitaire.
+"""
+import os, re, time
+from api import claude_interface
+from api.claude_interface import (
+    _build_classification_request, _lookup_cache, _record_escalation, escalation_reason, logger,
+    parse_response_checked,
+)
+from api.chunking import merge_chunk_themes, split_verbatim
+from api.response_cache import MISS
+from monitoring.metrics import BATCH_PRICE_FACTOR, CLAUDE_TIER_CALLS, VERBATIMS_CHUNKED, record_claude_usage
+
+BATCH_POLL_SECONDS = float(os.getenv("CLAUDE_BATCH_POLL_SECONDS", "30"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("CLAUDE_BATCH_TIMEOUT_SECONDS", str(24 * 3600)))
+# Taille maximale d'un lot côté API
+MAX_BATCH_REQUESTS = 100_000
+
+_CUSTOM_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+
+def make_custom_id(index: int, review_id: str) -> str:
+    """custom_id accepté par l'API (64 caractères alphanumériques max), unique dans le lot."""
+    return review_id if _CUSTOM_ID_PATTERN.match(str(review_id)) else f"verbatim-{index}"
+
+
+def submit_batch(verbatims: list[dict], client=None, model: str | None = None) -> tuple[str, dict]:
+    """Soumet un lot (un prompt par verbatim, pour model ou le premier modèle de la cascade).
+    Renvoie (batch_id, custom_id -> index du verbatim)."""
+    client = client or claude_interface.get_client()
+    model = model or claude_interface.CLAUDE_MODEL_CASCADE[0]
+    if len(verbatims) > MAX_BATCH_REQUESTS:
+        raise ValueError(f"Trop de verbatims pour un seul lot : {len(verbatims)} > {MAX_BATCH_REQUESTS}")
+
+    index_by_id = {}
+    requests = []
+    for i, v in enumerate(verbatims):
+        custom_id = make_custom_id(i, v["review_id"])
+        if custom_id in index_by_id:
+            custom_id = f"verbatim-{i}"
+        index_by_id[custom_id] = i
+        requests.append({"custom_id": custom_id, "params": _build_classification_request(v["content"], model)})
+
+    batch = client.messages.batches.create(requests=requests)
+    print(f"📦 Lot {batch.id} soumis : {len(requests)} verbatims")
+    return batch.id, index_by_id
+
+
+def wait_for_batch(batch_id: str, client=None, poll_seconds: float = None, timeout: float = None):
+    """Attend la fin du traitement du lot (processing_status == 'ended')."""
+    client = client or claude_interface.get_client()
+    poll_seconds = BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+    timeout = BATCH_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.time() + timeout
+
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            counts = batch.request_counts
+            print(f"📦 Lot {batch_id} terminé : {counts.succeeded} réussis, {counts.errored} en erreur, "
+                  f"{counts.expired} expirés, {counts.canceled} annulés")
+            return batch
+        if time.time() >= deadline:
+            raise TimeoutError(f"Le lot {batch_id} n'est pas terminé après {timeout} s")
+        time.sleep(poll_seconds)
+
+
+def iter_batch_results(batch_id: str, client=None, model: str | None = None):
+    """Lit les résultats en flux (JSONL) et renvoie (custom_id, {themes, valid, error}) au fil de l'eau.
+    valid : réponse conforme (même sans thème), seule à pouvoir être mise en cache."""
+    client = client or claude_interface.get_client()
+    model = model or claude_interface.CLAUDE_MODEL_CASCADE[0]
+    for entry in client.messages.batches.results(batch_id):
+        result = entry.result
+        if result.type != "succeeded":
+            error = getattr(result, "error", None)
+            logger.error(f"Requête {entry.custom_id} du lot {batch_id} : {result.type} {error or ''}")
+            yield entry.custom_id, {"themes": None, "valid": False,
+                                    "error": RuntimeError(f"Résultat batch : {result.type}")}
+            continue
+        record_claude_usage(model, result.message, price_factor=BATCH_PRICE_FACTOR)
+        try:
+            themes, valid = parse_response_checked(result.message)
+            yield entry.custom_id, {"themes": themes, "valid": valid, "error": None}
+        except Exception as e:
+            yield entry.custom_id, {"themes": None, "valid": False, "error": e}
+
+
+def _run_tier(units: list[dict], model: str, client, poll_seconds: float, timeout: float) -> dict:
+    """Un étage de la cascade pour tous les morceaux en attente : un lot, puis ses résultats par index.
+    Si le lot n'est pas terminé à temps, il est annulé (plus rien n'est facturé) et TimeoutError est levée."""
+    client = client or claude_interface.get_client()
+    batch_id, index_by_id = submit_batch(units, client=client, model=model)
+    try:
+        wait_for_batch(batch_id, client=client, poll_seconds=poll_seconds, timeout=timeout)
+    except TimeoutError:
+        client.messages.batches.cancel(batch_id)
+        print(f"🛑 Lot {batch_id} annulé : non terminé dans le temps imparti")
+        raise
+    CLAUDE_TIER_CALLS.labels(model=model).inc(len(units))
+
+    results = {}
+    for custom_id, outcome in iter_batch_results(batch_id, client=client, model=model):
+        index = index_by_id.get(custom_id)
+        if index is None:
+            logger.warning(f"custom_id inconnu dans les résultats du lot {batch_id} : {custom_id}")
+            continue
+        results[index] = outcome
+    return results
+
+
+def classify_batch(verbatims: list[dict], client=None, poll_seconds: float = None, timeout: float = None,
+                   scheduler=None) -> list[dict]:
+    """Classifie tous les verbatims en lot(s) : un par étage de la cascade, limité aux avis à escalader.
+    Renvoie, dans l'ordre d'entrée, un dict {themes, error, duration} par verbatim (même format que classify_many).
+    scheduler (optionnel, voir api/scheduler.py) : l'attente de chaque lot est limitée au temps restant avant
+    l'échéance. Un lot non terminé à temps est annulé : au premier étage, ses avis sont reportés (None dans le
+    résultat) ; aux étages d'escalade, les réponses de l'étage précédent sont conservées, comme pour un étage
+    qui n'est pas soumis faute de temps."""
+    start = time.time()
+    if not verbatims:
+        return []
+
+    # Unités soumises : un avis, ou un morceau d'avis long (sans note, comme en mode interactif)
+    units = []
+    for i, v in enumerate(verbatims):
+        chunks = split_verbatim(v["content"])
+        if len(chunks) > 1:
+            VERBATIMS_CHUNKED.inc()
+        for j, chunk in enumerate(chunks):
+            review_id = v["review_id"] if len(chunks) == 1 else f"{v['review_id']}_{j}"
+            units.append({"verbatim": i, "review_id": review_id, "content": chunk,
+                          "rating": v.get("rating") if len(chunks) == 1 else None,
+                          "themes": None, "error": RuntimeError("Aucun résultat renvoyé par le lot")})
+
+    pending = []
+    for unit in units:
+        unit["cache"], unit["key"], cached = _lookup_cache(unit["content"], unit["rating"])
+        if cached is MISS:
+            pending.append(unit)
+        else:
+            unit["themes"], unit["error"] = cached, None
+
+    models = claude_interface.CLAUDE_MODEL_CASCADE
+    for tier, model in enumerate(models):
+        if not pending:
+            break
+        if tier > 0 and scheduler is not None and not scheduler.has_time():
+            break  # réponses de l'étage précédent conservées
+        last_tier = tier == len(models) - 1
+        tier_timeout = BATCH_TIMEOUT_SECONDS if timeout is None else timeout
+        remaining = scheduler.remaining_seconds() if scheduler is not None else None
+        if remaining is not None:
+            tier_timeout = min(tier_timeout, remaining)
+        try:
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("Échéance atteinte avant la soumission du lot")
+            results = _run_tier(pending, model, client, poll_seconds, tier_timeout)
+        except TimeoutError:
+            if remaining is None:
+                raise
+            scheduler.stop("deadline")
+            if tier == 0:
+                for unit in pending:
+                    unit["deferred"] = True
+            break
+        escalated = []
+        for index, unit in enumerate(pending):
+            outcome = results.get(index)
+            if outcome is None:
+                continue
+            # Réponse provisoire tant qu'un étage suivant ne l'a pas remplacée
+            unit["themes"], unit["error"] = outcome["themes"], outcome["error"]
+            if outcome["error"] is not None:
+                if isinstance(outcome["error"], ValueError) and not last_tier:  # JSON invalide
+                    _record_escalation(models, tier, "invalid_response")
+                    escalated.append(unit)
+                continue
+            reason = escalation_reason(outcome["themes"], unit["rating"])
+            if reason is not None and not last_tier:
+                _record_escalation(models, tier, reason)
+                escalated.append(unit)
+                continue
+            if unit["cache"] is not None and outcome["valid"]:
+                unit["cache"].put(unit["key"], outcome["themes"])
+        pending = escalated
+
+    # Durée amortie par verbatim (le lot est traité d'un bloc côté API)
+    per_verbatim = (time.time() - start) / len(verbatims)
+    outcomes = []
+    for i in range(len(verbatims)):
+        parts = [u for u in units if u["verbatim"] == i]
+        if any(u.get("deferred") for u in parts):
+            outcomes.append(None)  # lot annulé à l'échéance : avis reporté
+            continue
+        succeeded = [u for u in parts if u["error"] is None]
+        if not succeeded:
+            outcomes.append({"themes": None, "error": parts[0]["error"], "duration": per_verbatim})
+            continue
+        themes = succeeded[0]["themes"] if len(parts) == 1 else merge_chunk_themes([u["themes"] for u in succeeded])
+        outcomes.append({"themes": themes, "error": None, "duration": per_verbatim})
+    return outcomes
@@ -1,25 +1,75 @@
-import anthropic, os, json, logging, sys
+import asyncio, hashlib, os, json, logging, sys, threading, time
 from dotenv import load_dotenv
 from pathlib import Path
-from .prompt_utils import build_prompt, THEMES
+from typing import TYPE_CHECKING
+from .prompt_utils import build_static_instructions, build_verbatim_prompt, estimate_tokens
+from .rate_limiter import async_call_with_retries, call_with_retries
+from .chunking import merge_chunk_themes, split_verbatim
+from .claude_logging import configure_async_logging, should_log_raw_body
+from .streaming import stream_json_text, stream_json_text_async
+from .response_cache import MISS, get_response_cache, make_cache_key
+from .taxonomy import get_theme_labels, get_themes
+from .theme_preselector import PRESELECTOR_VERSION, THEME_PRESELECTION_ENABLED, preselect_themes
+from monitoring.metrics import (
+    CLAUDE_ESCALATIONS, CLAUDE_INPUT_TOKENS_ESTIMATE, CLAUDE_REPAIR_REQUESTS, CLAUDE_TIER_CALLS, CLAUDE_TIER_LATENCY,
+    VERBATIMS_CHUNKED, record_claude_call,
+)
 
-#dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
+if TYPE_CHECKING:
+    import anthropic
 
+# L'import du module reste léger (DAG Airflow, Cloud Function) : le SDK anthropic / httpx et le client
+# ne sont chargés qu'au premier appel de get_client(). Le .env est lu dès l'import s'il existe (les
+# réglages CLAUDE_* ci-dessous en dépendent) ; son absence n'est signalée qu'à la création du client.
 dotenv_path = Path(__file__).resolve().parent.parent / ".env"
-if os.getenv("PYTEST_RUNNING"):
-    # Les variables d'environnement seront mockées par pytest
-    if os.path.exists(dotenv_path):
-        load_dotenv(dotenv_path=dotenv_path)
-else:
-    if os.path.exists(dotenv_path):
-        load_dotenv(dotenv_path=dotenv_path)
-    else:
+if os.path.exists(dotenv_path):
+    load_dotenv(dotenv_path=dotenv_path)
+
+# Transport HTTP de remplacement (enregistrement / rejeu, voir api/replay.py) ; None : réseau
+_http_transport = None
+_client_lock = threading.Lock()
+
+
+def _api_key() -> str:
+    # Les variables d'environnement sont mockées par pytest
+    if not os.getenv("PYTEST_RUNNING") and not os.path.exists(dotenv_path):
         raise FileNotFoundError(f"Le fichier .env est introuvable à l'emplacement : {dotenv_path}")
+    return os.getenv("ANTHROPIC_API_KEY") or ""
+
+
+def _build_client(http_client=None) -> "anthropic.Anthropic":
+    import anthropic
+
+    # Relances gérées par le gouverneur de débit (rate_limiter), pas par le SDK
+    return anthropic.Anthropic(api_key=_api_key(), timeout=30.0, max_retries=0, http_client=http_client)
+
 
-api_key = os.getenv("ANTHROPIC_API_KEY") or ""
+def get_client() -> "anthropic.Anthropic":
+    """Client Anthropic synchrone, créé au premier appel puis réutilisé (attribut client du module)."""
+    current = globals().get("client")
+    if current is None:
+        with _client_lock:
+            current = globals().get("client")
+            if current is None:
+                current = globals()["client"] = _build_client()
+    return current
 
-client = anthropic.Anthropic(api_key=api_key, timeout=30.0)
-THEME_LABELS = {t["nom"] for t in THEMES}
+
+def set_http_transport(transport=None):
+    """Fait passer les clients Claude (synchrone et asynchrones) par transport ; None rétablit le réseau."""
+    import httpx
+
+    global _http_transport
+    _http_transport = transport
+    http_client = httpx.Client(transport=transport, timeout=30.0) if transport is not None else None
+    globals()["client"] = _build_client(http_client)
+
+
+def __getattr__(name):
+    # claude_interface.client n'existe qu'une fois le client créé : le premier accès le crée
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Log setup
 logger = logging.getLogger("claude_logger")
@@ -27,74 +77,503 @@ logger.setLevel(logging.INFO) # Le logger principal capture tout à partir de IN
 logger.propagate = False
 
 if 'pytest' not in sys.modules:
-    # Gestionnaire pour le log général (tous les niveaux à partir de INFO)
-    general_handler = logging.FileHandler("claude.log", encoding="utf-8") # Renommé
-    general_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(general_handler)
+    # Écriture dans claude.log / claude_errors.log (rotation, compression) par un thread de fond
+    configure_async_logging(logger)
+
+CLAUDE_MODEL = "claude-3-haiku-20240307"
+# Cascade de modèles, du moins cher au plus capable (séparés par des virgules) : un avis n'est envoyé
+# au modèle suivant que si la réponse est invalide, vide ou incohérente avec la note de l'avis
+CLAUDE_MODEL_CASCADE = [m.strip() for m in os.getenv("CLAUDE_MODEL_CASCADE", CLAUDE_MODEL).split(",") if m.strip()]
+SYSTEM_PROMPT = "Tu es un assistant d’analyse de satisfaction client."
+CLAUDE_TIMEOUT = 30.0
+CLAUDE_MAX_TOKENS = 500
+# Tokens de réponse réservés auprès du gouverneur avant l'appel (corrigés ensuite avec usage.output_tokens)
+EXPECTED_OUTPUT_TOKENS = 100
+# "text" : JSON libre dans la réponse ; "tool" : arguments structurés d'un outil au schéma contraint
+CLAUDE_OUTPUT_MODE = os.getenv("CLAUDE_OUTPUT_MODE", "text")
+THEME_TOOL_NAME = "enregistrer_themes"
+# Lecture en flux de la réponse (mode texte uniquement), arrêtée dès que le JSON est complet
+CLAUDE_STREAMING = os.getenv("CLAUDE_STREAMING", "0") == "1"
+
+
+def build_system_blocks() -> list[dict]:
+    """Bloc system fixe (rôle + consignes + référentiel complet), marqué cache_control pour être réutilisé
+    entre les appels : rien de propre à un avis ne doit y figurer."""
+    return [{
+        "type": "text",
+        "text": f"{SYSTEM_PROMPT}\n\n{build_static_instructions()}",
+        "cache_control": {"type": "ephemeral"},
+    }]
+
+
+def build_theme_tool(themes: list[dict] | None = None) -> dict:
+    """Outil dont le schéma impose un thème du référentiel et une note entre 1 et 5."""
+    labels = [t["nom"] for t in (get_themes() if themes is None else themes)]
+    return {
+        "name": THEME_TOOL_NAME,
+        "description": "Enregistre les thèmes abordés dans l'avis client et leur note de satisfaction.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "themes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "theme": {"type": "string", "enum": labels},
+                            "note": {"type": "number", "minimum": 1, "maximum": 5},
+                        },
+                        "required": ["theme", "note"],
+                    },
+                },
+            },
+            "required": ["themes"],
+        },
+    }
+
+
+def build_request(verbatim: str, themes: list[dict] | None = None, model: str | None = None) -> dict:
+    """Paramètres de l'appel messages.create, communs aux clients synchrone et asynchrone.
+    Seul le message utilisateur varie d'un appel à l'autre : le verbatim, et les thèmes pré-sélectionnés
+    (themes) qui y sont listés ; l'outil et le bloc system, en tête du préfixe mis en cache, restent fixes."""
+    request = {
+        "model": model or CLAUDE_MODEL_CASCADE[0],
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "temperature": 0,
+        "system": build_system_blocks(),
+        "messages": [{"role": "user", "content": build_verbatim_prompt(verbatim, themes)}],
+    }
+    if CLAUDE_OUTPUT_MODE == "tool":
+        request["tools"] = [build_theme_tool()]
+        request["tool_choice"] = {"type": "tool", "name": THEME_TOOL_NAME}
+    return request
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """Tokens d'entrée estimés d'une requête (bloc system + messages)."""
+    text = "".join(block["text"] for block in request["system"])
+    text += "".join(m["content"] for m in request["messages"])
+    return estimate_tokens(text)
+
+
+def prompt_version() -> str:
+    """Empreinte des paramètres de requête hors verbatim (modèle, température, consignes, thèmes).
+    Sert de clé de version au cache des réponses : toute modification du prompt l'invalide."""
+    template = json.dumps(build_request("{verbatim}"), sort_keys=True, ensure_ascii=False)
+    if THEME_PRESELECTION_ENABLED:
+        template += PRESELECTOR_VERSION
+    if len(CLAUDE_MODEL_CASCADE) > 1:
+        template += ",".join(CLAUDE_MODEL_CASCADE)
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()
+
+
+def _build_classification_request(verbatim: str, model: str) -> dict:
+    """Requête envoyée pour un verbatim : thèmes pré-sélectionnés si la pré-sélection est activée."""
+    themes = preselect_themes(verbatim) if THEME_PRESELECTION_ENABLED else None
+    return build_request(verbatim, themes, model)
+
+
+def _lookup_cache(verbatim: str, rating: int | None = None):
+    """Renvoie (cache, clé, thèmes en cache ou MISS) ; cache None s'il est désactivé."""
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, MISS
+    version = prompt_version()
+    if len(CLAUDE_MODEL_CASCADE) > 1:
+        # l'escalade dépend de la note de l'avis : elle fait partie de la clé
+        version += f"|note={rating}"
+    key = make_cache_key(verbatim, version)
+    return cache, key, cache.get(key)
+
+
+def escalation_reason(themes: list[dict] | None, rating: int | None = None) -> str | None:
+    """Motif d'envoi au modèle suivant de la cascade, ou None si la réponse est retenue.
+    Heuristique d'ambiguïté : notes de thèmes toutes opposées à la note (étoiles) laissée par le client."""
+    if not themes:
+        return "no_theme"
+    if rating is None:
+        return None
+    notes = [t["note"] for t in themes]
+    if rating <= 2 and min(notes) >= 4:
+        return "rating_mismatch"
+    if rating >= 4 and max(notes) <= 2:
+        return "rating_mismatch"
+    return None
+
+
+def _record_escalation(models: list[str], tier: int, reason: str):
+    CLAUDE_ESCALATIONS.labels(reason=reason).inc()
+    logger.info(f"Escalade de {models[tier]} vers {models[tier + 1]} ({reason})")
+
+
+def _tool_use_block(response):
+    return next((b for b in response.content if getattr(b, "type", None) == "tool_use"), None)
+
+
+def parse_response(response) -> list[dict] | None:
+    return parse_response_checked(response)[0]
+
+
+def parse_text_response(text: str) -> list[dict] | None:
+    return parse_text_response_checked(text)[0]
+
+
+def _declares_no_theme(data) -> bool:
+    """Réponse bien formée sans aucun thème ({"themes": []}) : valide, contrairement à un rejet de validation."""
+    return isinstance(data, dict) and data.get("themes") == []
+
+
+def parse_response_checked(response) -> tuple[list[dict] | None, bool]:
+    """(thèmes validés, réponse valide). Une réponse valide peut ne contenir aucun thème ; seules les réponses
+    valides peuvent être mises en cache."""
+    tool_block = _tool_use_block(response)
+    if tool_block is None:
+        return parse_text_response_checked(response.content[0].text)
+
+    content = tool_block.input
+    items = content.get("themes") if isinstance(content, dict) else None
+    validated = validate_theme_items(items) if isinstance(items, list) else None
+    valid = validated is not None or _declares_no_theme(content)
+    if not valid:
+        logger.warning(f"Réponse non valide : {content}")
+    elif should_log_raw_body(valid=True):
+        logger.info(f"Réponse structurée de Claude : {content}")
+    return validated, valid
+
+
+def parse_text_response_checked(text: str) -> tuple[list[dict] | None, bool]:
+    content = text.strip()
+
+    # Corps brut : toujours journalisé si invalide (ici ou dans validate_claude_response), échantillonné sinon
+    validated = validate_claude_response(content)
+    valid = validated is not None or _declares_no_theme(json.loads(content))
+    if not valid:
+        logger.warning(f"Réponse non valide : {content}")
+    elif should_log_raw_body(valid=True):
+        logger.info(f"Réponse brute de Claude : {content}")
+    return validated, valid
+
+
+def tool_response_problems(response) -> list[str]:
+    """Écarts au schéma dans les arguments de l'outil (liste vide si la réponse est exploitable telle quelle)."""
+    tool_block = _tool_use_block(response)
+    if tool_block is None:
+        return [f"l'outil {THEME_TOOL_NAME} n'a pas été appelé"]
+    items = tool_block.input.get("themes") if isinstance(tool_block.input, dict) else None
+    if not isinstance(items, list):
+        return ["le champ 'themes' doit être une liste"]
+    theme_labels = get_theme_labels()
+    return [problem for item in items if (problem := theme_item_problem(item, theme_labels))]
+
+
+def build_repair_request(request: dict, response, problems: list[str]) -> dict:
+    """Relance ciblée : renvoie à Claude son appel d'outil avec les erreurs de validation à corriger."""
+    tool_block = _tool_use_block(response)
+    if tool_block is None:
+        return request
+    return {
+        **request,
+        "messages": request["messages"] + [
+            {"role": "assistant", "content": [
+                {"type": "tool_use", "id": tool_block.id, "name": tool_block.name, "input": tool_block.input},
+            ]},
+            {"role": "user", "content": [{
+                "type": "tool_result",
+                "tool_use_id": tool_block.id,
+                "is_error": True,
+                "content": "Réponse invalide : " + " ; ".join(problems) + ". Rappelle l'outil avec des valeurs corrigées.",
+            }]},
+        ],
+    }
+
+
+def _repair_needed(request: dict, response) -> dict | None:
+    """Requête de réparation si la réponse structurée ne passe pas la validation, sinon None."""
+    if "tools" not in request:
+        return None
+    problems = tool_response_problems(response)
+    if not problems:
+        return None
+    CLAUDE_REPAIR_REQUESTS.inc()
+    logger.warning(f"Réponse structurée invalide, relance ciblée : {problems}")
+    return build_repair_request(request, response, problems)
 
-    # Gestionnaire pour les erreurs et avertissements seulement
-    error_handler = logging.FileHandler("claude_errors.log", encoding="utf-8")
-    error_handler.setLevel(logging.WARNING) # Ne capture que WARNING et ERROR
-    error_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(error_handler)
 
 # Fonction principale pour classifier les verbatims avec Claude
-def classify_with_claude(verbatim: str) -> list[dict] | None:
-    prompt = build_prompt(verbatim)
+def classify_with_claude(verbatim: str, rating: int | None = None) -> list[dict] | None:
+    """rating (étoiles de l'avis, optionnel) sert à détecter les réponses ambiguës à escalader."""
+    chunks = split_verbatim(verbatim)
+    if len(chunks) == 1:
+        return _classify_text(verbatim, rating)
+
+    VERBATIMS_CHUNKED.inc()
+    logger.info(f"Verbatim long découpé en {len(chunks)} morceaux")
+    # Pas d'heuristique de note par morceau : un extrait peut légitimement contredire la note globale
+    results, errors = [], []
+    for chunk in chunks:
+        try:
+            results.append(_classify_text(chunk))
+        except Exception as e:
+            errors.append(e)
+    return _merge_chunk_results(results, errors)
+
+
+def _merge_chunk_results(results: list, errors: list[Exception]) -> list[dict] | None:
+    """Fusionne les morceaux classifiés ; l'avis n'est en erreur que si aucun morceau n'a abouti."""
+    if not results:
+        raise errors[0]
+    if errors:
+        logger.warning(f"{len(errors)} morceau(x) en erreur sur {len(results) + len(errors)}, "
+                       f"fusion des {len(results)} autres")
+    return merge_chunk_themes(results)
+
+
+def _classify_text(verbatim: str, rating: int | None = None) -> list[dict] | None:
+    cache, key, cached = _lookup_cache(verbatim, rating)
+    if cached is not MISS:
+        return cached
+
     try:
-        response = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=500,
-            temperature=0,
-            system="Tu es un assistant d’analyse de satisfaction client.",
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        content = response.content[0].text.strip()
-        
-        logger.info(f"Réponse brute de Claude : {content}")
+        themes, valid = _run_cascade(verbatim, rating)
+        # Réponse rejetée par la validation : jamais mise en cache, l'avis sera renvoyé à Claude
+        if cache is not None and valid:
+            cache.put(key, themes)
+        return themes
+
+    except Exception as e:
+        logger.error(f"Erreur API Claude : {e}")
+        raise
+
+
+def _run_cascade(verbatim: str, rating: int | None) -> tuple[list[dict] | None, bool]:
+    """(thèmes retenus, réponse valide) après escalade éventuelle le long de la cascade."""
+    models = CLAUDE_MODEL_CASCADE
+    for tier, model in enumerate(models):
+        last_tier = tier == len(models) - 1
+        try:
+            themes, valid = _call_model(verbatim, model)
+        except ValueError:  # JSON invalide
+            if last_tier:
+                raise
+            _record_escalation(models, tier, "invalid_response")
+            continue
+        reason = escalation_reason(themes, rating)
+        if reason is None or last_tier:
+            return themes, valid
+        _record_escalation(models, tier, reason)
+
+
+def _create_message(request: dict):
+    """Un appel messages.create, instrumenté (latence de l'appel seul, tokens, motif d'arrêt, coût)."""
+    start = time.time()
+    response = get_client().messages.create(**request)
+    record_claude_call(request["model"], response, time.time() - start)
+    return response
+
+
+def _call_model(verbatim: str, model: str) -> tuple[list[dict] | None, bool]:
+    """Un étage de la cascade : appel (streaming ou non), réparation éventuelle et validation."""
+    start = time.time()
+    request = _build_classification_request(verbatim, model)
+    input_tokens = estimate_request_tokens(request)
+    CLAUDE_INPUT_TOKENS_ESTIMATE.observe(input_tokens)
+    try:
+        if CLAUDE_STREAMING and "tools" not in request:
+            text = call_with_retries(lambda: stream_json_text(get_client(), request),
+                                     input_tokens, EXPECTED_OUTPUT_TOKENS)
+            return parse_text_response_checked(text)
+
+        response = call_with_retries(lambda: _create_message(request), input_tokens, EXPECTED_OUTPUT_TOKENS)
+        repair_request = _repair_needed(request, response)
+        if repair_request is not None:
+            response = call_with_retries(lambda: _create_message(repair_request),
+                                         input_tokens, EXPECTED_OUTPUT_TOKENS)
+        return parse_response_checked(response)
+    finally:
+        CLAUDE_TIER_CALLS.labels(model=model).inc()
+        CLAUDE_TIER_LATENCY.labels(model=model).observe(time.time() - start)
+
+
+# -------------------------
+# CLASSIFICATION ASYNCHRONE (CONCURRENCE BORNÉE)
+# -------------------------
+
+def build_async_client(max_connections: int, base_url: str | None = None) -> "anthropic.AsyncAnthropic":
+    """Client asynchrone avec un pool de connexions keep-alive partagé par tous les appels d'un lot."""
+    import anthropic, httpx
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=CLAUDE_TIMEOUT,
+        transport=_http_transport,
+    )
+    return anthropic.AsyncAnthropic(api_key=_api_key(), base_url=base_url, http_client=http_client,
+                                    timeout=CLAUDE_TIMEOUT, max_retries=0)
+
+
+async def classify_with_claude_async(verbatim: str, async_client: "anthropic.AsyncAnthropic",
+                                     rating: int | None = None) -> list[dict] | None:
+    chunks = split_verbatim(verbatim)
+    if len(chunks) == 1:
+        return await _classify_text_async(verbatim, async_client, rating)
+
+    VERBATIMS_CHUNKED.inc()
+    logger.info(f"Verbatim long découpé en {len(chunks)} morceaux")
+    # Morceaux traités l'un après l'autre : le verbatim n'occupe qu'un créneau de concurrence
+    results, errors = [], []
+    for chunk in chunks:
+        try:
+            results.append(await _classify_text_async(chunk, async_client))
+        except Exception as e:
+            errors.append(e)
+    return _merge_chunk_results(results, errors)
+
 
-        validated = validate_claude_response(content)
-        if not validated:
-            logger.warning(f"Réponse non valide : {content}")
-        return validated
+async def _classify_text_async(verbatim: str, async_client: "anthropic.AsyncAnthropic",
+                               rating: int | None = None) -> list[dict] | None:
+    cache, key, cached = _lookup_cache(verbatim, rating)
+    if cached is not MISS:
+        return cached
+
+    try:
+        themes, valid = await _run_cascade_async(verbatim, async_client, rating)
+        if cache is not None and valid:
+            cache.put(key, themes)
+        return themes
 
     except Exception as e:
         logger.error(f"Erreur API Claude : {e}")
         raise
 
 
+async def _run_cascade_async(verbatim: str, async_client: "anthropic.AsyncAnthropic",
+                             rating: int | None) -> tuple[list[dict] | None, bool]:
+    models = CLAUDE_MODEL_CASCADE
+    for tier, model in enumerate(models):
+        last_tier = tier == len(models) - 1
+        try:
+            themes, valid = await _call_model_async(verbatim, async_client, model)
+        except ValueError:
+            if last_tier:
+                raise
+            _record_escalation(models, tier, "invalid_response")
+            continue
+        reason = escalation_reason(themes, rating)
+        if reason is None or last_tier:
+            return themes, valid
+        _record_escalation(models, tier, reason)
 
-def validate_claude_response(response_text: str) -> list[dict] | None:
+
+async def _create_message_async(async_client: "anthropic.AsyncAnthropic", request: dict):
+    start = time.time()
+    response = await async_client.messages.create(**request)
+    record_claude_call(request["model"], response, time.time() - start)
+    return response
+
+
+async def _call_model_async(verbatim: str, async_client: "anthropic.AsyncAnthropic",
+                            model: str) -> tuple[list[dict] | None, bool]:
+    start = time.time()
+    request = _build_classification_request(verbatim, model)
+    input_tokens = estimate_request_tokens(request)
+    CLAUDE_INPUT_TOKENS_ESTIMATE.observe(input_tokens)
     try:
-        data = json.loads(response_text)
+        if CLAUDE_STREAMING and "tools" not in request:
+            text = await async_call_with_retries(lambda: stream_json_text_async(async_client, request),
+                                                 input_tokens, EXPECTED_OUTPUT_TOKENS)
+            return parse_text_response_checked(text)
 
-        if "themes" not in data or not isinstance(data["themes"], list):
-            logger.warning(f"Clé 'themes' manquante ou invalide dans : {response_text}")
-            return None
+        response = await async_call_with_retries(lambda: _create_message_async(async_client, request),
+                                                 input_tokens, EXPECTED_OUTPUT_TOKENS)
+        repair_request = _repair_needed(request, response)
+        if repair_request is not None:
+            response = await async_call_with_retries(lambda: _create_message_async(async_client, repair_request),
+                                                     input_tokens, EXPECTED_OUTPUT_TOKENS)
+        return parse_response_checked(response)
+    finally:
+        CLAUDE_TIER_CALLS.labels(model=model).inc()
+        CLAUDE_TIER_LATENCY.labels(model=model).observe(time.time() - start)
 
-        results = []
 
-        for item in data["themes"]:
-            if not isinstance(item, dict):
-                logger.warning(f"Item non structuré correctement : {item}")
-                continue
+async def _classify_all(verbatims: list[str], concurrency: int, base_url: str | None,
+                        ratings: list | None = None, scheduler=None) -> list[dict | None]:
+    semaphore = asyncio.Semaphore(concurrency)
+    ratings = ratings or [None] * len(verbatims)
 
-            theme = item.get("theme")
-            note = item.get("note")
+    async def classify_one(async_client, verbatim, rating):
+        async with semaphore:
+            # Admission au moment de l'appel, pas au lancement : l'échéance est vérifiée avis par avis
+            if scheduler is not None and not scheduler.admit({"content": verbatim, "rating": rating}):
+                return None
+            start = time.time()
+            try:
+                themes = await classify_with_claude_async(verbatim, async_client, rating)
+                outcome = {"themes": themes, "error": None, "duration": time.time() - start}
+            except Exception as e:
+                outcome = {"themes": None, "error": e, "duration": time.time() - start}
+            if scheduler is not None:
+                scheduler.record(outcome["duration"])
+            return outcome
 
-            if theme not in THEME_LABELS:
-                logger.warning(f"Thème inconnu : {theme}")
-                continue
+    async with build_async_client(concurrency, base_url) as async_client:
+        # gather conserve l'ordre des verbatims, quel que soit l'ordre de fin des appels
+        return await asyncio.gather(*(classify_one(async_client, v, r) for v, r in zip(verbatims, ratings)))
 
-            if not isinstance(note, (int, float)) or not (1 <= note <= 5):
-                logger.warning(f"Note invalide pour {theme} : {note}")
-                continue
 
-            results.append({"theme": theme, "note": note})
+def classify_many(verbatims: list[str], concurrency: int = 8, base_url: str | None = None,
+                  ratings: list | None = None, scheduler=None) -> list[dict | None]:
+    """Classifie une liste de verbatims avec au plus `concurrency` appels simultanés.
+    ratings (optionnel) : note de chaque avis, pour la cascade de modèles.
+    scheduler (optionnel, voir api/scheduler.py) : chaque avis est admis juste avant son appel.
+    Renvoie, dans l'ordre d'entrée, un dict {themes, error, duration} par verbatim, ou None pour un avis
+    non admis (échéance ou budget atteint)."""
+    return asyncio.run(_classify_all(verbatims, max(1, concurrency), base_url, ratings, scheduler))
 
-        return results if results else None
+
+
+def validate_claude_response(response_text: str) -> list[dict] | None:
+    try:
+        data = json.loads(response_text)
 
     except json.JSONDecodeError as e:
         logger.error(f"Erreur JSON : {e} dans : {response_text}")
         raise ValueError("Réponse Claude invalide")
+
+    if "themes" not in data or not isinstance(data["themes"], list):
+        logger.warning(f"Clé 'themes' manquante ou invalide dans : {response_text}")
+        return None
+
+    return validate_theme_items(data["themes"])
+
+
+def validate_theme_items(items: list) -> list[dict] | None:
+    """Garde les éléments {theme, note} dont le thème existe et dont la note est comprise entre 1 et 5."""
+    results = []
+    theme_labels = get_theme_labels()
+
+    for item in items:
+        problem = theme_item_problem(item, theme_labels)
+        if problem:
+            logger.warning(problem)
+            continue
+
+        results.append({"theme": item["theme"], "note": item["note"]})
+
+    return results if results else None
+
+
+def theme_item_problem(item, theme_labels) -> str | None:
+    """Motif de rejet d'un élément {theme, note}, ou None s'il est valide."""
+    if not isinstance(item, dict):
+        return f"Item non structuré correctement : {item}"
+
+    theme = item.get("theme")
+    note = item.get("note")
+
+    if theme not in theme_labels:
+        return f"Thème inconnu : {theme}"
+
+    if not isinstance(note, (int, float)) or not (1 <= note <= 5):
+        return f"Note invalide pour {theme} : {note}"
+
+    return None
@@ -0,0 +1,73 @@
+"""Journalisation non bloquante des appels Claude.
+
+Les messages du logger claude_logger passent par une file (QueueHandler) : l'écriture sur disque
+est faite par un thread de fond (QueueListener), hors du chemin des requêtes. Les fichiers
+claude.log et claude_errors.log tournent par taille ou chaque nuit, et les archives sont compressées
+en gzip. Les corps bruts des réponses valides ne sont journalisés que pour un échantillon
+(CLAUDE_LOG_SAMPLE_RATE) ; les réponses invalides et les erreurs le sont toujours.
+"""
+import atexit, gzip, logging, os, queue, random, shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+CLAUDE_LOG_DIR = os.getenv("CLAUDE_LOG_DIR", ".")
+# "size" : rotation à CLAUDE_LOG_MAX_BYTES ; "time" : rotation à minuit
+CLAUDE_LOG_ROTATION = os.getenv("CLAUDE_LOG_ROTATION", "size")
+CLAUDE_LOG_MAX_BYTES = int(os.getenv("CLAUDE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+CLAUDE_LOG_BACKUP_COUNT = int(os.getenv("CLAUDE_LOG_BACKUP_COUNT", "5"))
+# Part des réponses valides dont le corps brut est journalisé
+CLAUDE_LOG_SAMPLE_RATE = float(os.getenv("CLAUDE_LOG_SAMPLE_RATE", "0.01"))
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def build_file_handler(filename: str, level: int = logging.INFO) -> logging.Handler:
+    """Fichier de log à rotation (taille ou nuit), archives compressées ; ouvert au premier message."""
+    path = os.path.join(CLAUDE_LOG_DIR, filename)
+    if CLAUDE_LOG_ROTATION == "time":
+        handler = TimedRotatingFileHandler(path, when="midnight", backupCount=CLAUDE_LOG_BACKUP_COUNT,
+                                           encoding="utf-8", delay=True)
+    else:
+        handler = RotatingFileHandler(path, maxBytes=CLAUDE_LOG_MAX_BYTES, backupCount=CLAUDE_LOG_BACKUP_COUNT,
+                                      encoding="utf-8", delay=True)
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def configure_async_logging(logger: logging.Logger, handlers: list[logging.Handler] | None = None) -> QueueListener:
+    """Branche logger sur une file lue par un thread de fond qui écrit dans handlers
+    (par défaut claude.log, et claude_errors.log pour WARNING et au-delà)."""
+    if handlers is None:
+        handlers = [build_file_handler("claude.log"), build_file_handler("claude_errors.log", logging.WARNING)]
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    # respect_handler_level : claude_errors.log ne reçoit que les avertissements et les erreurs
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)  # vide la file avant la fin du processus
+    return listener
+
+
+def stop_listener(listener: QueueListener):
+    """Vide la file puis arrête le thread d'écriture (sans effet s'il est déjà arrêté)."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def should_log_raw_body(valid: bool, sample_rate: float | None = None) -> bool:
+    """Les réponses invalides sont toujours journalisées, les valides selon le taux d'échantillonnage."""
+    if not valid:
+        return True
+    rate = CLAUDE_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    return random.random() < rate
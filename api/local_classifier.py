@@ -0,0 +1,296 @@
+"""Classifieur local distillé à partir des étiquettes Claude de topic_analysis.
+
+Régression logistique multi-label (un thème = une sortie) sur des n-grammes de mots hachés, plus une
+régression linéaire de la note par thème, entraînées en NumPy sur l'historique des avis déjà
+classifiés par Claude. Sans appel réseau, le mode "local" de run_analysis classe des milliers
+d'avis par seconde sur CPU : aperçus instantanés, ou repli quand le budget API est épuisé.
+Ses prédictions sont écrites dans topic_analysis avec source = "local" et exclues de l'entraînement
+comme des rapports d'accord : le modèle n'apprend que des étiquettes Claude.
+
+Entraînement (avec rapport d'accord sur les avis tenus à l'écart) :
+    python -m api.local_classifier train AAAA-MM-JJ AAAA-MM-JJ
+Rapport d'accord du modèle enregistré sur une autre période :
+    python -m api.local_classifier report AAAA-MM-JJ AAAA-MM-JJ
+"""
+import argparse, hashlib, json, os, re, threading, time, unicodedata, zlib
+import numpy as np
+
+# data/models du projet : volume monté dans les conteneurs Airflow (voir docker-compose.yaml)
+DEFAULT_LOCAL_CLASSIFIER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "data", "models", "local_classifier.npz")
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", DEFAULT_LOCAL_CLASSIFIER_PATH)
+HASH_FEATURES = 2 ** 18
+NGRAM_RANGE = (1, 2)
+# Probabilité à partir de laquelle un thème est retenu
+THEME_THRESHOLD = 0.5
+
+_TOKEN = re.compile(r"\w+")
+_BIAS_TOKEN = "<biais>"
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def hashed_features(text: str, n_features: int = HASH_FEATURES) -> tuple[np.ndarray, np.ndarray]:
+    """Indices et poids (tf normalisé L2) des n-grammes de mots hachés ; le biais est toujours présent."""
+    words = _TOKEN.findall(_normalize(text))
+    counts = {}
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        for i in range(len(words) - n + 1):
+            index = zlib.crc32(" ".join(words[i:i + n]).encode("utf-8")) % n_features
+            counts[index] = counts.get(index, 0) + 1
+    values = np.array(list(counts.values()), dtype=np.float32)
+    if len(values):
+        values /= np.linalg.norm(values)
+    indices = np.array([zlib.crc32(_BIAS_TOKEN.encode("utf-8")) % n_features, *counts], dtype=np.int64)
+    return indices, np.concatenate([[1.0], values]).astype(np.float32)
+
+
+def _vectorize(texts: list[str], n_features: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Matrice creuse au format CSR (indptr, indices, data)."""
+    rows = [hashed_features(t, n_features) for t in texts]
+    indptr = np.cumsum([0] + [len(r[0]) for r in rows])
+    return indptr, np.concatenate([r[0] for r in rows]), np.concatenate([r[1] for r in rows])
+
+
+class LocalThemeClassifier:
+    """Thèmes (sorties logistiques indépendantes) et notes (régression linéaire par thème)."""
+
+    def __init__(self, labels: list[str], n_features: int = HASH_FEATURES, threshold: float = THEME_THRESHOLD):
+        self.labels = list(labels)
+        self.n_features = n_features
+        self.threshold = threshold
+        self.theme_weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        self.note_weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        self.note_bias = np.full(len(labels), 3.0, dtype=np.float32)
+        self.meta = {}
+
+    def _scores(self, weights, indptr, indices, data) -> np.ndarray:
+        # Chaque avis a au moins le biais : aucun segment vide pour reduceat
+        return np.add.reduceat(weights[indices] * data[:, None], indptr[:-1], axis=0)
+
+    def fingerprint(self) -> str:
+        """Empreinte des poids et des labels : change à chaque réentraînement."""
+        digest = hashlib.sha256(json.dumps([self.labels, self.threshold], ensure_ascii=False).encode("utf-8"))
+        for array in (self.theme_weights, self.note_weights, self.note_bias):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:16]
+
+    @property
+    def version(self) -> str:
+        """Version du modèle, enregistrée avec lui ; entre dans la version des lignes topic_analysis locales."""
+        return self.meta.get("version") or self.fingerprint()
+
+    def fit(self, samples: list[dict], epochs: int = 15, learning_rate: float = 1.0, l2: float = 1e-6,
+            batch_size: int = 256, seed: int = 0) -> "LocalThemeClassifier":
+        """samples : [{"content": ..., "themes": [{"theme": label, "note": float}]}]"""
+        index = {label: i for i, label in enumerate(self.labels)}
+        targets = np.zeros((len(samples), len(self.labels)), dtype=np.float32)
+        notes = np.zeros_like(targets)
+        for row, sample in enumerate(samples):
+            for item in sample["themes"]:
+                if item["theme"] in index:
+                    targets[row, index[item["theme"]]] = 1.0
+                    notes[row, index[item["theme"]]] = item["note"]
+
+        # Note moyenne par thème comme point de départ de la régression
+        mentions = targets.sum(axis=0)
+        self.note_bias = np.where(mentions > 0, notes.sum(axis=0) / np.maximum(mentions, 1), 3.0).astype(np.float32)
+
+        features = [hashed_features(s["content"], self.n_features) for s in samples]
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(samples))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                rows = [features[i] for i in batch]
+                indptr = np.cumsum([0] + [len(r[0]) for r in rows])
+                indices = np.concatenate([r[0] for r in rows])
+                data = np.concatenate([r[1] for r in rows])
+                doc_of_feature = np.repeat(np.arange(len(batch)), np.diff(indptr))
+
+                probabilities = 1 / (1 + np.exp(-self._scores(self.theme_weights, indptr, indices, data)))
+                theme_error = (probabilities - targets[batch]) / len(batch)
+                predicted_notes = self._scores(self.note_weights, indptr, indices, data) + self.note_bias
+                # La note n'est apprise que sur les thèmes effectivement cités
+                note_error = (predicted_notes - notes[batch]) * targets[batch] / len(batch)
+
+                for weights, error in ((self.theme_weights, theme_error), (self.note_weights, note_error)):
+                    gradient = data[:, None] * error[doc_of_feature] + l2 * weights[indices]
+                    np.add.at(weights, indices, -learning_rate * gradient)
+
+        self.meta = {"samples": len(samples), "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "epochs": epochs,
+                     "version": self.fingerprint()}
+        return self
+
+    def predict(self, texts: list[str]) -> list[list[dict] | None]:
+        """Même format que classify_with_claude : liste de {theme, note}, ou None si aucun thème."""
+        if not texts:
+            return []
+        indptr, indices, data = _vectorize(texts, self.n_features)
+        probabilities = 1 / (1 + np.exp(-self._scores(self.theme_weights, indptr, indices, data)))
+        notes = self._scores(self.note_weights, indptr, indices, data) + self.note_bias
+        # Notes au demi-point, dans l'échelle 1-5 attendue par le validateur
+        notes = np.clip(np.round(notes * 2) / 2, 1.0, 5.0)
+
+        results = []
+        for row in range(len(texts)):
+            themes = [{"theme": self.labels[j], "note": float(notes[row, j])}
+                      for j in np.flatnonzero(probabilities[row] >= self.threshold)]
+            results.append(themes or None)
+        return results
+
+    def save(self, path: str = None):
+        path = path or LOCAL_CLASSIFIER_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {**self.meta, "labels": self.labels, "n_features": self.n_features, "threshold": self.threshold}
+        with open(path, "wb") as f:
+            np.savez_compressed(f, theme_weights=self.theme_weights, note_weights=self.note_weights,
+                                note_bias=self.note_bias, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls, path: str = None) -> "LocalThemeClassifier":
+        path = path or LOCAL_CLASSIFIER_PATH
+        with np.load(path) as archive:
+            meta = json.loads(str(archive["meta"]))
+            model = cls(meta["labels"], n_features=meta["n_features"], threshold=meta["threshold"])
+            model.theme_weights = archive["theme_weights"]
+            model.note_weights = archive["note_weights"]
+            model.note_bias = archive["note_bias"]
+        model.meta = {k: v for k, v in meta.items() if k not in ("labels", "n_features", "threshold")}
+        model.meta.setdefault("version", model.fingerprint())  # modèle enregistré sans version
+        return model
+
+
+_lock = threading.Lock()
+_model = None
+
+
+def get_local_classifier() -> LocalThemeClassifier:
+    """Modèle enregistré, chargé une fois par processus."""
+    global _model
+    with _lock:
+        if _model is None:
+            if not os.path.isfile(LOCAL_CLASSIFIER_PATH):
+                raise FileNotFoundError(f"Classifieur local introuvable : {LOCAL_CLASSIFIER_PATH} "
+                                        "(python -m api.local_classifier train ...)")
+            _model = LocalThemeClassifier.load(LOCAL_CLASSIFIER_PATH)
+        return _model
+
+
+def local_model_version() -> str:
+    """Version du modèle enregistré (voir LocalThemeClassifier.version)."""
+    return get_local_classifier().version
+
+
+def classify_local(verbatims: list[dict], model: LocalThemeClassifier = None) -> list[dict]:
+    """Classification locale de tous les verbatims, au format des autres modes de run_analysis :
+    un dict {themes, error, duration} par verbatim, dans l'ordre d'entrée."""
+    model = model or get_local_classifier()
+    start = time.time()
+    predictions = model.predict([v["content"] for v in verbatims])
+    duration = (time.time() - start) / max(1, len(verbatims))
+    print(f"💻 {len(verbatims)} verbatims classifiés localement en {time.time() - start:.2f} s")
+    return [{"themes": themes, "error": None, "duration": duration} for themes in predictions]
+
+
+def agreement_report(model: LocalThemeClassifier, samples: list[dict]) -> dict:
+    """Accord du modèle local avec Claude sur des avis étiquetés (idéalement absents de l'entraînement)."""
+    start = time.time()
+    predictions = model.predict([s["content"] for s in samples])
+    elapsed = time.time() - start
+
+    true_positives = predicted = expected = exact = 0
+    note_errors = []
+    per_theme = {label: {"tp": 0, "predicted": 0, "expected": 0} for label in model.labels}
+    for sample, prediction in zip(samples, predictions):
+        claude = {item["theme"]: item["note"] for item in sample["themes"]}
+        local = {item["theme"]: item["note"] for item in prediction or []}
+        exact += set(claude) == set(local)
+        predicted += len(local)
+        expected += len(claude)
+        for label in set(claude) | set(local):
+            stats = per_theme.setdefault(label, {"tp": 0, "predicted": 0, "expected": 0})
+            stats["predicted"] += label in local
+            stats["expected"] += label in claude
+            if label in local and label in claude:
+                stats["tp"] += 1
+                true_positives += 1
+                note_errors.append(abs(local[label] - claude[label]))
+
+    def f1(tp, n_predicted, n_expected):
+        return round(2 * tp / (n_predicted + n_expected), 3) if n_predicted + n_expected else 1.0
+
+    return {
+        "reviews": len(samples),
+        "precision": round(true_positives / predicted, 3) if predicted else 1.0,
+        "recall": round(true_positives / expected, 3) if expected else 1.0,
+        "f1": f1(true_positives, predicted, expected),
+        "exact_theme_set": round(exact / len(samples), 3) if samples else 1.0,
+        "note_mae": round(float(np.mean(note_errors)), 3) if note_errors else None,
+        "note_within_1": round(float(np.mean(np.array(note_errors) <= 1)), 3) if note_errors else None,
+        "f1_by_theme": {label: f1(s["tp"], s["predicted"], s["expected"]) for label, s in sorted(per_theme.items())},
+        "reviews_per_second": round(len(samples) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def split_holdout(samples: list[dict], holdout: float) -> tuple[list[dict], list[dict]]:
+    """Partage déterministe (hash du review_id) entre entraînement et évaluation."""
+    train, test = [], []
+    for sample in samples:
+        bucket = zlib.crc32(str(sample["review_id"]).encode("utf-8")) % 1000
+        (test if bucket < holdout * 1000 else train).append(sample)
+    return train, test
+
+
+def fetch_claude_labels(start: str, end: str) -> list[dict]:
+    """Avis de la période [start, end] (date de scraping) avec les thèmes et notes attribués par Claude."""
+    from google.cloud import bigquery
+    from api.analysis_schema import CLAUDE_ROWS_FILTER
+
+    query = f"""
+        SELECT r.review_id, ANY_VALUE(r.content) AS content,
+               ARRAY_AGG(STRUCT(t.topic_label AS theme, ta.score_sentiment AS note)) AS themes
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews` r
+        JOIN `trustpilot-satisfaction.reviews_dataset.topic_analysis` ta USING (review_id)
+        JOIN `trustpilot-satisfaction.reviews_dataset.topics` t ON CAST(t.topic_id AS STRING) = CAST(ta.topic_id AS STRING)
+        WHERE r.content IS NOT NULL AND r.scrape_date BETWEEN @start AND @end
+          AND {CLAUDE_ROWS_FILTER}
+        GROUP BY r.review_id
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("start", "DATE", start),
+        bigquery.ScalarQueryParameter("end", "DATE", end),
+    ])
+    rows = bigquery.Client().query(query, job_config=job_config).result()
+    return [{
+        "review_id": row["review_id"],
+        "content": row["content"],
+        "themes": [{"theme": t["theme"], "note": float(t["note"])} for t in row["themes"]],
+    } for row in rows]
+
+
+if __name__ == "__main__":
+    from api.taxonomy import get_theme_labels
+
+    parser = argparse.ArgumentParser(description="Classifieur local distillé des étiquettes Claude")
+    parser.add_argument("command", choices=("train", "report"))
+    parser.add_argument("start", help="Première date de scraping (AAAA-MM-JJ)")
+    parser.add_argument("end", help="Dernière date incluse (AAAA-MM-JJ)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Part des avis tenus à l'écart (train)")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--path", default=LOCAL_CLASSIFIER_PATH)
+    args = parser.parse_args()
+
+    samples = fetch_claude_labels(args.start, args.end)
+    if args.command == "train":
+        train, test = split_holdout(samples, args.holdout)
+        model = LocalThemeClassifier(sorted(get_theme_labels())).fit(train, epochs=args.epochs)
+        model.save(args.path)
+        print(f"Modèle entraîné sur {len(train)} avis, enregistré dans {args.path}")
+        report = agreement_report(model, test)
+    else:
+        report = agreement_report(LocalThemeClassifier.load(args.path), samples)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
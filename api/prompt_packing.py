@@ -0,0 +1,282 @@
+"""Prompts multi-avis : plusieurs verbatims par requête Claude.
+
+Les consignes et la liste des thèmes (~600 tokens) ne sont envoyées qu'une fois pour tout un
+paquet d'avis, dans un bloc system mis en cache côté API. Les avis sont répartis en paquets par
+bin packing (first-fit decreasing) selon un budget de tokens ; la réponse est un JSON indexé par
+review_id, validé avis par avis. Les paquets suivent la cascade de modèles : les avis à escalader
+forment de nouveaux paquets pour le modèle suivant. Seuls les avis dont la réponse est absente ou
+invalide sont relancés individuellement (classify_with_claude).
+
+Mesure : python -m api.prompt_packing AAAA-MM-JJ [--limit 50]
+"""
+import argparse, json, os, time
+from api import claude_interface
+from api.claude_interface import (
+    SYSTEM_PROMPT, _record_escalation, build_request, classify_with_claude, escalation_reason, parse_response,
+    validate_theme_items, logger,
+)
+from api.claude_logging import should_log_raw_body
+from api.prompt_utils import PROMPT_INTRO, PROMPT_TASK, PROMPT_RULES, estimate_tokens
+from api.rate_limiter import call_with_retries
+from api.taxonomy import get_theme_block
+from monitoring.metrics import record_claude_call, track_claude_tokens
+
+PACK_TOKEN_BUDGET = int(os.getenv("CLAUDE_PACK_TOKEN_BUDGET", "3000"))
+MAX_REVIEWS_PER_PACK = int(os.getenv("CLAUDE_PACK_MAX_REVIEWS", "20"))
+# Tokens de réponse prévus par avis (quelques thèmes + la clé review_id)
+OUTPUT_TOKENS_PER_REVIEW = 80
+
+PACKED_FORMAT = """Réponds uniquement avec un JSON **valide**, avec une entrée par identifiant d'avis (liste vide si aucun thème) :
+
+```json
+{
+  "identifiant de l'avis 1": {
+    "themes": [
+      {
+        "theme": "nom exact du thème",
+        "note": 3.5
+      }
+    ]
+  },
+  "identifiant de l'avis 2": {
+    "themes": []
+  }
+}"""
+
+
+def pack_reviews(verbatims: list[dict], token_budget: int = None, max_reviews: int = None) -> list[list[dict]]:
+    """Répartit les verbatims en paquets dont la taille estimée ne dépasse pas token_budget (first-fit decreasing).
+    Un avis plus long que le budget forme un paquet à lui seul."""
+    token_budget = token_budget or PACK_TOKEN_BUDGET
+    max_reviews = max_reviews or MAX_REVIEWS_PER_PACK
+
+    bins = []  # [tokens utilisés, [verbatims]]
+    for v in sorted(verbatims, key=lambda v: estimate_tokens(v["content"]), reverse=True):
+        size = estimate_tokens(v["content"])
+        for b in bins:
+            if b[0] + size <= token_budget and len(b[1]) < max_reviews:
+                b[0] += size
+                b[1].append(v)
+                break
+        else:
+            bins.append([size, [v]])
+    return [b[1] for b in bins]
+
+
+def build_packed_system_blocks() -> list[dict]:
+    """Bloc system fixe des prompts multi-avis (rôle, consignes, thèmes, format indexé), mis en cache côté API."""
+    return [{
+        "type": "text",
+        "text": f"""{SYSTEM_PROMPT}
+
+{PROMPT_INTRO}
+
+{PROMPT_TASK.format(theme_list=get_theme_block())}
+
+{PROMPT_RULES}
+
+{PACKED_FORMAT}""",
+        "cache_control": {"type": "ephemeral"},
+    }]
+
+
+def build_packed_prompt(verbatims: list[dict]) -> str:
+    """Seule partie variable de la requête : les avis du paquet, précédés de leur identifiant."""
+    reviews = "\n".join(f'[{v["review_id"]}] "{v["content"]}"' for v in verbatims)
+
+    return f"""Voici {len(verbatims)} avis clients à analyser, chacun précédé de son identifiant entre crochets. Analyse chaque avis indépendamment des autres :
+{reviews}
+
+Réponds uniquement avec le JSON demandé, une entrée par identifiant."""
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+
+def validate_packed_response(response_text: str, review_ids: list[str]) -> tuple[dict, list[str]]:
+    """Découpe la réponse par avis. Renvoie ({review_id: thèmes validés ou None}, review_ids à relancer)."""
+    try:
+        data = json.loads(_strip_code_fence(response_text))
+    except json.JSONDecodeError as e:
+        logger.error(f"Erreur JSON (prompt multi-avis) : {e} dans : {response_text}")
+        return {}, list(review_ids)
+
+    if not isinstance(data, dict):
+        logger.warning(f"Réponse multi-avis non structurée : {response_text}")
+        return {}, list(review_ids)
+
+    results, failed = {}, []
+    for review_id in review_ids:
+        entry = data.get(review_id)
+        if not isinstance(entry, dict) or not isinstance(entry.get("themes"), list):
+            logger.warning(f"Entrée manquante ou invalide pour l'avis {review_id}")
+            failed.append(review_id)
+            continue
+        results[review_id] = validate_theme_items(entry["themes"])
+    return results, failed
+
+
+def classify_pack(pack: list[dict], client=None, model: str = None) -> tuple[dict, list[str], int]:
+    """Un appel Claude (model, ou le premier modèle de la cascade) pour tout le paquet.
+    Renvoie (résultats, review_ids en échec, tokens consommés)."""
+    client = client or claude_interface.get_client()
+    model = model or claude_interface.CLAUDE_MODEL_CASCADE[0]
+    system = build_packed_system_blocks()
+    prompt = build_packed_prompt(pack)
+    max_tokens = min(4096, 100 + OUTPUT_TOKENS_PER_REVIEW * len(pack))
+    def send():
+        start = time.time()
+        response = client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0,
+            system=system,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        record_claude_call(model, response, time.time() - start)
+        return response
+
+    response = call_with_retries(send, estimate_tokens(system[0]["text"] + prompt), max_tokens)
+    content = response.content[0].text.strip()
+    results, failed = validate_packed_response(content, [v["review_id"] for v in pack])
+    # Corps brut : toujours journalisé si un avis du paquet est en échec, échantillonné sinon
+    if should_log_raw_body(valid=not failed):
+        logger.info(f"Réponse brute de Claude (multi-avis) : {content}")
+    tokens = response.usage.input_tokens + response.usage.output_tokens
+    return results, failed, tokens
+
+
+def classify_packed(verbatims: list[dict], token_budget: int = None, client=None, stats: dict = None,
+                    scheduler=None) -> list[dict | None]:
+    """Classifie les verbatims par paquets. Renvoie, dans l'ordre d'entrée, un dict {themes, error, duration}
+    par verbatim (même format que classify_many). stats, si fourni, reçoit appels et tokens consommés
+    (relances individuelles comprises).
+    scheduler (optionnel, voir api/scheduler.py) : les avis de chaque paquet sont admis avant son envoi (None
+    pour un avis non admis) ; une fois l'échéance atteinte, les réponses en attente d'escalade sont gardées
+    telles quelles et les avis à relancer sont reportés."""
+    stats = stats if stats is not None else {}
+    stats.update({"calls": 0, "tokens": 0, "retried": 0})
+    outcomes = {v["review_id"]: {"themes": None, "error": None, "duration": 0.0} for v in verbatims}
+    retry = []
+
+    models = claude_interface.CLAUDE_MODEL_CASCADE
+    pending = list(verbatims)
+    for tier, model in enumerate(models):
+        if not pending:
+            break
+        if tier > 0 and scheduler is not None and not scheduler.has_time():
+            break  # réponses de l'étage précédent conservées
+        last_tier = tier == len(models) - 1
+        escalated = []
+        packs = pack_reviews(pending, token_budget)
+        if scheduler is not None:
+            # Paquets envoyés dans l'ordre de leur avis le plus prioritaire (verbatims déjà triés)
+            position = {v["review_id"]: i for i, v in enumerate(verbatims)}
+            packs.sort(key=lambda pack: min(position[v["review_id"]] for v in pack))
+        for pack in packs:
+            if tier == 0 and scheduler is not None:
+                admitted = [v for v in pack if scheduler.admit(v)]
+                for v in pack[len(admitted):]:
+                    outcomes[v["review_id"]] = None
+                if not admitted:
+                    continue
+                pack = admitted
+            start = time.time()
+            try:
+                results, failed, tokens = classify_pack(pack, client=client, model=model)
+                stats["calls"] += 1
+                stats["tokens"] += tokens
+            except Exception as e:
+                logger.error(f"Erreur API Claude (multi-avis) : {e}")
+                results, failed = {}, [v["review_id"] for v in pack]
+            per_review = (time.time() - start) / len(pack)
+            for v in pack:
+                outcomes[v["review_id"]]["duration"] += per_review
+                if scheduler is not None:
+                    scheduler.record(per_review)
+                if v["review_id"] in failed:
+                    retry.append(v)
+                    continue
+                themes = results[v["review_id"]]
+                outcomes[v["review_id"]]["themes"] = themes
+                reason = escalation_reason(themes, v.get("rating"))
+                if reason is not None and not last_tier:
+                    _record_escalation(models, tier, reason)
+                    escalated.append(v)
+        pending = escalated
+
+    # Seuls les avis en échec sont relancés, avec le prompt unitaire (cascade complète)
+    with track_claude_tokens() as retry_usage:
+        for v in retry:
+            if scheduler is not None and not scheduler.has_time():
+                outcomes[v["review_id"]] = None
+                continue
+            stats["retried"] += 1
+            retry_start = time.time()
+            try:
+                outcomes[v["review_id"]]["themes"] = classify_with_claude(v["content"], rating=v.get("rating"))
+            except Exception as e:
+                outcomes[v["review_id"]]["error"] = e
+            outcomes[v["review_id"]]["duration"] += time.time() - retry_start
+    stats["tokens"] += retry_usage["tokens"]
+
+    return [outcomes[v["review_id"]] for v in verbatims]
+
+
+def benchmark_packing(verbatims: list[dict], token_budget: int = None, client=None) -> dict:
+    """Compare le prompt unitaire et les prompts multi-avis : tokens par avis et avis par seconde."""
+    client = client or claude_interface.get_client()
+    n = len(verbatims)
+
+    start, single_tokens = time.time(), 0
+    for v in verbatims:
+        response = client.messages.create(**build_request(v["content"]))
+        parse_response(response)
+        single_tokens += response.usage.input_tokens + response.usage.output_tokens
+    single_duration = time.time() - start
+
+    start, packed_stats = time.time(), {}
+    classify_packed(verbatims, token_budget=token_budget, client=client, stats=packed_stats)
+    packed_duration = time.time() - start
+
+    report = {
+        "reviews": n,
+        "single": {
+            "calls": n,
+            "tokens_per_review": round(single_tokens / n, 1),
+            "reviews_per_second": round(n / single_duration, 2),
+        },
+        "packed": {
+            "calls": packed_stats["calls"],
+            "retried": packed_stats["retried"],
+            "tokens_per_review": round(packed_stats["tokens"] / n, 1),
+            "reviews_per_second": round(n / packed_duration, 2),
+        },
+    }
+    print(f"Prompt unitaire : {report['single']['tokens_per_review']} tokens/avis, "
+          f"{report['single']['reviews_per_second']} avis/s ({n} appels)")
+    print(f"Prompt multi-avis : {report['packed']['tokens_per_review']} tokens/avis, "
+          f"{report['packed']['reviews_per_second']} avis/s ({packed_stats['calls']} appels, "
+          f"{packed_stats['retried']} avis relancés)")
+    return report
+
+
+if __name__ == "__main__":
+    from api.bq_connect import get_verbatims_by_date
+
+    parser = argparse.ArgumentParser(description="Compare prompt unitaire et prompts multi-avis")
+    parser.add_argument("scrape_date", help="Date des verbatims à utiliser (AAAA-MM-JJ)")
+    parser.add_argument("--limit", type=int, default=50, help="Nombre maximum de verbatims")
+    parser.add_argument("--token-budget", type=int, default=None)
+    args = parser.parse_args()
+
+    sample = get_verbatims_by_date(args.scrape_date)[:args.limit]
+    if sample:
+        benchmark_packing(sample, token_budget=args.token_budget)
+    else:
+        print(f"Aucun verbatim pour {args.scrape_date}")
@@ -1,61 +1,18 @@
-THEMES = [
-    {
-        "nom": "Prix et promotions",
-        "description": "Rapport qualité/prix, remises, offres promotionnelles, transparence tarifaire, publicité mensongère"
-    },
-    {
-        "nom": "Livraison et retrait",
-        "description": "Délais de livraison, suivi de colis, retrait en magasin, produits manquants ou perdus"
-    },
-    {
-        "nom": "Retour et remboursement",
-        "description": "Conditions de retour, reprise du matériel, facilité de remboursement, rapidité, gestes commerciaux"
-    },
-    {
-        "nom": "Qualité des produits",
-        "description": "Matériaux défectueux, mauvais état à la réception, problème de conformité"
-    },
-    {
-        "nom": "Service client / SAV",
-        "description": "Réactivité, efficacité, écoute, résolution des problèmes après achat par le personnel, appels non pris en compte, délais de réponse trop longs"
-    },
-    {
-        "nom": "Expérience d'achat en ligne",
-        "description": "Facilité d'utilisation du site, ergonomie, informations produits, expérience d'achat numérique"
-    },
-    {
-        "nom": "Expérience d'achat en magasin",
-        "description": "Accueil, conseils du personnel, accompagnement, attente en caisse"
-    },
-    {
-        "nom": "Suivi de projet / travaux sur mesure",
-        "description": "Coordination de projets longs ou personnalisés, accompagnement des chantiers, suivi des travaux"
-    },
-    {
-        "nom": "Qualité de la communication",
-        "description": "Précision dans les conditions ou offres, communication claire, transparence dans les réponses, confusion dans les messages, conditions opaques"
-    },
-    {
-        "nom": "Programme fidélité",
-        "description": "Avantages exclusifs, points de fidélité, offres réservées aux membres"
-    }
-]
+import math
+from .taxonomy import DEFAULT_THEMES, format_theme_block, get_theme_block
 
-def build_prompt(verbatim: str) -> str:
-    theme_list = "\n".join([f'- {t["nom"]} : {t["description"]}' for t in THEMES])
+# Conservé pour compatibilité : la liste de référence vient désormais de la table topics (voir taxonomy.py)
+THEMES = DEFAULT_THEMES
 
-    return f"""
-Tu es un expert en analyse de la satisfaction client. Ta mission est d’identifier les irritants dans les avis clients ainsi que les points positifs, en respectant strictement les consignes suivantes.
+# Sections du prompt, partagées entre le prompt unitaire et les prompts multi-avis
+PROMPT_INTRO = """Tu es un expert en analyse de la satisfaction client. Ta mission est d’identifier les irritants dans les avis clients ainsi que les points positifs, en respectant strictement les consignes suivantes."""
 
-Voici un avis client à analyser :
-"{verbatim}"
-
-Tu dois détecter les **thèmes abordés** parmi la liste ci-dessous et attribuer une **note de satisfaction** sur 5 à chaque thème détecté.
+PROMPT_TASK = """Tu dois détecter les **thèmes abordés** parmi la liste ci-dessous et attribuer une **note de satisfaction** sur 5 à chaque thème détecté.
 
 Liste des thèmes :
-{theme_list}
+{theme_list}"""
 
----
+PROMPT_RULES = """---
 
 Consignes importantes :
 
@@ -76,21 +33,55 @@ Consignes importantes :
 
 - Tu dois attribuer une note sur 5 (1 = très insatisfait, 5 = très satisfait), décimale possible (ex : 2.5, 4.0).
 
----
+---"""
 
-Réponds uniquement avec un JSON **valide** au format suivant :
+PROMPT_FORMAT = """Réponds uniquement avec un JSON **valide** au format suivant :
 
 ```json
-{{
+{
   "themes": [
-    {{
+    {
       "theme": "nom exact du thème 1",
       "note": 3.5
-    }},
-    {{
+    },
+    {
       "theme": "nom exact du thème 2",
       "note": 1.0
-    }}
+    }
   ]
-}}
-"""
\ No newline at end of file
+}"""
+
+# Estimation grossière : environ 3,5 caractères par token pour du texte français
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def build_static_instructions(themes: list[dict] | None = None) -> str:
+    """Partie fixe du prompt (consignes, thèmes, format de réponse), identique pour tous les verbatims.
+    Envoyée comme bloc system mis en cache côté API (voir claude_interface.build_request), avec tout
+    le référentiel ; themes (liste explicite) ne sert qu'aux prompts hors cache."""
+    theme_list = get_theme_block() if themes is None else format_theme_block(themes)
+
+    return f"""{PROMPT_INTRO}
+
+{PROMPT_TASK.format(theme_list=theme_list)}
+
+{PROMPT_RULES}
+
+{PROMPT_FORMAT}"""
+
+
+def build_verbatim_prompt(verbatim: str, candidate_themes: list[dict] | None = None) -> str:
+    """Seule partie variable de la requête : le verbatim à analyser, précédé des thèmes candidats
+    (pré-sélection locale) s'il y en a ; le bloc system, mis en cache, garde tout le référentiel."""
+    candidates = ""
+    if candidate_themes is not None:
+        names = "\n".join(f"- {t['nom']}" for t in candidate_themes)
+        candidates = f"Thèmes candidats pour cet avis (choisis uniquement parmi ceux-ci) :\n{names}\n\n"
+    return f"""{candidates}Voici un avis client à analyser :
+"{verbatim}"
+
+Réponds uniquement avec le JSON demandé."""
@@ -0,0 +1,203 @@
+"""Gouverneur de débit des appels Claude : plafonds côté client et relances des erreurs transitoires.
+
+Chaque appel réserve une requête, ses tokens d'entrée estimés et ses tokens de sortie prévus dans
+trois seaux (RPM, ITPM, OTPM) remplis en continu. Si un seau est vide, l'appel attend le temps
+nécessaire plutôt que de déclencher un 429. Les erreurs transitoires (429, 529, 5xx, timeouts,
+coupures réseau) sont relancées avec un backoff exponentiel à jitter qui respecte retry-after.
+"""
+import asyncio, logging, os, random, sys, threading, time
+from monitoring.metrics import CLAUDE_RATE_LIMIT_WAIT, CLAUDE_RETRIES
+
+# Limites du compte (0 = pas de plafond pour ce seau)
+CLAUDE_RPM_LIMIT = int(os.getenv("CLAUDE_RPM_LIMIT", "50"))
+CLAUDE_ITPM_LIMIT = int(os.getenv("CLAUDE_ITPM_LIMIT", "50000"))
+CLAUDE_OTPM_LIMIT = int(os.getenv("CLAUDE_OTPM_LIMIT", "10000"))
+# Désactivé par défaut sous pytest : les tests ne doivent pas attendre la recharge des seaux
+RATE_LIMIT_ENABLED = os.getenv("CLAUDE_RATE_LIMIT", "0" if "pytest" in sys.modules else "1") == "1"
+
+CLAUDE_MAX_RETRIES = int(os.getenv("CLAUDE_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = float(os.getenv("CLAUDE_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("CLAUDE_BACKOFF_MAX_SECONDS", "60"))
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+logger = logging.getLogger("claude_logger")
+
+
+class TokenBucket:
+    """Seau de capacité per_minute, rechargé en continu.
+    take() peut rendre le solde négatif : l'appelant attend alors le retour à zéro (réservations dans l'ordre)."""
+
+    def __init__(self, per_minute: int, now: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """Débite amount et renvoie le délai (s) avant que la réservation soit couverte."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def give_back(self, amount: float):
+        """Corrige une réservation (amount négatif si la consommation réelle a dépassé l'estimation)."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Plafonds RPM / tokens d'entrée / tokens de sortie par minute, partagés par tous les threads."""
+
+    def __init__(self, rpm: int = None, input_tpm: int = None, output_tpm: int = None, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        limits = {
+            "requests": CLAUDE_RPM_LIMIT if rpm is None else rpm,
+            "input_tokens": CLAUDE_ITPM_LIMIT if input_tpm is None else input_tpm,
+            "output_tokens": CLAUDE_OTPM_LIMIT if output_tpm is None else output_tpm,
+        }
+        self.buckets = {name: TokenBucket(limit, now) for name, limit in limits.items() if limit > 0}
+
+    def reserve(self, input_tokens: int, output_tokens: int) -> float:
+        """Réserve la capacité d'un appel et renvoie le délai à respecter avant de l'envoyer."""
+        amounts = {"requests": 1, "input_tokens": input_tokens, "output_tokens": output_tokens}
+        with self._lock:
+            now = self.clock()
+            waits = [bucket.take(amounts[name], now) for name, bucket in self.buckets.items()]
+        return max(waits, default=0.0)
+
+    def settle(self, reserved_output_tokens: int, usage):
+        """Ajuste le seau de sortie avec la consommation réelle (response.usage), si elle est connue."""
+        actual = getattr(usage, "output_tokens", None)
+        if "output_tokens" not in self.buckets or not isinstance(actual, (int, float)):
+            return
+        with self._lock:
+            self.buckets["output_tokens"].give_back(reserved_output_tokens - actual)
+
+    def acquire(self, input_tokens: int, output_tokens: int):
+        wait = self.reserve(input_tokens, output_tokens)
+        CLAUDE_RATE_LIMIT_WAIT.observe(wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, input_tokens: int, output_tokens: int):
+        wait = self.reserve(input_tokens, output_tokens)
+        CLAUDE_RATE_LIMIT_WAIT.observe(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_limiter_lock = threading.Lock()
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Gouverneur partagé du processus, ou None si les plafonds sont désactivés."""
+    global _limiter
+    if not RATE_LIMIT_ENABLED:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+# -------------------------
+# RELANCES
+# -------------------------
+
+def is_transient_error(error: Exception) -> bool:
+    import anthropic  # import différé : le SDK n'est chargé que si un appel échoue
+
+    if isinstance(error, anthropic.APIConnectionError):  # inclut APITimeoutError
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in TRANSIENT_STATUS_CODES
+
+
+def _retry_reason(error: Exception) -> str:
+    import anthropic
+
+    if isinstance(error, anthropic.APITimeoutError):
+        return "timeout"
+    if isinstance(error, anthropic.APIConnectionError):
+        return "connection"
+    return {429: "rate_limit", 529: "overloaded"}.get(error.status_code, "server_error")
+
+
+def _retry_after(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:  # date HTTP : on retombe sur le backoff
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Backoff exponentiel à jitter complet ; au moins retry-after si l'API l'indique."""
+    backoff = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    retry_after = _retry_after(error)
+    if retry_after is None:
+        return backoff
+    # petit jitter au-dessus de retry-after pour ne pas relancer tous les threads au même instant
+    return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+
+
+def _should_retry(error: Exception, attempt: int, max_retries: int) -> float | None:
+    """Délai avant la prochaine tentative, ou None s'il faut abandonner."""
+    if attempt >= max_retries or not is_transient_error(error):
+        return None
+    delay = retry_delay(error, attempt)
+    CLAUDE_RETRIES.labels(reason=_retry_reason(error)).inc()
+    logger.warning(f"Erreur transitoire Claude ({error}), tentative {attempt + 2}/{max_retries + 1} dans {delay:.1f} s")
+    return delay
+
+
+def call_with_retries(send, input_tokens: int, output_tokens: int, limiter: RateLimiter = None,
+                      max_retries: int = None):
+    """Appelle send() (un messages.create) en respectant les plafonds et en relançant les erreurs transitoires."""
+    limiter = limiter or get_rate_limiter()
+    max_retries = CLAUDE_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(input_tokens, output_tokens)
+        try:
+            response = send()
+        except Exception as e:
+            delay = _should_retry(e, attempt, max_retries)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter:
+            limiter.settle(output_tokens, getattr(response, "usage", None))
+        return response
+
+
+async def async_call_with_retries(send, input_tokens: int, output_tokens: int, limiter: RateLimiter = None,
+                                  max_retries: int = None):
+    """Version asynchrone de call_with_retries (send renvoie une coroutine)."""
+    limiter = limiter or get_rate_limiter()
+    max_retries = CLAUDE_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.acquire_async(input_tokens, output_tokens)
+        try:
+            response = await send()
+        except Exception as e:
+            delay = _should_retry(e, attempt, max_retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if limiter:
+            limiter.settle(output_tokens, getattr(response, "usage", None))
+        return response
@@ -0,0 +1,296 @@
+"""Enregistrement et rejeu des échanges avec l'API Claude (cassettes), pour mesurer le pipeline hors ligne.
+
+En enregistrement, chaque requête HTTP envoyée par le SDK est transmise à l'API et la réponse est
+sauvegardée avec sa latence réelle. En rejeu, les réponses sont servies depuis la cassette, sans
+réseau ni clé API, avec au choix : aucune latence, la latence enregistrée de chaque réponse, ou des
+latences tirées (graine fixe) dans la distribution enregistrée.
+
+Une cassette est un fichier JSONL gzippé : une ligne d'en-tête (version, verbatims éventuels) puis
+une ligne par échange. La clé d'un échange est le hash du chemin et du corps JSON canonique.
+
+L'enregistrement et le rejeu court-circuitent le cache persistant des réponses : sinon les verbatims
+déjà en cache ne passeraient pas par le transport et manqueraient à la cassette.
+
+Usage :
+    python -m api.replay record cassette.jsonl.gz AAAA-MM-JJ           # classification seule, sans écriture
+    python -m api.replay record cassette.jsonl.gz AAAA-MM-JJ --write   # run_analysis réel (écrit dans BigQuery)
+    python -m api.replay bench cassette.jsonl.gz --latency recorded --concurrency 8
+"""
+import argparse, asyncio, gzip, hashlib, json, random, threading, time
+from contextlib import contextmanager
+import httpx
+
+CASSETTE_VERSION = 1
+LATENCY_MODES = ("none", "recorded", "sampled")
+# En-têtes de réponse conservés (les autres n'influencent pas le SDK)
+_KEPT_HEADERS = ("content-type", "request-id", "retry-after")
+
+
+def request_key(request: httpx.Request) -> str:
+    """Clé d'un échange : méthode, chemin et corps JSON canonique (ordre des clés indifférent)."""
+    body = request.content or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        pass
+    return hashlib.sha256(request.method.encode() + b" " + request.url.path.encode() + b"\n" + body).hexdigest()
+
+
+class Cassette:
+    """Échanges enregistrés, regroupés par clé (plusieurs réponses possibles pour une même requête)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta = {"version": CASSETTE_VERSION}
+        self.entries = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            cassette.meta = json.loads(f.readline())
+            for line in f:
+                entry = json.loads(line)
+                cassette.entries.setdefault(entry["key"], []).append(entry)
+        return cassette
+
+    def save(self):
+        with self._lock, gzip.open(self.path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(self.meta, ensure_ascii=False) + "\n")
+            for entries in self.entries.values():
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def add(self, key: str, entry: dict):
+        with self._lock:
+            self.entries.setdefault(key, []).append({"key": key, **entry})
+
+    def next_entry(self, key: str) -> dict | None:
+        """Réponses d'une même clé servies à tour de rôle, dans l'ordre d'enregistrement (déterministe)."""
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def latencies(self) -> list[float]:
+        return [e["latency"] for entries in self.entries.values() for e in entries]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+
+def _to_response(entry: dict, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"].encode("utf-8"),
+                          request=request)
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Transmet les requêtes au réseau et enregistre chaque réponse (corps complet) et sa latence."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._sync = httpx.HTTPTransport()
+        self._async = httpx.AsyncHTTPTransport()
+
+    def _record(self, request: httpx.Request, response: httpx.Response, latency: float):
+        headers = {k: v for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS}
+        self.cassette.add(request_key(request), {
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "headers": headers,
+            "body": response.content.decode("utf-8"),
+            "latency": round(latency, 4),
+        })
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.time()
+        response = self._sync.handle_request(request)
+        response.read()
+        self._record(request, response, time.time() - start)
+        return _to_response(self.cassette.entries[request_key(request)][-1], request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.time()
+        response = await self._async.handle_async_request(request)
+        await response.aread()
+        self._record(request, response, time.time() - start)
+        return _to_response(self.cassette.entries[request_key(request)][-1], request)
+
+    def close(self):
+        self._sync.close()
+
+    async def aclose(self):
+        await self._async.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Sert les réponses d'une cassette. latency : "none", "recorded" ou "sampled" (distribution enregistrée)."""
+
+    def __init__(self, cassette: Cassette, latency: str = "none", speed: float = 1.0, seed: int = 0):
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Mode de latence inconnu : {latency} (attendu : {', '.join(LATENCY_MODES)})")
+        self.cassette = cassette
+        self.latency = latency
+        self.speed = speed
+        self._random = random.Random(seed)
+        self._pool = cassette.latencies()
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def _delay(self, entry: dict) -> float:
+        if self.latency == "recorded":
+            return entry["latency"] / self.speed
+        if self.latency == "sampled" and self._pool:
+            with self._lock:
+                return self._random.choice(self._pool) / self.speed
+        return 0.0
+
+    def _lookup(self, request: httpx.Request) -> tuple[httpx.Response, float]:
+        entry = self.cassette.next_entry(request_key(request))
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            error = {"type": "error", "error": {"type": "not_found_error",
+                                                "message": f"Aucun enregistrement pour {request.url.path}"}}
+            return httpx.Response(404, json=error, request=request), 0.0
+        return _to_response(entry, request), self._delay(entry)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._lookup(request)
+        time.sleep(delay)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._lookup(request)
+        await asyncio.sleep(delay)
+        return response
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay", latency: str = "none", speed: float = 1.0, seed: int = 0):
+    """Branche les clients Claude (synchrone et asynchrone) sur une cassette le temps du bloc.
+    mode="record" sauvegarde la cassette en sortie de bloc."""
+    from api import claude_interface
+
+    if mode == "record":
+        cassette = Cassette(path)
+        transport = RecordingTransport(cassette)
+    elif mode == "replay":
+        cassette = Cassette.load(path)
+        transport = ReplayTransport(cassette, latency=latency, speed=speed, seed=seed)
+    else:
+        raise ValueError(f"Mode de cassette inconnu : {mode} (attendu : record, replay)")
+
+    claude_interface.set_http_transport(transport)
+    try:
+        yield cassette
+    finally:
+        claude_interface.set_http_transport(None)
+        if mode == "record":
+            cassette.save()
+            print(f"📼 Cassette {path} enregistrée : {len(cassette)} échanges")
+
+
+@contextmanager
+def response_cache_disabled():
+    """Court-circuite le cache persistant des réponses le temps du bloc : chaque verbatim passe par le transport."""
+    from api import response_cache
+
+    cache_enabled = response_cache.RESPONSE_CACHE_ENABLED
+    response_cache.RESPONSE_CACHE_ENABLED = False
+    try:
+        yield
+    finally:
+        response_cache.RESPONSE_CACHE_ENABLED = cache_enabled
+
+
+def _classify_all(verbatims: list[dict], concurrency: int = 1) -> list[dict]:
+    from api import claude_interface
+
+    if concurrency > 1:
+        return claude_interface.classify_many(
+            [v["content"] for v in verbatims], concurrency=concurrency,
+            ratings=[v.get("rating") for v in verbatims],
+        )
+    outcomes = []
+    for v in verbatims:
+        try:
+            outcomes.append({"themes": claude_interface.classify_with_claude(v["content"], rating=v.get("rating")),
+                             "error": None})
+        except Exception as e:
+            outcomes.append({"themes": None, "error": e})
+    return outcomes
+
+
+def record_analysis(path: str, scrape_date: str, write: bool = False):
+    """Enregistre une cassette pour les verbatims d'une date.
+    Par défaut, les verbatims sont seulement classifiés : rien n'est écrit dans BigQuery.
+    write=True exécute run_analysis tel quel, qui insère dans topic_analysis et met à jour les agrégats."""
+    from api.analyze_and_insert import run_analysis
+    from api.bq_connect import get_verbatims_by_date
+
+    with response_cache_disabled(), use_cassette(path, mode="record") as cassette:
+        verbatims = get_verbatims_by_date(scrape_date)
+        cassette.meta["verbatims"] = verbatims
+        if write:
+            run_analysis(scrape_date)
+        else:
+            _classify_all(verbatims)
+
+
+def benchmark_replay(path: str, verbatims: list[dict] | None = None, concurrency: int = 1,
+                     latency: str = "recorded", speed: float = 1.0, seed: int = 0) -> dict:
+    """Rejoue la classification des verbatims de la cassette (ou de verbatims fournis) et mesure le débit.
+    Le cache persistant des réponses est court-circuité pour que chaque verbatim passe par le transport."""
+    with response_cache_disabled(), use_cassette(path, latency=latency, speed=speed, seed=seed) as cassette:
+        verbatims = verbatims if verbatims is not None else cassette.meta.get("verbatims", [])
+        start = time.time()
+        outcomes = _classify_all(verbatims, concurrency)
+        elapsed = time.time() - start
+
+    report = {
+        "verbatims": len(verbatims),
+        "errors": sum(1 for o in outcomes if o["error"]),
+        "duration": round(elapsed, 3),
+        "verbatims_per_second": round(len(verbatims) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": latency,
+        "concurrency": concurrency,
+    }
+    print(f"Rejeu de {path} : {report['verbatims']} verbatims en {report['duration']} s "
+          f"({report['verbatims_per_second']} verbatims/s, {report['errors']} erreurs)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enregistrement / rejeu des appels Claude")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record = sub.add_parser("record", help="Classifie les verbatims d'une date en enregistrant les échanges")
+    record.add_argument("cassette")
+    record.add_argument("scrape_date")
+    record.add_argument("--write", action="store_true",
+                        help="Exécute run_analysis complet (insère dans topic_analysis et met à jour les agrégats)")
+
+    bench = sub.add_parser("bench", help="Rejoue une cassette et mesure le débit de classification")
+    bench.add_argument("cassette")
+    bench.add_argument("--latency", choices=LATENCY_MODES, default="recorded")
+    bench.add_argument("--speed", type=float, default=1.0, help="Facteur d'accélération des latences")
+    bench.add_argument("--concurrency", type=int, default=1)
+    bench.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_analysis(args.cassette, args.scrape_date, write=args.write)
+    else:
+        benchmark_replay(args.cassette, concurrency=args.concurrency, latency=args.latency,
+                         speed=args.speed, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
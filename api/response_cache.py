@@ -0,0 +1,104 @@
+"""Cache persistant (SQLite) des réponses Claude validées.
+
+Clé = hash du verbatim normalisé et de la version du prompt (hash des paramètres de la requête :
+modèle, température, consignes, thèmes). Modifier les thèmes ou le prompt change la clé : les
+anciennes entrées ne sont plus jamais lues et finissent évincées (LRU, taille bornée).
+"""
+import hashlib, json, os, sqlite3, sys, threading, time, unicodedata
+from monitoring.metrics import CLAUDE_RESPONSE_CACHE
+
+RESPONSE_CACHE_PATH = os.getenv("CLAUDE_RESPONSE_CACHE_PATH", "/tmp/trustpilot_claude_cache.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("CLAUDE_RESPONSE_CACHE_MAX_ENTRIES", "100000"))
+# Désactivé par défaut sous pytest : les tests mockent l'API et ne doivent pas partager de réponses
+RESPONSE_CACHE_ENABLED = os.getenv("CLAUDE_RESPONSE_CACHE", "0" if "pytest" in sys.modules else "1") == "1"
+
+# Valeur renvoyée par get() en l'absence d'entrée (None est une réponse valide : aucun thème)
+MISS = object()
+
+
+def normalize_verbatim(verbatim: str) -> str:
+    """Forme canonique du texte : Unicode NFC, espaces consécutifs réduits, bords supprimés."""
+    return " ".join(unicodedata.normalize("NFC", verbatim or "").split())
+
+
+def make_cache_key(verbatim: str, prompt_version: str) -> str:
+    payload = f"{prompt_version}\n{normalize_verbatim(verbatim)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Table clé -> thèmes validés (JSON), évincée par date de dernier accès au-delà de max_entries."""
+
+    def __init__(self, path: str = None, max_entries: int = None):
+        self.path = path or RESPONSE_CACHE_PATH
+        self.max_entries = max_entries or RESPONSE_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, themes TEXT, created_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Thèmes en cache pour cette clé, ou MISS."""
+        with self._lock:
+            row = self._conn.execute("SELECT themes FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                CLAUDE_RESPONSE_CACHE.labels(result="miss").inc()
+                return MISS
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        CLAUDE_RESPONSE_CACHE.labels(result="hit").inc()
+        return json.loads(row[0])
+
+    def put(self, key: str, themes: list[dict] | None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, themes, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(themes, ensure_ascii=False), now, now),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                CLAUDE_RESPONSE_CACHE.labels(result="evicted").inc(excess)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Cache partagé du processus (ouvert au premier usage), ou None s'il est désactivé ou inutilisable."""
+    global _cache, RESPONSE_CACHE_ENABLED
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache()
+            except sqlite3.Error as e:
+                print(f"Cache des réponses Claude indisponible ({RESPONSE_CACHE_PATH}) : {e}")
+                RESPONSE_CACHE_ENABLED = False
+                return None
+        return _cache
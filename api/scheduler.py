@@ -0,0 +1,172 @@
+"""Ordonnancement de l'analyse d'une date sous contrainte de temps et de budget de tokens.
+
+Les avis sont traités par priorité décroissante (ANALYSIS_PRIORITY, par défaut : note la plus basse
+d'abord, puis avis les plus longs) plutôt que dans l'ordre de la requête BigQuery. Avant chaque avis,
+l'ordonnanceur vérifie qu'il reste assez de temps avant l'échéance (durée moyenne observée × marge,
+plus une réserve pour les insertions et agrégats de fin) et assez de tokens dans le budget. Sinon,
+l'analyse s'arrête et les avis restants sont écrits dans un enregistrement de continuation, repris
+par l'exécution suivante de la même date et du même mode : ses avis passent en tête, dans l'ordre
+enregistré, avant les autres avis par priorité. Un arrêt par timeout ne perd que les avis les moins
+prioritaires ; une exécution qui va au bout supprime l'enregistrement.
+"""
+import json, os, threading, time
+from api.checkpoint import DEFAULT_CHECKPOINT_DIR
+from api.claude_interface import EXPECTED_OUTPUT_TOKENS, build_request, estimate_request_tokens
+
+ANALYSIS_PRIORITY = os.getenv("ANALYSIS_PRIORITY", "rating,length")
+# Échéance (s depuis le début de l'analyse) et budget de tokens par exécution (0 = pas de limite)
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "0"))
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "0"))
+# Marge sur la durée moyenne d'un avis, et temps gardé pour la fin du traitement
+DEADLINE_MARGIN = float(os.getenv("ANALYSIS_DEADLINE_MARGIN", "1.5"))
+DEADLINE_RESERVE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_RESERVE_SECONDS", "10"))
+ANALYSIS_CONTINUATION_DIR = os.getenv("ANALYSIS_CONTINUATION_DIR", DEFAULT_CHECKPOINT_DIR)
+
+# Critères de priorité : clé de tri croissante (la plus petite passe en premier)
+PRIORITY_KEYS = {
+    "rating": lambda v: v.get("rating") if v.get("rating") is not None else 6,  # note inconnue en dernier
+    "length": lambda v: -len(v.get("content") or ""),
+}
+
+
+def priority_key(criteria: str | None = None):
+    """Clé de tri des verbatims pour une liste de critères séparés par des virgules ("" = ordre d'origine)."""
+    names = [name.strip() for name in (ANALYSIS_PRIORITY if criteria is None else criteria).split(",") if name.strip()]
+    unknown = [name for name in names if name not in PRIORITY_KEYS]
+    if unknown:
+        raise ValueError(f"Critère de priorité inconnu : {', '.join(unknown)} (attendu : {', '.join(PRIORITY_KEYS)})")
+    keys = [PRIORITY_KEYS[name] for name in names]
+    return lambda v: tuple(key(v) for key in keys)
+
+
+def estimate_review_tokens(verbatim: str) -> int:
+    """Tokens estimés pour classifier un verbatim (requête + réponse prévue)."""
+    return estimate_request_tokens(build_request(verbatim)) + EXPECTED_OUTPUT_TOKENS
+
+
+class AnalysisScheduler:
+    """Ordre de traitement et admission des avis selon l'échéance et le budget de tokens."""
+
+    def __init__(self, deadline_seconds: float = None, token_budget: int = None, criteria: str | None = None,
+                 margin: float = None, reserve_seconds: float = None, clock=time.monotonic):
+        self.clock = clock
+        self.start = clock()
+        deadline_seconds = ANALYSIS_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        self.deadline = self.start + deadline_seconds if deadline_seconds > 0 else None
+        self.token_budget = ANALYSIS_TOKEN_BUDGET if token_budget is None else token_budget
+        self.key = priority_key(criteria)
+        self.margin = DEADLINE_MARGIN if margin is None else margin
+        self.reserve_seconds = DEADLINE_RESERVE_SECONDS if reserve_seconds is None else reserve_seconds
+        self.tokens_reserved = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.stop_reason = None
+        self.resumed = {}  # review_id -> rang dans l'enregistrement de continuation repris
+        self._lock = threading.Lock()
+
+    def resume(self, continuation: dict | None):
+        """Avis reportés par l'exécution précédente, à traiter en premier."""
+        if continuation:
+            self.resumed = {review_id: i for i, review_id in enumerate(continuation["review_ids"])}
+
+    def order(self, verbatims: list[dict]) -> list[dict]:
+        resumed = sorted((v for v in verbatims if v["review_id"] in self.resumed),
+                         key=lambda v: self.resumed[v["review_id"]])
+        others = [v for v in verbatims if v["review_id"] not in self.resumed]
+        return resumed + sorted(others, key=self.key)  # tri stable : ordre d'origine à priorité égale
+
+    def expected_duration(self) -> float:
+        return self.busy_seconds / self.completed * self.margin if self.completed else 0.0
+
+    def _deadline_reached(self) -> bool:
+        if self.deadline is None:
+            return False
+        remaining = self.deadline - self.clock()
+        if remaining - self.reserve_seconds < self.expected_duration():
+            self.stop_reason = "deadline"
+            return True
+        return False
+
+    def remaining_seconds(self) -> float | None:
+        """Temps restant avant l'échéance, réserve de fin déduite (None : pas d'échéance)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.clock() - self.reserve_seconds)
+
+    def stop(self, reason: str):
+        """Arrête les admissions (ex : lot annulé à l'échéance) ; garde le premier motif d'arrêt."""
+        with self._lock:
+            self.stop_reason = self.stop_reason or reason
+
+    def has_time(self) -> bool:
+        """Assez de temps avant l'échéance pour une étape de plus (sans réserver de tokens)."""
+        with self._lock:
+            return self.stop_reason != "deadline" and not self._deadline_reached()
+
+    def admit(self, verbatim: dict) -> bool:
+        """Réserve le coût estimé de l'avis ; False (et stop_reason) si l'échéance ou le budget ne le permet pas."""
+        with self._lock:
+            if self.stop_reason or self._deadline_reached():
+                return False
+            if self.token_budget > 0:
+                tokens = estimate_review_tokens(verbatim["content"])
+                if self.tokens_reserved + tokens > self.token_budget:
+                    self.stop_reason = "token_budget"
+                    return False
+                self.tokens_reserved += tokens
+            return True
+
+    def record(self, duration: float):
+        """Durée de traitement d'un avis admis (sert à prévoir celle des suivants)."""
+        with self._lock:
+            self.completed += 1
+            self.busy_seconds += duration
+
+    def split(self, verbatims: list[dict]) -> tuple[list[dict], list[dict]]:
+        """Avis admis et avis reportés, pour le mode batch qui soumet tout le lot d'un coup."""
+        ordered = self.order(verbatims)
+        for i, v in enumerate(ordered):
+            if not self.admit(v):
+                return ordered[:i], ordered[i:]
+        return ordered, []
+
+
+def continuation_path(scrape_date: str, mode: str, directory: str | None = None) -> str:
+    return os.path.join(directory or ANALYSIS_CONTINUATION_DIR, f"continuation_{scrape_date}_{mode}.json")
+
+
+def write_continuation(scrape_date: str, mode: str, remaining: list[dict], reason: str,
+                       directory: str | None = None) -> str:
+    """Enregistre les avis non traités (dans l'ordre de priorité) pour l'exécution suivante ; renvoie le chemin."""
+    path = continuation_path(scrape_date, mode, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {
+        "scrape_date": scrape_date,
+        "mode": mode,
+        "reason": reason,
+        "created_at": time.time(),
+        "review_ids": [v["review_id"] for v in remaining],
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"⏸️ Analyse interrompue ({reason}) : {len(remaining)} avis reportés dans {path}")
+    return path
+
+
+def load_continuation(scrape_date: str, mode: str, directory: str | None = None) -> dict | None:
+    """Enregistrement de continuation laissé par une exécution précédente, ou None."""
+    try:
+        with open(continuation_path(scrape_date, mode, directory), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def clear_continuation(scrape_date: str, mode: str, directory: str | None = None):
+    """Supprime l'enregistrement de continuation une fois tous ses avis traités."""
+    try:
+        os.remove(continuation_path(scrape_date, mode, directory))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,91 @@
+"""Mode streaming : lecture incrémentale de la réponse Claude avec complétion anticipée du JSON.
+
+Le texte est lu au fil des deltas ; dès que l'objet JSON { "themes": ... } est syntaxiquement
+complet, le flux est fermé sans attendre les tokens de fin (balise ```, retour à la ligne...).
+Les délais avant le premier token et avant un JSON complet sont exportés dans Prometheus.
+"""
+import time
+from monitoring.metrics import CLAUDE_TIME_TO_FIRST_TOKEN, CLAUDE_TIME_TO_VALID_JSON, record_claude_call
+
+
+class JsonObjectScanner:
+    """Repère, au fil des morceaux reçus, la fin du premier objet JSON de premier niveau."""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> str | None:
+        """Ajoute chunk ; renvoie le texte de l'objet JSON dès qu'il est complet, sinon None."""
+        self.buffer += chunk
+        while self._pos < len(self.buffer):
+            char = self.buffer[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if char == "{":
+                    self._start, self._depth = self._pos - 1, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return self.buffer[self._start:self._pos]
+        return None
+
+
+def _record_stream_call(stream, model: str, start: float):
+    # Instantané du message reçu jusqu'ici : l'usage d'entrée (cache de prompt compris) est connu dès
+    # message_start ; après une fermeture anticipée, les tokens de sortie et le motif d'arrêt sont partiels
+    record_claude_call(model, getattr(stream, "current_message_snapshot", None), time.time() - start)
+
+
+def stream_json_text(client, request: dict) -> str:
+    """Envoie la requête en streaming et renvoie le JSON dès qu'il est complet (le texte entier sinon)."""
+    start = time.time()
+    scanner = JsonObjectScanner()
+    first_token = True
+    with client.messages.stream(**request) as stream:
+        for text in stream.text_stream:
+            if first_token:
+                CLAUDE_TIME_TO_FIRST_TOKEN.observe(time.time() - start)
+                first_token = False
+            completed = scanner.feed(text)
+            if completed is not None:
+                CLAUDE_TIME_TO_VALID_JSON.observe(time.time() - start)
+                _record_stream_call(stream, request["model"], start)
+                return completed  # la sortie du with ferme la connexion sans lire la suite
+        _record_stream_call(stream, request["model"], start)
+    return scanner.buffer
+
+
+async def stream_json_text_async(async_client, request: dict) -> str:
+    """Version asynchrone de stream_json_text."""
+    start = time.time()
+    scanner = JsonObjectScanner()
+    first_token = True
+    async with async_client.messages.stream(**request) as stream:
+        async for text in stream.text_stream:
+            if first_token:
+                CLAUDE_TIME_TO_FIRST_TOKEN.observe(time.time() - start)
+                first_token = False
+            completed = scanner.feed(text)
+            if completed is not None:
+                CLAUDE_TIME_TO_VALID_JSON.observe(time.time() - start)
+                _record_stream_call(stream, request["model"], start)
+                return completed
+        _record_stream_call(stream, request["model"], start)
+    return scanner.buffer
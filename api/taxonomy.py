@@ -0,0 +1,194 @@
+"""Référentiel unique des thèmes d'analyse.
+
+La table `topics` est chargée une seule fois puis gardée en cache (mémoire + disque) pendant
+TAXONOMY_TTL_SECONDS. Le bloc de thèmes du prompt, l'ensemble des labels utilisé par le
+validateur et l'index label_to_id sont tous compilés à partir de ce même chargement.
+"""
+import json, os, threading, time
+
+TOPICS_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.topics"
+TAXONOMY_TTL_SECONDS = int(os.getenv("TAXONOMY_TTL_SECONDS", "86400"))
+TAXONOMY_CACHE_PATH = os.getenv("TAXONOMY_CACHE_PATH", "/tmp/trustpilot_topics_cache.json")
+# Si BigQuery est injoignable, on réessaie au plus tard après ce délai
+FALLBACK_RETRY_SECONDS = 60
+
+# Thèmes par défaut : descriptions utilisées quand la table topics n'en fournit pas,
+# et référentiel de secours (sans topic_id) si la table est injoignable
+DEFAULT_THEMES = [
+    {
+        "nom": "Prix et promotions",
+        "description": "Rapport qualité/prix, remises, offres promotionnelles, transparence tarifaire, publicité mensongère"
+    },
+    {
+        "nom": "Livraison et retrait",
+        "description": "Délais de livraison, suivi de colis, retrait en magasin, produits manquants ou perdus"
+    },
+    {
+        "nom": "Retour et remboursement",
+        "description": "Conditions de retour, reprise du matériel, facilité de remboursement, rapidité, gestes commerciaux"
+    },
+    {
+        "nom": "Qualité des produits",
+        "description": "Matériaux défectueux, mauvais état à la réception, problème de conformité"
+    },
+    {
+        "nom": "Service client / SAV",
+        "description": "Réactivité, efficacité, écoute, résolution des problèmes après achat par le personnel, appels non pris en compte, délais de réponse trop longs"
+    },
+    {
+        "nom": "Expérience d'achat en ligne",
+        "description": "Facilité d'utilisation du site, ergonomie, informations produits, expérience d'achat numérique"
+    },
+    {
+        "nom": "Expérience d'achat en magasin",
+        "description": "Accueil, conseils du personnel, accompagnement, attente en caisse"
+    },
+    {
+        "nom": "Suivi de projet / travaux sur mesure",
+        "description": "Coordination de projets longs ou personnalisés, accompagnement des chantiers, suivi des travaux"
+    },
+    {
+        "nom": "Qualité de la communication",
+        "description": "Précision dans les conditions ou offres, communication claire, transparence dans les réponses, confusion dans les messages, conditions opaques"
+    },
+    {
+        "nom": "Programme fidélité",
+        "description": "Avantages exclusifs, points de fidélité, offres réservées aux membres"
+    }
+]
+
+_lock = threading.Lock()
+_cache = {"taxonomy": None, "expires_at": 0.0}
+
+
+def fetch_topics_from_bq() -> list[dict]:
+    """Lit la table topics. Renvoie une liste de {topic_id, topic_label, description}."""
+    from google.cloud import bigquery
+    from api.analyze_and_insert import get_project_id  # import local : analyze_and_insert importe ce module
+
+    client = bigquery.Client(project=get_project_id())
+    query = f"SELECT * FROM `{TOPICS_TABLE_ID}`"
+    topics = []
+    for row in client.query(query).result():
+        row = dict(row.items())
+        topics.append({
+            "topic_id": row["topic_id"],
+            "topic_label": row["topic_label"],
+            "description": row.get("topic_description") or row.get("description"),
+        })
+    return topics
+
+
+def format_theme_block(themes: list[dict]) -> str:
+    """Liste « - nom : description » insérée dans le prompt."""
+    return "\n".join(f'- {t["nom"]} : {t["description"]}' for t in themes)
+
+
+def compile_taxonomy(topics: list[dict], source: str, loaded_at: float) -> dict:
+    """Construit, à partir d'un seul chargement, tout ce qu'utilisent le prompt, le validateur et l'insertion."""
+    default_descriptions = {t["nom"]: t["description"] for t in DEFAULT_THEMES}
+    themes = [
+        {
+            "nom": t["topic_label"],
+            "description": t.get("description") or default_descriptions.get(t["topic_label"], ""),
+            "topic_id": t.get("topic_id"),
+        }
+        for t in topics
+    ]
+    return {
+        "source": source,
+        "loaded_at": loaded_at,
+        "themes": themes,
+        "theme_block": format_theme_block(themes),
+        "labels": frozenset(t["nom"] for t in themes),
+        "label_to_id": {t["nom"]: t["topic_id"] for t in themes if t["topic_id"] is not None},
+    }
+
+
+def _read_disk_cache() -> dict | None:
+    try:
+        with open(TAXONOMY_CACHE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data.get("topics"), list) else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_disk_cache(topics: list[dict], loaded_at: float):
+    tmp_path = f"{TAXONOMY_CACHE_PATH}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"loaded_at": loaded_at, "topics": topics}, f, ensure_ascii=False)
+        os.replace(tmp_path, TAXONOMY_CACHE_PATH)
+    except OSError as e:
+        print(f"Impossible d'écrire le cache des thèmes {TAXONOMY_CACHE_PATH} : {e}")
+
+
+def _load() -> tuple[dict, float]:
+    """Charge le référentiel (disque si frais, sinon BigQuery) et renvoie (taxonomie, date d'expiration)."""
+    now = time.time()
+    cached = _read_disk_cache()
+    if cached and now - cached.get("loaded_at", 0) < TAXONOMY_TTL_SECONDS:
+        loaded_at = cached["loaded_at"]
+        return compile_taxonomy(cached["topics"], "disk", loaded_at), loaded_at + TAXONOMY_TTL_SECONDS
+
+    try:
+        topics = fetch_topics_from_bq()
+        if not topics:
+            raise ValueError(f"La table {TOPICS_TABLE_ID} est vide")
+        _write_disk_cache(topics, now)
+        print(f"Référentiel des thèmes chargé depuis BigQuery : {len(topics)} thèmes")
+        return compile_taxonomy(topics, "bigquery", now), now + TAXONOMY_TTL_SECONDS
+    except Exception as e:
+        print(f"Impossible de charger la table {TOPICS_TABLE_ID} : {e}")
+
+    if cached:
+        print("Utilisation du cache disque expiré des thèmes.")
+        return compile_taxonomy(cached["topics"], "disk", cached.get("loaded_at", 0)), now + FALLBACK_RETRY_SECONDS
+
+    print("Utilisation des thèmes par défaut (sans topic_id).")
+    topics = [{"topic_id": None, "topic_label": t["nom"], "description": t["description"]} for t in DEFAULT_THEMES]
+    return compile_taxonomy(topics, "default", now), now + FALLBACK_RETRY_SECONDS
+
+
+def get_taxonomy(force_refresh: bool = False) -> dict:
+    """Renvoie le référentiel compilé, rechargé uniquement à l'expiration du TTL."""
+    with _lock:
+        if force_refresh or _cache["taxonomy"] is None or time.time() >= _cache["expires_at"]:
+            if force_refresh:
+                invalidate_disk_cache()
+            _cache["taxonomy"], _cache["expires_at"] = _load()
+        return _cache["taxonomy"]
+
+
+def invalidate_disk_cache():
+    try:
+        os.remove(TAXONOMY_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def clear_taxonomy_cache():
+    """Vide le cache mémoire (le prochain accès relit le disque ou BigQuery)."""
+    with _lock:
+        _cache["taxonomy"] = None
+        _cache["expires_at"] = 0.0
+
+
+def get_themes() -> list[dict]:
+    return get_taxonomy()["themes"]
+
+
+def get_theme_block() -> str:
+    return get_taxonomy()["theme_block"]
+
+
+def get_theme_labels() -> frozenset:
+    return get_taxonomy()["labels"]
+
+
+def get_label_to_id() -> dict:
+    taxonomy = get_taxonomy()
+    if not taxonomy["label_to_id"]:
+        raise RuntimeError(f"Aucun topic_id disponible : la table {TOPICS_TABLE_ID} n'a pas pu être chargée.")
+    return taxonomy["label_to_id"]
@@ -0,0 +1,144 @@
+"""Pré-sélection locale des thèmes candidats d'un avis (lexiques par thème).
+
+Le message utilisateur liste alors les thèmes dont au moins un mot-clé apparaît dans l'avis ; le bloc
+system, mis en cache, garde le référentiel complet et ses descriptions. Un thème absent du lexique
+(ajouté dans la table topics) est toujours proposé ; si aucun thème ne ressort, aucune restriction.
+
+Activation : CLAUDE_THEME_PRESELECTION=1, après mesure du rappel sur un jeu tenu à l'écart :
+    python -m api.theme_preselector AAAA-MM-JJ AAAA-MM-JJ
+"""
+import argparse, hashlib, json, os, re, unicodedata
+from api.prompt_utils import estimate_tokens
+from api.taxonomy import format_theme_block, get_themes
+
+THEME_PRESELECTION_ENABLED = os.getenv("CLAUDE_THEME_PRESELECTION", "0") == "1"
+
+# Expressions recherchées dans le texte mis en minuscules et sans accents
+THEME_KEYWORDS = {
+    "Prix et promotions": [
+        r"\bprix\b", r"\bcher", r"\btarif", r"\bpromo", r"\bremise", r"\breduc", r"\bsolde", r"\boffre",
+        r"\bcout", r"\beconomi", r"\bpublicite", r"\bmoins cher", r"€", r"\beuros?\b",
+    ],
+    "Livraison et retrait": [
+        r"\blivr", r"\bcolis", r"\btransporteur", r"\bexpedi", r"\bretrait", r"\bretire", r"\bdrive\b",
+        r"click ?(and|&|et) ?collect", r"\bdelai", r"\bretard", r"\barriv", r"\breception", r"\brecu\b",
+        r"\bmanquant", r"\bperdu", r"\bsuivi (du|de la|de) (colis|commande)", r"\bchronopost", r"\bcolissimo",
+    ],
+    "Retour et remboursement": [
+        r"\bretour", r"\brembours", r"\brenvo", r"\breprise", r"\breprendre", r"\bun avoir\b",
+        r"\bechange", r"\bannul", r"\bgeste commercial",
+    ],
+    "Qualité des produits": [
+        r"\bqualite", r"\bdefectu", r"\bdefaut", r"\bcasse", r"\babime", r"\ben panne", r"\bfragile",
+        r"\bconforme", r"\bfonctionne (pas|plus)", r"\bmarche (pas|plus)", r"\bsolide", r"\bproduit",
+        r"\bmateri", r"\braye",
+    ],
+    "Service client / SAV": [
+        r"\bservice client", r"\bsav\b", r"\bapres[- ]vente", r"\bconseill", r"\bhotline", r"\btelephon",
+        r"\bappel", r"\bjoindre", r"\binjoignable", r"\bmail", r"\brepon", r"\brecla", r"\bplainte",
+    ],
+    "Expérience d'achat en ligne": [
+        r"\bsite\b", r"\ben ligne", r"\binternet", r"\bappli", r"\bweb\b", r"\bpanier", r"\bpaiement",
+        r"\bnavigation", r"\bbug", r"\bcommande", r"\bcommander",
+    ],
+    "Expérience d'achat en magasin": [
+        r"\bmagasin", r"\bcaisse", r"\bvendeu", r"\brayon", r"\bpersonnel", r"\baccueil", r"\bboutique",
+        r"\bhotesse", r"\bparking",
+    ],
+    "Suivi de projet / travaux sur mesure": [
+        r"\bprojet", r"\btravaux", r"\bchantier", r"\bsur mesure", r"\bpose\b", r"\bposeur", r"\binstall",
+        r"\bcuisine", r"\bsalle de bain", r"\bartisan", r"\bdevis", r"\bmetreur", r"\bplan\b",
+    ],
+    "Qualité de la communication": [
+        r"\bcommunic", r"\binform", r"\bclair", r"\btransparen", r"\bmensong", r"\bconfus", r"\bexpliq",
+        r"\bexplication", r"\bprevenu", r"\bau courant", r"\bpromesse", r"\bpromis", r"\bcontradictoire",
+    ],
+    "Programme fidélité": [
+        r"\bfidel", r"\bcarte\b", r"\bpoints?\b", r"\bmembre", r"\bavantage", r"\bclub\b", r"\bcagnotte",
+    ],
+}
+
+_PATTERNS = {label: re.compile("|".join(keywords)) for label, keywords in THEME_KEYWORDS.items()}
+
+# Entre dans la clé du cache des réponses : modifier le lexique invalide les réponses pré-sélectionnées
+PRESELECTOR_VERSION = hashlib.sha256(json.dumps(THEME_KEYWORDS, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def preselect_themes(verbatim: str, themes: list[dict] | None = None) -> list[dict]:
+    """Thèmes candidats de l'avis (sous-liste du référentiel, dans son ordre)."""
+    themes = get_themes() if themes is None else themes
+    text = _normalize(verbatim)
+    candidates = [t for t in themes if t["nom"] not in _PATTERNS or _PATTERNS[t["nom"]].search(text)]
+    # Aucun mot-clé reconnu : on ne prend pas le risque d'écarter le bon thème
+    if not any(t["nom"] in _PATTERNS for t in candidates):
+        return themes
+    return candidates
+
+
+def evaluate_preselector(samples: list[dict]) -> dict:
+    """Rappel de la pré-sélection par rapport aux thèmes attribués avec le référentiel complet.
+    samples : [{"content": ..., "themes": [labels attribués par Claude]}]"""
+    themes = get_themes()
+    full_tokens = estimate_tokens(format_theme_block(themes))
+    found = expected = candidates = block_tokens = 0
+    per_theme = {}
+
+    for sample in samples:
+        selected = preselect_themes(sample["content"], themes)
+        selected_labels = {t["nom"] for t in selected}
+        candidates += len(selected)
+        block_tokens += estimate_tokens(format_theme_block(selected))
+        for label in sample["themes"]:
+            stats = per_theme.setdefault(label, {"expected": 0, "found": 0})
+            stats["expected"] += 1
+            expected += 1
+            if label in selected_labels:
+                stats["found"] += 1
+                found += 1
+
+    n = max(1, len(samples))
+    return {
+        "reviews": len(samples),
+        "recall": round(found / expected, 3) if expected else 1.0,
+        "recall_by_theme": {label: round(s["found"] / s["expected"], 3) for label, s in sorted(per_theme.items())},
+        "mean_candidates": round(candidates / n, 2),
+        "theme_block_tokens_full": full_tokens,
+        "theme_block_tokens_mean": round(block_tokens / n, 1),
+    }
+
+
+def fetch_labelled_reviews(start: str, end: str) -> list[dict]:
+    """Avis de la période [start, end] (date de scraping) avec les thèmes déjà attribués par Claude."""
+    from google.cloud import bigquery
+    from api.analysis_schema import CLAUDE_ROWS_FILTER
+
+    query = f"""
+        SELECT r.review_id, ANY_VALUE(r.content) AS content, ARRAY_AGG(t.topic_label) AS themes
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews` r
+        JOIN `trustpilot-satisfaction.reviews_dataset.topic_analysis` ta USING (review_id)
+        JOIN `trustpilot-satisfaction.reviews_dataset.topics` t ON CAST(t.topic_id AS STRING) = CAST(ta.topic_id AS STRING)
+        WHERE r.content IS NOT NULL AND r.scrape_date BETWEEN @start AND @end
+          AND {CLAUDE_ROWS_FILTER}
+        GROUP BY r.review_id
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("start", "DATE", start),
+        bigquery.ScalarQueryParameter("end", "DATE", end),
+    ])
+    rows = bigquery.Client().query(query, job_config=job_config).result()
+    return [{"review_id": row["review_id"], "content": row["content"], "themes": list(row["themes"])} for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rappel de la pré-sélection des thèmes sur des avis déjà classifiés")
+    parser.add_argument("start", help="Première date de scraping du jeu d'évaluation (AAAA-MM-JJ)")
+    parser.add_argument("end", help="Dernière date incluse (AAAA-MM-JJ)")
+    args = parser.parse_args()
+
+    report = evaluate_preselector(fetch_labelled_reviews(args.start, args.end))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
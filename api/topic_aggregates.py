@@ -0,0 +1,168 @@
+"""Agrégats quotidiens de sentiment par thème (table topic_sentiment_daily).
+
+Une cellule = (jour de publication de l'avis, topic_id) avec le nombre de mentions, la moyenne de
+score_0_1 et le nombre de mentions par label de sentiment. Les cellules sont recalculées depuis
+topic_analysis uniquement pour les (jour, thème) touchés par un lot d'analyse : le résultat reste
+exact en cas de relance, et les dashboards lisent une table compacte au lieu de la jointure brute.
+Seules les lignes Claude sont agrégées : les prédictions du classifieur local (source = "local") restent
+hors des chiffres des dashboards (voir api/analysis_schema.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from google.cloud import bigquery
+from api.analysis_schema import CLAUDE_ROWS_FILTER, TOPIC_ANALYSIS_TABLE_ID
+
+REVIEWS_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.reviews"
+AGGREGATE_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.topic_sentiment_daily"
+
+AGGREGATE_SCHEMA = [
+    bigquery.SchemaField("day", "DATE", mode="REQUIRED"),
+    bigquery.SchemaField("topic_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("nb_mentions", "INTEGER"),
+    bigquery.SchemaField("mean_score_0_1", "FLOAT"),
+    bigquery.SchemaField("nb_tres_negatif", "INTEGER"),
+    bigquery.SchemaField("nb_negatif", "INTEGER"),
+    bigquery.SchemaField("nb_neutre", "INTEGER"),
+    bigquery.SchemaField("nb_positif", "INTEGER"),
+    bigquery.SchemaField("nb_tres_positif", "INTEGER"),
+    bigquery.SchemaField("updated_at", "TIMESTAMP"),
+]
+
+# Agrégation des mentions brutes ; {cell_filter} restreint le calcul aux cellules concernées
+_AGGREGATE_SELECT = f"""
+    SELECT
+        r.publication_date AS day,
+        CAST(ta.topic_id AS STRING) AS topic_id,
+        COUNT(*) AS nb_mentions,
+        AVG(ta.score_0_1) AS mean_score_0_1,
+        COUNTIF(ta.label_sentiment = "Très négatif") AS nb_tres_negatif,
+        COUNTIF(ta.label_sentiment = "Négatif") AS nb_negatif,
+        COUNTIF(ta.label_sentiment = "Neutre") AS nb_neutre,
+        COUNTIF(ta.label_sentiment = "Positif") AS nb_positif,
+        COUNTIF(ta.label_sentiment = "Très positif") AS nb_tres_positif
+    FROM `{TOPIC_ANALYSIS_TABLE_ID}` ta
+    JOIN `{REVIEWS_TABLE_ID}` r USING (review_id)
+    WHERE r.publication_date IS NOT NULL AND {CLAUDE_ROWS_FILTER} AND {{cell_filter}}
+    GROUP BY day, topic_id
+"""
+
+_MERGE_TEMPLATE = f"""
+    MERGE `{AGGREGATE_TABLE_ID}` T
+    USING ({{source}}) S
+    ON T.day = S.day AND T.topic_id = S.topic_id
+    WHEN MATCHED THEN UPDATE SET
+        nb_mentions = S.nb_mentions,
+        mean_score_0_1 = S.mean_score_0_1,
+        nb_tres_negatif = S.nb_tres_negatif,
+        nb_negatif = S.nb_negatif,
+        nb_neutre = S.nb_neutre,
+        nb_positif = S.nb_positif,
+        nb_tres_positif = S.nb_tres_positif,
+        updated_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (
+        day, topic_id, nb_mentions, mean_score_0_1,
+        nb_tres_negatif, nb_negatif, nb_neutre, nb_positif, nb_tres_positif, updated_at
+    ) VALUES (
+        S.day, S.topic_id, S.nb_mentions, S.mean_score_0_1,
+        S.nb_tres_negatif, S.nb_negatif, S.nb_neutre, S.nb_positif, S.nb_tres_positif, CURRENT_TIMESTAMP()
+    )
+    {{extra_clause}}
+"""
+
+
+def ensure_aggregate_table(client):
+    """Crée la table d'agrégats (partitionnée par jour, clusterisée par thème) si elle n'existe pas."""
+    table = bigquery.Table(AGGREGATE_TABLE_ID, schema=AGGREGATE_SCHEMA)
+    table.time_partitioning = bigquery.TimePartitioning(field="day")
+    table.clustering_fields = ["topic_id"]
+    client.create_table(table, exists_ok=True)
+
+
+def refresh_topic_aggregates(review_ids: list[str], client=None) -> int:
+    """Met à jour uniquement les cellules (jour, thème) touchées par les avis analysés dans le lot.
+    Renvoie le nombre de cellules modifiées."""
+    review_ids = sorted(set(review_ids))
+    if not review_ids:
+        print("Aucun avis analysé : agrégats inchangés.")
+        return 0
+
+    client = client or bigquery.Client()
+    ensure_aggregate_table(client)
+
+    affected_cells = f"""
+        STRUCT(r.publication_date AS day, CAST(ta.topic_id AS STRING) AS topic_id) IN (
+            SELECT AS STRUCT r2.publication_date AS day, CAST(ta2.topic_id AS STRING) AS topic_id
+            FROM `{TOPIC_ANALYSIS_TABLE_ID}` ta2
+            JOIN `{REVIEWS_TABLE_ID}` r2 USING (review_id)
+            WHERE ta2.review_id IN UNNEST(@review_ids)
+        )
+    """
+    query = _MERGE_TEMPLATE.format(
+        source=_AGGREGATE_SELECT.format(cell_filter=affected_cells),
+        extra_clause="",
+    )
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("review_ids", "STRING", review_ids)]
+    )
+    job = client.query(query, job_config=job_config)
+    job.result()
+    updated = job.num_dml_affected_rows or 0
+    print(f"Agrégats quotidiens mis à jour : {updated} cellules (jour, thème) pour {len(review_ids)} avis")
+    return updated
+
+
+def rebuild_range(start: date, end: date, client=None) -> int:
+    """Recalcule entièrement les agrégats de la période [start, end] (les cellules disparues sont supprimées)."""
+    client = client or bigquery.Client()
+    query = _MERGE_TEMPLATE.format(
+        source=_AGGREGATE_SELECT.format(cell_filter="r.publication_date BETWEEN @start AND @end"),
+        extra_clause="WHEN NOT MATCHED BY SOURCE AND T.day BETWEEN @start AND @end THEN DELETE",
+    )
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("start", "DATE", start),
+            bigquery.ScalarQueryParameter("end", "DATE", end),
+        ]
+    )
+    job = client.query(query, job_config=job_config)
+    job.result()
+    return job.num_dml_affected_rows or 0
+
+
+def split_date_range(start: date, end: date, chunk_days: int) -> list[tuple[date, date]]:
+    """Découpe [start, end] en sous-périodes contiguës de chunk_days jours au plus."""
+    chunks = []
+    current = start
+    while current <= end:
+        chunk_end = min(current + timedelta(days=chunk_days - 1), end)
+        chunks.append((current, chunk_end))
+        current = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def rebuild_topic_aggregates(start: str, end: str, chunk_days: int = 30, max_workers: int = 4) -> int:
+    """Reconstruit les agrégats depuis zéro sur une période, en parallèle par tranches de dates.
+    start / end au format AAAA-MM-JJ."""
+    start_date, end_date = date.fromisoformat(start), date.fromisoformat(end)
+    if start_date > end_date:
+        raise ValueError(f"Période invalide : {start} > {end}")
+
+    client = bigquery.Client()
+    ensure_aggregate_table(client)
+    chunks = split_date_range(start_date, end_date, chunk_days)
+
+    # Les tranches sont disjointes (partitions différentes) : les MERGE ne se marchent pas dessus
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        results = list(executor.map(lambda c: rebuild_range(c[0], c[1], client), chunks))
+
+    total = sum(results)
+    print(f"Agrégats reconstruits du {start} au {end} : {len(chunks)} tranches, {total} cellules écrites")
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage : python -m api.topic_aggregates AAAA-MM-JJ AAAA-MM-JJ")
+        sys.exit(1)
+    rebuild_topic_aggregates(sys.argv[1], sys.argv[2])
@@ -1,19 +1,32 @@
+import json
 import os
-import time
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
 import logging
 
-from .bq_connect import get_verbatims_by_date
+from .bq_connect import get_review_ids_by_date, get_shard_results, get_verbatims_by_date, get_verbatims_by_ids, \
+    insert_shard_result
 from .claude_interface import classify_with_claude
-from google.cloud import bigquery
+from .fanout import LocalQueue, RESULTS, WORK, aggregate_results, decode_event, dispatch_shards, get_queue, \
+    process_shard
+from .taxonomy import get_label_to_id
+from clients import get_bigquery_client
 
 # Les variables d'environnement (ex: PROJECT_ID) doivent être définies
 # directement dans la configuration de la Cloud Function.
 
 logger = logging.getLogger(__name__)
 
+TOPIC_ANALYSIS_TABLE_ID = "trustpilot-satisfaction.reviews_dataset.topic_analysis"
+# Même espace de noms que api/checkpoint.py : ne pas modifier (les ids déjà insérés en dépendent)
+ANALYSIS_ROW_NAMESPACE = uuid.UUID("8f1d6c1e-3b0a-5d8e-9a57-2c4b7e0f6a13")
+ANALYSIS_VERSION = "cloud_function"
+
+def analysis_row_id(review_id: str, topic_id) -> str:
+    """Id stable d'une ligne topic_analysis : un message de lot redélivré produit les mêmes ids."""
+    return str(uuid.uuid5(ANALYSIS_ROW_NAMESPACE, f"{review_id}|{topic_id}|{ANALYSIS_VERSION}"))
+
 def get_project_id():
     project_id = os.getenv("PROJECT_ID")
     if not project_id:
@@ -21,16 +34,11 @@ def get_project_id():
     return project_id
 
 def load_topic_ids():
-    client = bigquery.Client(project=get_project_id())
-    query = """
-        SELECT topic_label, topic_id
-        FROM `trustpilot-satisfaction.reviews_dataset.topics`
-    """
-    results = client.query(query).result()
-    return {row.topic_label: row.topic_id for row in results}
+    """Index topic_label -> topic_id, issu du référentiel mis en cache (voir taxonomy.py)."""
+    return get_label_to_id()
 
 def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id: dict):
-    client = bigquery.Client(project=get_project_id())
+    client = get_bigquery_client()
     rows_to_insert = []
     unknown_topics = []
 
@@ -62,7 +70,7 @@ def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id:
             label = "Très positif"
 
         rows_to_insert.append({
-            "id": str(uuid.uuid4()),
+            "id": analysis_row_id(review_id, topic_id),
             "review_id": review_id,
             "topic_id": topic_id,
             "score_sentiment": note,
@@ -74,7 +82,10 @@ def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id:
         logger.info("Aucun thème à insérer")
         return
 
-    errors = client.insert_rows_json("trustpilot-satisfaction.reviews_dataset.topic_analysis", rows_to_insert)
+    # insertId = id de ligne : BigQuery écarte au mieux les doublons renvoyés dans la minute environ
+    # (relance immédiate, message redélivré aussitôt) ; ce n'est pas une garantie d'unicité
+    errors = client.insert_rows_json(TOPIC_ANALYSIS_TABLE_ID, rows_to_insert,
+                                     row_ids=[r["id"] for r in rows_to_insert])
 
     if errors:
         logger.error(f"Erreurs d'insertion : {errors}")
@@ -86,6 +97,23 @@ def insert_topic_analysis(review_id: str, theme_scores: list[dict], label_to_id:
         "new_topics": unknown_topics
     }
 
+def analyze_verbatim(v: dict, label_to_id: dict) -> str:
+    """Classe et insère un avis ; renvoie "analyzed", "empty" ou "errors"."""
+    try:
+        theme_scores = classify_with_claude(v["content"])
+        if not theme_scores:
+            logger.warning("Claude n’a rien renvoyé")
+            return "empty"
+        result = insert_topic_analysis(
+            review_id=v["review_id"],
+            theme_scores=theme_scores,
+            label_to_id=label_to_id
+        )
+        return "errors" if result and result["insert_errors"] else "analyzed"
+    except Exception as e:
+        logger.error(f"Erreur lors de l'analyse : {e}", exc_info=True)
+        return "errors"
+
 def run_analysis(scrape_date: str):
     verbatims = get_verbatims_by_date(scrape_date)
     logger.info(f"{len(verbatims)} verbatims récupérés pour {scrape_date}")
@@ -98,20 +126,41 @@ def run_analysis(scrape_date: str):
 
     for i, v in enumerate(verbatims):
         logger.info(f"Verbatim {i+1} : {v['content'][:60]}...")
+        analyze_verbatim(v, label_to_id)
 
-        start = time.time()
-        try:
-            theme_scores = classify_with_claude(v["content"])
-            if theme_scores:
-                result = insert_topic_analysis(
-                    review_id=v["review_id"],
-                    theme_scores=theme_scores,
-                    label_to_id=label_to_id
-                )
-            else:
-                logger.warning("Claude n’a rien renvoyé")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'analyse : {e}", exc_info=True)
+def analyze_review_ids(review_ids: list[str], should_stop) -> tuple[dict, list[str]]:
+    """Analyse un lot d'avis jusqu'à ce que should_stop() le demande ; renvoie les compteurs et les avis restants.
+    Le premier avis est toujours traité, pour que chaque invocation fasse avancer le lot."""
+    verbatims = get_verbatims_by_ids(review_ids)
+    label_to_id = load_topic_ids()
+    counts = {"analyzed": 0, "empty": 0, "errors": 0}
+    for i, v in enumerate(verbatims):
+        if i > 0 and should_stop():
+            return counts, [r["review_id"] for r in verbatims[i:]]
+        counts[analyze_verbatim(v, label_to_id)] += 1
+    return counts, []
+
+def run_fanout(scrape_date: str, queue=None, shard_size: int = None) -> dict:
+    """Répartit l'analyse de la date en lots, un message (donc une invocation) par lot.
+    Avec la file en mémoire, les lots sont traités ici même et le bilan agrégé est renvoyé ;
+    avec Pub/Sub, renvoie le bilan de répartition (les résultats arrivent sur ANALYSIS_RESULTS_TOPIC)."""
+    queue = queue or get_queue()
+    dispatch = dispatch_shards(scrape_date, get_review_ids_by_date(scrape_date), queue, shard_size)
+    if not isinstance(queue, LocalQueue):
+        return dispatch
+
+    queue.drain(WORK, lambda event: process_shard(decode_event(event), analyze_review_ids, queue))
+    results = []
+    queue.drain(RESULTS, lambda event: results.append(decode_event(event)))
+    summary = {**dispatch, **aggregate_results(results)}
+    logger.info(f"Bilan de l'exécution {dispatch['run_id']} : {summary}")
+    return summary
+
+def summarize_run(run_id: str) -> dict:
+    """Bilan d'une exécution répartie sur Pub/Sub, à partir des bilans enregistrés par results_trigger."""
+    summary = {"run_id": run_id, **aggregate_results(get_shard_results(run_id))}
+    logger.info(f"Bilan de l'exécution {run_id} : {summary}")
+    return summary
 
 def process_and_insert_all(scrape_date: str = None):
     if not scrape_date:
@@ -123,9 +172,30 @@ def process_and_insert_all(scrape_date: str = None):
 # ✅ Entrée pour Cloud Function
 def main(request=None):
     scrape_date = request.args.get("scrape_date") if request else None
+    fanout = request.args.get("fanout") if request else None
+    run_id = request.args.get("run_id") if request else None
+    if run_id:
+        return f"📊 Bilan : {json.dumps(summarize_run(run_id), ensure_ascii=False)}"
+    if (fanout or os.getenv("ANALYSIS_FANOUT", "0")) == "1":
+        summary = run_fanout(scrape_date or datetime.utcnow().date().isoformat())
+        return f"✅ Analyse répartie : {json.dumps(summary, ensure_ascii=False)}"
     process_and_insert_all(scrape_date)
     return "✅ Cloud Function exécutée avec succès."
 
+# ✅ Entrée Pub/Sub : une invocation par message de lot (topic ANALYSIS_WORK_TOPIC)
+def shard_trigger(event, context):
+    process_shard(decode_event(event), analyze_review_ids, get_queue())
+
+# ✅ Entrée Pub/Sub : enregistre le bilan de chaque invocation (topic ANALYSIS_RESULTS_TOPIC)
+def results_trigger(event, context):
+    result = decode_event(event)
+    insert_shard_result(result, received_at=datetime.utcnow().isoformat())
+    if not result["final"]:
+        return  # seul le dernier bilan d'un lot peut terminer l'exécution
+    summary = summarize_run(result["run_id"])
+    if summary["complete"]:
+        logger.info(f"Exécution {result['run_id']} du {result['scrape_date']} terminée : {summary}")
+
 # ✅ Entrée pour exécution manuelle locale
 if __name__ == "__main__":
     process_and_insert_all()
@@ -1,9 +1,9 @@
-from google.cloud import bigquery
 from google.auth.exceptions import DefaultCredentialsError
 from dotenv import load_dotenv
-import os
+import json, os
 from typing import List, Dict
 import logging
+from clients import get_bigquery_client
 
 # Les variables d'environnement doivent être définies dans l'environnement GCP.
 
@@ -14,7 +14,7 @@ def get_verbatims_by_date(scrape_date: str) -> List[Dict[str, str]]:
         raise ValueError("La date de scraping est obligatoire.")
 
     try:
-        client = bigquery.Client()
+        client = get_bigquery_client()
         query = f"""
             SELECT review_id, content
             FROM `trustpilot-satisfaction.reviews_dataset.reviews`
@@ -33,3 +33,93 @@ def get_verbatims_by_date(scrape_date: str) -> List[Dict[str, str]]:
     except Exception as e:
         logger.error(f"Erreur lors de la requête BigQuery : {e}", exc_info=True)
         return []
+
+
+def get_review_ids_by_date(scrape_date: str) -> List[str]:
+    """Identifiants des avis à analyser pour une date (découpage en lots, voir fanout.py)."""
+    from google.cloud import bigquery
+
+    client = get_bigquery_client()
+    query = """
+        SELECT review_id
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews`
+        WHERE content IS NOT NULL
+          AND scrape_date = @scrape_date
+        ORDER BY review_id
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("scrape_date", "DATE", scrape_date),
+    ])
+    return [row["review_id"] for row in client.query(query, job_config=job_config).result()]
+
+
+def get_verbatims_by_ids(review_ids: List[str]) -> List[Dict[str, str]]:
+    """Verbatims d'un lot d'avis. Les erreurs remontent : Pub/Sub redélivre alors le message du lot."""
+    from google.cloud import bigquery
+
+    client = get_bigquery_client()
+    query = """
+        SELECT review_id, content
+        FROM `trustpilot-satisfaction.reviews_dataset.reviews`
+        WHERE review_id IN UNNEST(@review_ids)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("review_ids", "STRING", review_ids),
+    ])
+    rows = {row["review_id"]: row["content"] for row in client.query(query, job_config=job_config).result()}
+    # Ordre du lot conservé : les avis non traités forment la fin de la liste
+    return [{"review_id": review_id, "content": rows[review_id]} for review_id in review_ids if review_id in rows]
+
+
+# Bilans des invocations d'une analyse répartie (un par message du topic de résultats, voir fanout.py)
+SHARD_RESULTS_TABLE_ID = os.getenv("ANALYSIS_RESULTS_TABLE_ID",
+                                   "trustpilot-satisfaction.reviews_dataset.analysis_shard_results")
+_shard_results_table_ready = False
+
+
+def ensure_shard_results_table(client):
+    """Crée la table des bilans si elle n'existe pas ; vérifié une fois par instance."""
+    from google.cloud import bigquery
+
+    global _shard_results_table_ready
+    if _shard_results_table_ready:
+        return
+    table = bigquery.Table(SHARD_RESULTS_TABLE_ID, schema=[
+        bigquery.SchemaField("run_id", "STRING", mode="REQUIRED"),
+        bigquery.SchemaField("token", "STRING", mode="REQUIRED"),
+        bigquery.SchemaField("result", "STRING", mode="REQUIRED"),
+        bigquery.SchemaField("received_at", "TIMESTAMP"),
+    ])
+    table.clustering_fields = ["run_id"]
+    client.create_table(table, exists_ok=True)
+    _shard_results_table_ready = True
+
+
+def insert_shard_result(result: dict, received_at: str):
+    """Enregistre le bilan d'une invocation. Les erreurs remontent : Pub/Sub redélivre alors le message."""
+    client = get_bigquery_client()
+    ensure_shard_results_table(client)
+    row = {"run_id": result["run_id"], "token": result["token"], "received_at": received_at,
+           "result": json.dumps(result, ensure_ascii=False)}
+    # insertId = jeton : doublons écartés au mieux, sur environ une minute ; un bilan redélivré plus tard
+    # est stocké deux fois, mais aggregate_results ne compte qu'un bilan par jeton
+    errors = client.insert_rows_json(SHARD_RESULTS_TABLE_ID, [row], row_ids=[result["token"]])
+    if errors:
+        raise RuntimeError(f"Erreurs d'insertion du bilan {result['token']} : {errors}")
+
+
+def get_shard_results(run_id: str) -> List[Dict]:
+    """Bilans enregistrés pour une exécution répartie."""
+    from google.cloud import bigquery
+
+    client = get_bigquery_client()
+    ensure_shard_results_table(client)
+    query = f"""
+        SELECT result
+        FROM `{SHARD_RESULTS_TABLE_ID}`
+        WHERE run_id = @run_id
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("run_id", "STRING", run_id),
+    ])
+    return [json.loads(row["result"]) for row in client.query(query, job_config=job_config).result()]
@@ -2,11 +2,12 @@ import pandas as pd
 from google.cloud import bigquery
 import os
 import logging
+from clients import get_bigquery_client
 
 logger = logging.getLogger(__name__)
 
 def deduplicate_reviews():
-    client = bigquery.Client()
+    client = get_bigquery_client()
 
     dedup_query = """
         WITH duplicates AS (
@@ -62,7 +63,7 @@ def insert_clean_reviews_to_bq():
         logger.warning("Le fichier nettoyé est vide. Rien à insérer.")
         return
 
-    client = bigquery.Client()
+    client = get_bigquery_client()
 
     job_config = bigquery.LoadJobConfig(
         write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
@@ -1,26 +1,21 @@
 import os, uuid
 from datetime import datetime
 from typing import List, Dict
-from google.cloud import bigquery
 import logging
+from clients import get_bigquery_client
 
 # Import interne (doit fonctionner avec ton arborescence cloud_function/)
 from .bq_connect import get_verbatims_by_date as get_verbatims_from_bq
 from api.claude_interface import classify_with_claude
+from .taxonomy import get_label_to_id
 
 logger = logging.getLogger(__name__)
 
 # === Fonctions de chargement et de traitement ===
 
 def load_topic_ids() -> Dict[str, str]:
-    """Charge les mappings de topic_label vers topic_id depuis BigQuery."""
-    client = bigquery.Client()
-    query = """
-        SELECT topic_label, topic_id
-        FROM `trustpilot-satisfaction.reviews_dataset.topics`
-    """
-    results = client.query(query).result()
-    return {row.topic_label: row.topic_id for row in results}
+    """Charge les mappings de topic_label vers topic_id (référentiel mis en cache, voir taxonomy.py)."""
+    return get_label_to_id()
 
 def process_verbatims(verbatims: List[Dict], label_to_id: Dict[str, str], scrape_date: str) -> (List[Dict], set):
     """Traite les verbatims, renvoie les lignes à insérer et les thèmes inconnus."""
@@ -76,7 +71,7 @@ def insert_into_bigquery(data: List[Dict]):
         logger.warning("Aucune donnée valide à insérer. Vérifiez les thèmes inconnus ci-dessous.")
         return
         
-    client = bigquery.Client()
+    client = get_bigquery_client()
     table_id = "trustpilot-satisfaction.reviews_dataset.topic_analysis"
 
     errors = client.insert_rows_json(table_id, data)
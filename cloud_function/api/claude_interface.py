@@ -1,7 +1,8 @@
-import anthropic, os, json, logging, unicodedata, re
-from .prompt_utils import build_prompt, THEMES
+import os, json, logging, unicodedata, re
+from .prompt_utils import build_prompt
+from .taxonomy import get_theme_labels
 from typing import Optional, List, Dict, Union
-from google.cloud import secretmanager # Added import
+from clients import get_anthropic_client
 
 # Assurez-vous que ANTHROPIC_API_KEY est définie dans l'environnement GCP.
 
@@ -29,9 +30,6 @@ def _sanitize_ascii(s: str) -> str:
 SECRET_ID = "ANTHROPIC_API_KEY"
 PROJECT_ID = os.getenv("GCP_PROJECT") # Ou os.getenv("GOOGLE_CLOUD_PROJECT")
 
-if not PROJECT_ID:
-    raise EnvironmentError("La variable d'environnement GCP_PROJECT n'est pas définie. Elle est nécessaire pour accéder à Secret Manager.")
-
 logger = logging.getLogger("claude_logger") # Existing logger
 logger.setLevel(logging.INFO)
 logger.propagate = False
@@ -40,34 +38,45 @@ if not logger.hasHandlers():
     handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     logger.addHandler(handler)
 
-try:
-    client_sm = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{PROJECT_ID}/secrets/{SECRET_ID}/versions/latest"
-    response = client_sm.access_secret_version(request={"name": name})
-    raw_key = response.payload.data.decode("UTF-8")
-    api_key = _sanitize_ascii(raw_key)
-    logger.info("Clé API Anthropic récupérée et validée (ASCII).")
-except Exception as e:
-    logger.error(f"Erreur lors de la récupération/validation de la clé API : {e}", exc_info=True)
-    raise EnvironmentError(f"Impossible d'utiliser la clé API Anthropic : {e}")
-
 # Headers ASCII only (évite tout caractère accentué dans User-Agent)
 SAFE_HEADERS = {"User-Agent": "trustpilot-pipeline/1.0"}
 
-# Appelez la fonction d'assertion avant d'initialiser le client
-assert_ascii_headers(SAFE_HEADERS) # <-- AJOUT DE CETTE LIGNE
 
-client = anthropic.Anthropic(
-    api_key=api_key, # On utilise la clé déjà récupérée
-    default_headers=SAFE_HEADERS,
-)
-THEME_LABELS = {t["nom"] for t in THEMES}
+def fetch_api_key() -> str:
+    """Lit et valide la clé API dans Secret Manager (une fois par instance, via clients.get_anthropic_client)."""
+    if not PROJECT_ID:
+        raise EnvironmentError("La variable d'environnement GCP_PROJECT n'est pas définie. Elle est nécessaire pour accéder à Secret Manager.")
+    from google.cloud import secretmanager
+
+    try:
+        client_sm = secretmanager.SecretManagerServiceClient()
+        name = f"projects/{PROJECT_ID}/secrets/{SECRET_ID}/versions/latest"
+        response = client_sm.access_secret_version(request={"name": name})
+        raw_key = response.payload.data.decode("UTF-8")
+        api_key = _sanitize_ascii(raw_key)
+        logger.info("Clé API Anthropic récupérée et validée (ASCII).")
+        return api_key
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération/validation de la clé API : {e}", exc_info=True)
+        raise EnvironmentError(f"Impossible d'utiliser la clé API Anthropic : {e}")
+
+
+def build_client():
+    """Client Anthropic de l'instance ; utiliser clients.get_anthropic_client() pour le réutiliser."""
+    import anthropic
+
+    # Appelez la fonction d'assertion avant d'initialiser le client
+    assert_ascii_headers(SAFE_HEADERS)
+    return anthropic.Anthropic(
+        api_key=fetch_api_key(),
+        default_headers=SAFE_HEADERS,
+    )
 
 
 def classify_with_claude(verbatim: str) -> Optional[List[Dict[str, Union[str, float]]]]:
     prompt = build_prompt(verbatim)
     try:
-        response = client.messages.create(
+        response = get_anthropic_client().messages.create(
             model="claude-3-haiku-20240307",
             max_tokens=500,
             temperature=0,
@@ -98,6 +107,7 @@ def validate_claude_response(response_text: str) -> Optional[List[Dict[str, Unio
             return None
 
         results = []
+        theme_labels = get_theme_labels()
         for item in data["themes"]:
             if not isinstance(item, dict):
                 logger.warning(f"⚠️ Élément non structuré : {item}")
@@ -106,7 +116,7 @@ def validate_claude_response(response_text: str) -> Optional[List[Dict[str, Unio
             theme = item.get("theme")
             note = item.get("note")
 
-            if theme not in THEME_LABELS:
+            if theme not in theme_labels:
                 logger.warning(f"⚠️ Thème inconnu : {theme}")
                 continue
 
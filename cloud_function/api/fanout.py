@@ -0,0 +1,157 @@
+"""Analyse d'une date répartie sur plusieurs invocations de la Cloud Function.
+
+Le coordinateur découpe les review_id de la date en lots (ANALYSIS_SHARD_SIZE) et publie un message
+par lot sur le topic de travail. Chaque message déclenche une invocation qui analyse son lot ; si le
+timeout de la fonction approche, elle republie les avis restants avec un jeton de continuation
+(lot, position) au lieu de se faire couper. Chaque invocation publie son bilan sur le topic de
+résultats ; aggregate_results les réunit pour l'exécution (avec Pub/Sub : results_trigger enregistre
+chaque bilan dans BigQuery, voir api/analyze_and_insert.py).
+
+Sans ANALYSIS_WORK_TOPIC, une file en mémoire (LocalQueue) remplace Pub/Sub : tout le traitement
+a lieu dans le processus courant (exécution locale, tests).
+"""
+import base64, json, logging, os, time, uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_SHARD_SIZE = int(os.getenv("ANALYSIS_SHARD_SIZE", "200"))
+# Topics Pub/Sub (projects/<projet>/topics/<nom>) ; vides = file en mémoire
+ANALYSIS_WORK_TOPIC = os.getenv("ANALYSIS_WORK_TOPIC", "")
+ANALYSIS_RESULTS_TOPIC = os.getenv("ANALYSIS_RESULTS_TOPIC", "")
+# Timeout de la fonction et temps gardé pour republier la suite avant d'être coupé
+FUNCTION_TIMEOUT_SECONDS = float(os.getenv("FUNCTION_TIMEOUT_SECONDS", "540"))
+SHARD_RESERVE_SECONDS = float(os.getenv("ANALYSIS_SHARD_RESERVE_SECONDS", "60"))
+
+WORK = "work"
+RESULTS = "results"
+
+
+def encode_token(run_id: str, shard: int, offset: int) -> str:
+    """Jeton de continuation opaque : exécution, lot et nombre d'avis du lot déjà traités."""
+    payload = json.dumps({"run_id": run_id, "shard": shard, "offset": offset})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_token(token: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+
+def decode_event(event: dict) -> dict:
+    """Message d'un événement Pub/Sub (champ data en base64)."""
+    return json.loads(base64.b64decode(event["data"]).decode("utf-8"))
+
+
+class LocalQueue:
+    """File en mémoire au format Pub/Sub, à la place des topics de travail et de résultats."""
+
+    def __init__(self):
+        self.topics = {WORK: deque(), RESULTS: deque()}
+
+    def publish(self, topic: str, message: dict):
+        self.topics[topic].append({"data": base64.b64encode(encode_message(message)).decode("ascii")})
+
+    def drain(self, topic: str, handler):
+        """Passe chaque événement à handler jusqu'à épuisement (handler peut en publier d'autres)."""
+        while self.topics[topic]:
+            handler(self.topics[topic].popleft())
+
+
+class PubSubQueue:
+    """Publication sur les topics Pub/Sub configurés (le déclenchement est fait par Cloud Functions)."""
+
+    def __init__(self, work_topic: str = None, results_topic: str = None):
+        from clients import get_pubsub_publisher
+
+        self.publisher = get_pubsub_publisher()
+        self.topic_paths = {WORK: work_topic or ANALYSIS_WORK_TOPIC, RESULTS: results_topic or ANALYSIS_RESULTS_TOPIC}
+
+    def publish(self, topic: str, message: dict):
+        self.publisher.publish(self.topic_paths[topic], encode_message(message)).result()
+
+
+def get_queue():
+    return PubSubQueue() if ANALYSIS_WORK_TOPIC else LocalQueue()
+
+
+def shard_ids(review_ids: list[str], shard_size: int = None) -> list[list[str]]:
+    size = max(1, shard_size or ANALYSIS_SHARD_SIZE)
+    return [review_ids[i:i + size] for i in range(0, len(review_ids), size)]
+
+
+def dispatch_shards(scrape_date: str, review_ids: list[str], queue, shard_size: int = None) -> dict:
+    """Publie un message de travail par lot ; renvoie l'identifiant d'exécution et le nombre de lots."""
+    run_id = uuid.uuid4().hex
+    shards = shard_ids(review_ids, shard_size)
+    for index, ids in enumerate(shards):
+        queue.publish(WORK, {
+            "scrape_date": scrape_date,
+            "run_id": run_id,
+            "shard": index,
+            "shards": len(shards),
+            "review_ids": ids,
+            "token": encode_token(run_id, index, 0),
+        })
+    logger.info(f"Exécution {run_id} : {len(review_ids)} avis du {scrape_date} répartis en {len(shards)} lots")
+    return {"run_id": run_id, "scrape_date": scrape_date, "shards": len(shards), "reviews": len(review_ids)}
+
+
+def process_shard(message: dict, analyze_fn, queue, timeout_seconds: float = None,
+                  reserve_seconds: float = None, clock=time.monotonic) -> dict:
+    """Analyse les avis d'un message de travail avec analyze_fn(review_ids, should_stop) et publie le bilan.
+    analyze_fn renvoie (compteurs, review_ids non traités) ; les non traités sont republiés avec un jeton
+    de continuation si le temps restant ne suffit plus. Une invocation qui n'a traité aucun avis ne republie
+    rien (elle se relancerait indéfiniment) : ses avis sont comptés comme bloqués dans le bilan."""
+    start = clock()
+    timeout = FUNCTION_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+    reserve = SHARD_RESERVE_SECONDS if reserve_seconds is None else reserve_seconds
+    token = decode_token(message["token"])
+
+    def should_stop() -> bool:
+        return clock() - start >= timeout - reserve
+
+    counts, remaining = analyze_fn(message["review_ids"], should_stop)
+    done = len(message["review_ids"]) - len(remaining)
+    stalled = bool(remaining) and done == 0
+    result = {
+        "run_id": message["run_id"],
+        "scrape_date": message["scrape_date"],
+        "shard": message["shard"],
+        "shards": message["shards"],
+        "token": message["token"],
+        "final": not remaining,
+        "stalled": len(remaining) if stalled else 0,
+        **counts,
+    }
+    if stalled:
+        logger.error(f"Lot {message['shard']} : aucun avis traité, {len(remaining)} avis non republiés")
+    elif remaining:
+        next_token = encode_token(message["run_id"], message["shard"], token["offset"] + done)
+        queue.publish(WORK, {**message, "review_ids": remaining, "token": next_token})
+        logger.info(f"Lot {message['shard']} : {done} avis traités, {len(remaining)} republiés (jeton {next_token})")
+    queue.publish(RESULTS, result)
+    return result
+
+
+def aggregate_results(results: list[dict]) -> dict:
+    """Bilan d'une exécution à partir des messages de résultats (une entrée par invocation).
+    Un message redélivré (même jeton) n'est compté qu'une fois."""
+    seen, unique = set(), []
+    for r in results:
+        if r["token"] not in seen:
+            seen.add(r["token"])
+            unique.append(r)
+    summary = {
+        "invocations": len(unique),
+        "continuations": sum(1 for r in unique if not r["final"]),
+        "shards_done": len({r["shard"] for r in unique if r["final"]}),
+        "shards": max((r["shards"] for r in unique), default=0),
+    }
+    for key in ("analyzed", "empty", "errors", "stalled"):
+        summary[key] = sum(r.get(key, 0) for r in unique)
+    summary["complete"] = summary["shards_done"] == summary["shards"]
+    return summary
@@ -1,48 +1,10 @@
-THEMES = [
-    {
-        "nom": "Prix et promotions",
-        "description": "Rapport qualité/prix, remises, offres promotionnelles, transparence tarifaire, publicité mensongère"
-    },
-    {
-        "nom": "Livraison et retrait",
-        "description": "Délais de livraison, suivi de colis, retrait en magasin, produits manquants ou perdus"
-    },
-    {
-        "nom": "Retour et remboursement",
-        "description": "Conditions de retour, reprise du matériel, facilité de remboursement, rapidité, gestes commerciaux"
-    },
-    {
-        "nom": "Qualité des produits",
-        "description": "Matériaux défectueux, mauvais état à la réception, problème de conformité"
-    },
-    {
-        "nom": "Service client / SAV",
-        "description": "Réactivité, efficacité, écoute, résolution des problèmes après achat par le personnel, appels non pris en compte, délais de réponse trop longs"
-    },
-    {
-        "nom": "Expérience d'achat en ligne",
-        "description": "Facilité d'utilisation du site, ergonomie, informations produits, expérience d'achat numérique"
-    },
-    {
-        "nom": "Expérience d'achat en magasin",
-        "description": "Accueil, conseils du personnel, accompagnement, attente en caisse"
-    },
-    {
-        "nom": "Suivi de projet / travaux sur mesure",
-        "description": "Coordination de projets longs ou personnalisés, accompagnement des chantiers, suivi des travaux"
-    },
-    {
-        "nom": "Qualité de la communication",
-        "description": "Précision dans les conditions ou offres, communication claire, transparence dans les réponses, confusion dans les messages, conditions opaques"
-    },
-    {
-        "nom": "Programme fidélité",
-        "description": "Avantages exclusifs, points de fidélité, offres réservées aux membres"
-    }
-]
+from .taxonomy import DEFAULT_THEMES, get_theme_block
+
+# Conservé pour compatibilité : la liste de référence vient désormais de la table topics (voir taxonomy.py)
+THEMES = DEFAULT_THEMES
 
 def build_prompt(verbatim: str) -> str:
-    theme_list = "\n".join([f'- {t["nom"]} : {t["description"]}' for t in THEMES])
+    theme_list = get_theme_block()
 
     return f"""
 Tu es un expert en analyse de la satisfaction client. Ta mission est d’identifier les irritants dans les avis clients ainsi que les points positifs, en respectant strictement les consignes suivantes.
@@ -0,0 +1,54 @@
+"""Clients partagés par les invocations d'une même instance de la Cloud Function.
+
+Chaque client est créé à sa première utilisation (et non au démarrage à froid), puis réutilisé
+par toutes les invocations suivantes tant que l'instance reste chaude : pas de nouvelle connexion
+BigQuery ni de nouvel appel à Secret Manager à chaque requête.
+"""
+import logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _get_or_create(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                start = time.perf_counter()
+                client = _clients[name] = factory()
+                logger.info(f"Client {name} créé en {time.perf_counter() - start:.3f} s (réutilisé ensuite)")
+    return client
+
+
+def get_bigquery_client():
+    def factory():
+        from google.cloud import bigquery
+        return bigquery.Client()
+
+    return _get_or_create("bigquery", factory)
+
+
+def get_anthropic_client():
+    def factory():
+        from api.claude_interface import build_client
+        return build_client()
+
+    return _get_or_create("anthropic", factory)
+
+
+def get_pubsub_publisher():
+    def factory():
+        from google.cloud import pubsub_v1
+        return pubsub_v1.PublisherClient()
+
+    return _get_or_create("pubsub", factory)
+
+
+def reset_clients():
+    """Oublie les clients créés (tests, rotation de la clé API)."""
+    with _lock:
+        _clients.clear()
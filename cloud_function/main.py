@@ -1,12 +1,14 @@
-from flask import Response
-import logging
+# Point d'entrée optimisé pour le démarrage à froid : seuls des modules de la bibliothèque standard
+# sont importés au chargement ; pandas, BigQuery, le scraper, le nettoyage et la classification sont
+# importés à la première exécution de leur étage. Les clients (BigQuery, Anthropic) sont créés une
+# fois par instance (voir clients.py) et réutilisés par les invocations suivantes.
+import time
+
+_MODULE_LOAD_START = time.perf_counter()
+
+import importlib, logging, os, sys
 from datetime import datetime
-import os
-import pandas as pd
-from google.cloud import bigquery
-from scripts_data.scraper import scrape_reviews
-from scripts_data.cleaner import clean_csv
-from api.classify import run as classify_and_store
+from clients import get_bigquery_client
 
 # === Variables globales ===
 PROJECT_ID = os.getenv("PROJECT_ID", "trustpilot-satisfaction")
@@ -19,11 +21,26 @@ OUTPUT_FILE = "/tmp/avis_boutique_clean.csv"
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Mesures de démarrage de l'instance : import du module, puis latence de la première requête
+STARTUP = {"import_seconds": None, "first_request_seconds": None, "invocations": 0}
+
+
+def load_stage(module: str, attr: str):
+    """Import différé d'un étage du pipeline ; la durée d'import est journalisée à son premier chargement."""
+    if module in sys.modules:
+        return getattr(sys.modules[module], attr)
+    start = time.perf_counter()
+    loaded = importlib.import_module(module)
+    logger.info(f"Import différé de {module} : {time.perf_counter() - start:.3f} s")
+    return getattr(loaded, attr)
+
 
 def upload_to_bigquery(csv_path: str, target_table_id: str):
     """Charge le CSV nettoyé dans une table temporaire, puis fusionne avec la table cible en évitant les doublons.
      csv_path : chemin local du fichier CSV
      target_table_id : identifiant complet de la table cible dans BigQuery (projet.dataset.table)"""
+    import pandas as pd
+    from google.cloud import bigquery
 
     df = pd.read_csv(csv_path)
     expected_columns = ['review_id', 'rating', 'content', 'author', 'publication_date', 'scrape_date']
@@ -33,7 +50,7 @@ def upload_to_bigquery(csv_path: str, target_table_id: str):
     df['publication_date'] = pd.to_datetime(df['publication_date'], errors='coerce').dt.date
     df['scrape_date'] = pd.to_datetime(df['scrape_date'], errors='coerce').dt.date
 
-    client = bigquery.Client()
+    client = get_bigquery_client()
     load_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
     client.load_table_from_dataframe(df, TEMP_TABLE, job_config=load_config).result()
     logger.info(f"Données chargées dans {TEMP_TABLE}.")
@@ -55,9 +72,11 @@ def run_pipeline():
     logger.info(f"Mode scraping sélectionné : {SCRAPER_MODE}")
 
     logger.info("Scraping Trustpilot en ligne...")
+    scrape_reviews = load_stage("scripts_data.scraper", "scrape_reviews")
     scrape_reviews(mode="csv")
 
     logger.info("Nettoyage des données CSV...")
+    clean_csv = load_stage("scripts_data.cleaner", "clean_csv")
     clean_stats = clean_csv(INPUT_FILE, OUTPUT_FILE)
     logger.info(f"Statistiques de nettoyage : {clean_stats}")
 
@@ -66,19 +85,44 @@ def run_pipeline():
 
     today = datetime.utcnow().date().isoformat()
     logger.info("Lancement de l'analyse Claude...")
+    classify_and_store = load_stage("api.classify", "run")
     classify_and_store(scrape_date=today)
 
     logger.info("Pipeline complet exécuté avec succès.")
 
 
+def _response(text: str, status: int):
+    # Flask est déjà chargé par le framework des Cloud Functions : import sans coût
+    from flask import Response
+    return Response(text, mimetype="text/plain; charset=utf-8", status=status)
+
+
+def _record_invocation(start: float):
+    latency = time.perf_counter() - start
+    STARTUP["invocations"] += 1
+    if STARTUP["first_request_seconds"] is None:
+        STARTUP["first_request_seconds"] = latency
+        logger.info(f"Première requête de l'instance (démarrage à froid) : {latency:.3f} s "
+                    f"(import du module : {STARTUP['import_seconds']:.3f} s)")
+    else:
+        logger.info(f"Requête n°{STARTUP['invocations']} (instance chaude) : {latency:.3f} s")
+
+
 # === Point d'entrée Cloud Function ===
 def main(request):
+    start = time.perf_counter()
     try:
         run_pipeline()
-        return Response("OK: Pipeline exécuté avec succès.", mimetype="text/plain; charset=utf-8", status=200)
+        return _response("OK: Pipeline exécuté avec succès.", 200)
     except EnvironmentError as e:
         logger.error(f"Erreur de configuration de la clé API : {e}", exc_info=True)
-        return Response(f"Erreur de configuration de la clé API : {e}", mimetype="text/plain; charset=utf-8", status=500)
+        return _response(f"Erreur de configuration de la clé API : {e}", 500)
     except Exception as e:
         logger.error(f"Erreur critique dans le pipeline : {e}", exc_info=True)
-        return Response(f"Erreur : {e}", mimetype="text/plain; charset=utf-8", status=500)
+        return _response(f"Erreur : {e}", 500)
+    finally:
+        _record_invocation(start)
+
+
+STARTUP["import_seconds"] = time.perf_counter() - _MODULE_LOAD_START
+logger.info(f"Démarrage à froid : module main chargé en {STARTUP['import_seconds']:.3f} s")
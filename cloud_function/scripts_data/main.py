@@ -3,6 +3,7 @@ from datetime import datetime
 import pandas as pd
 from google.cloud import bigquery
 from dotenv import load_dotenv
+from clients import get_bigquery_client
 
 from scripts_data.scraper import scrape_reviews
 from scripts_data.cleaner import clean_csv
@@ -27,7 +28,7 @@ def upload_to_bigquery(csv_path, target_table_id):
     df['publication_date'] = pd.to_datetime(df['publication_date'], errors='coerce').dt.date
     df['scrape_date'] = pd.to_datetime(df['scrape_date'], errors='coerce').dt.date
 
-    client = bigquery.Client()
+    client = get_bigquery_client()
     job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
     client.load_table_from_dataframe(df, TEMP_TABLE, job_config=job_config).result()
     print(f"✅ Données chargées dans la table temporaire {TEMP_TABLE}.")
@@ -1,6 +1,8 @@
 from prometheus_client import Counter, Gauge, Histogram, start_http_server, delete_from_gateway
 from prometheus_client import REGISTRY, push_to_gateway
 import socket
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 # -------------------------
 # MÉTRIQUES PRINCIPALES
@@ -29,6 +31,15 @@ VERBATIM_LENGTH = Histogram(
     "Longueur du verbatim (en caractères)",
     buckets=(50, 100, 200, 300, 500, 800, 1200, 2000)
 )
+# Tokens d'entrée estimés de chaque requête Claude, avant envoi
+CLAUDE_INPUT_TOKENS_ESTIMATE = Histogram(
+    "claude_input_tokens_estimated",
+    "Tokens d'entrée estimés d'une requête Claude",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 5000)
+)
+# Verbatims trop longs découpés en plusieurs requêtes
+VERBATIMS_CHUNKED = Counter('verbatims_chunked_total', "Verbatims découpés en morceaux avant l'envoi à Claude")
+
 # Nouveaux thèmes détectés non présents dans la table topics
 NEW_TOPICS_DETECTED = Counter('new_topics_detected_total', 'Nouveaux thèmes non reconnus par le modèle')
 
@@ -41,6 +52,100 @@ VERBATIMS_SKIPPED = Counter('verbatims_skipped_total', "Verbatims ignorés dans
 # appels à Claude (total et par statut : succès, erreur) 
 CLAUDE_CALLS = Counter("claude_calls_total", "Appels à Claude", ["status"])
 
+# Gouverneur de débit : attente imposée avant un appel et relances des erreurs transitoires
+CLAUDE_RATE_LIMIT_WAIT = Histogram(
+    "claude_rate_limit_wait_seconds",
+    "Attente imposée par les plafonds RPM/TPM avant un appel à Claude (s)",
+    buckets=(0, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+)
+CLAUDE_RETRIES = Counter(
+    "claude_retries_total",
+    "Relances d'appels à Claude après une erreur transitoire",
+    ["reason"]  # rate_limit, overloaded, server_error, timeout, connection
+)
+
+# Mode streaming : délai avant le premier token et avant un JSON complet
+CLAUDE_TIME_TO_FIRST_TOKEN = Histogram(
+    "claude_time_to_first_token_seconds",
+    "Délai entre l'envoi de la requête et le premier token reçu (s)",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+CLAUDE_TIME_TO_VALID_JSON = Histogram(
+    "claude_time_to_valid_json_seconds",
+    "Délai entre l'envoi de la requête et la fin de l'objet JSON dans le flux (s)",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+
+# Cascade de modèles : appels et latence par modèle, escalades vers le modèle suivant
+CLAUDE_TIER_CALLS = Counter("claude_tier_calls_total", "Appels à Claude par modèle de la cascade", ["model"])
+CLAUDE_TIER_LATENCY = Histogram(
+    "claude_tier_latency_seconds",
+    "Durée d'un étage de la cascade (appel, réparation et validation) par modèle (s)",
+    ["model"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 30)
+)
+CLAUDE_ESCALATIONS = Counter(
+    "claude_escalations_total",
+    "Avis envoyés au modèle suivant de la cascade",
+    ["reason"]  # invalid_response, no_theme, rating_mismatch
+)
+
+# Relances ciblées quand les arguments de l'outil structuré ne passent pas la validation
+CLAUDE_REPAIR_REQUESTS = Counter('claude_repair_requests_total', "Relances de réparation d'une réponse structurée invalide")
+
+# Instrumentation par appel API (un messages.create, hors attente du gouverneur et hors relances)
+CLAUDE_API_LATENCY = Histogram(
+    "claude_api_latency_seconds",
+    "Latence d'un appel à l'API Claude (s)",
+    ["model", "cache"],  # cache de prompt lu (hit), écrit (write) ou non utilisé (none)
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+CLAUDE_TOKENS = Counter(
+    "claude_tokens_total",
+    "Tokens consommés par les appels à Claude (response.usage)",
+    ["model", "type"]  # input, output, cache_read, cache_creation
+)
+CLAUDE_STOP_REASONS = Counter("claude_stop_reasons_total", "Motifs de fin de réponse de Claude", ["model", "stop_reason"])
+CLAUDE_COST_USD = Counter("claude_cost_usd_total", "Coût estimé des appels à Claude (USD)", ["model"])
+
+# Découpage du temps par verbatim : classification (cache, cascade, relances comprises) vs insertion BigQuery
+CLASSIFICATION_DURATION = Histogram(
+    "verbatim_classification_duration_seconds",
+    "Durée de classification d'un verbatim (s)",
+    buckets=(0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+)
+BQ_INSERT_DURATION = Histogram(
+    "bq_insert_duration_seconds",
+    "Durée d'insertion des thèmes d'un verbatim dans BigQuery (s)",
+    buckets=(0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+)
+
+# Pipeline par étapes (lecture → classification → écriture) : profondeur des files entre étapes et
+# débit de chaque étape, pour repérer le goulot d'étranglement
+PIPELINE_QUEUE_DEPTH = Gauge("pipeline_queue_depth", "Éléments en attente dans une file du pipeline", ["queue"])  # verbatims, results
+PIPELINE_STAGE_THROUGHPUT = Gauge(
+    "pipeline_stage_throughput",
+    "Débit d'une étape du pipeline depuis son démarrage (éléments/s)",
+    ["stage"]  # read, classify, write
+)
+PIPELINE_STAGE_ITEMS = Counter("pipeline_stage_items_total", "Éléments traités par une étape du pipeline", ["stage"])
+
+# Tarifs publics en USD par million de tokens : entrée, sortie, écriture cache, lecture cache
+CLAUDE_PRICES_USD_PER_MTOK = {
+    "claude-3-haiku-20240307": (0.25, 1.25, 0.30, 0.03),
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-7-sonnet-20250219": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-opus-20240229": (15.00, 75.00, 18.75, 1.50),
+}
+
+# Cache persistant des réponses Claude (hit, miss, evicted)
+CLAUDE_RESPONSE_CACHE = Counter(
+    "claude_response_cache_total",
+    "Consultations et évictions du cache des réponses Claude",
+    ["result"]
+)
+
 # -------------------------
 # FONCTION D’EXPORT SERVER
 # -------------------------
@@ -64,12 +169,14 @@ def monitor_start(port=8000):
 # LOGIQUE DE MISE À JOUR DES MÉTRIQUES
 # -------------------------
 
-def log_analysis_metrics(verbatim_text: str, duration: float, error=False, empty=False, new_topics=None, bq_error=False):
+def log_analysis_metrics(verbatim_text: str, duration: float, error=False, empty=False, new_topics=None, bq_error=False,
+                         classification_duration: float = None, insert_duration: float = None):
     """
     Met à jour les métriques Prometheus après le traitement d’un verbatim.
     
     - verbatim_text : texte du verbatim
     - duration : durée d’analyse
+    - classification_duration / insert_duration : part de la durée passée chez Claude / dans BigQuery
     - error : True si erreur JSON
     - empty : True si réponse vide de Claude
     - new_topics : liste de thèmes non reconnus
@@ -77,6 +184,10 @@ def log_analysis_metrics(verbatim_text: str, duration: float, error=False, empty
     """
     #VERBATIMS_ANALYZED.inc()
     ANALYSIS_DURATION.observe(duration)
+    if classification_duration is not None:
+        CLASSIFICATION_DURATION.observe(classification_duration)
+    if insert_duration is not None:
+        BQ_INSERT_DURATION.observe(insert_duration)
 
     # Taille du verbatim (en brut)
     size = len(verbatim_text)
@@ -104,6 +215,76 @@ def log_analysis_metrics(verbatim_text: str, duration: float, error=False, empty
     print(f" VERBATIMS_ANALYZED après: {VERBATIMS_ANALYZED._value.get()}")
 
 
+def _token_count(usage, field: str) -> int:
+    value = getattr(usage, field, None)
+    return int(value) if isinstance(value, (int, float)) else 0
+
+
+def prompt_cache_status(usage) -> str:
+    """Statut du cache de prompt pour un appel : lu (hit), écrit (write) ou non utilisé (none)."""
+    if _token_count(usage, "cache_read_input_tokens"):
+        return "hit"
+    return "write" if _token_count(usage, "cache_creation_input_tokens") else "none"
+
+
+def compute_claude_cost(model: str, usage) -> float:
+    """Coût (USD) d'un appel d'après response.usage ; 0 pour un modèle absent de la grille."""
+    prices = CLAUDE_PRICES_USD_PER_MTOK.get(model)
+    if prices is None or usage is None:
+        return 0.0
+    input_price, output_price, cache_write_price, cache_read_price = prices
+    return (
+        _token_count(usage, "input_tokens") * input_price
+        + _token_count(usage, "output_tokens") * output_price
+        + _token_count(usage, "cache_creation_input_tokens") * cache_write_price
+        + _token_count(usage, "cache_read_input_tokens") * cache_read_price
+    ) / 1_000_000
+
+
+def record_claude_call(model: str, response, latency: float):
+    """Métriques d'un appel à l'API : latence, tokens par type, motif d'arrêt, coût et cache de prompt."""
+    usage = getattr(response, "usage", None)
+    CLAUDE_API_LATENCY.labels(model=model, cache=prompt_cache_status(usage)).observe(latency)
+    record_claude_usage(model, response)
+
+
+# Compteurs ouverts par track_claude_tokens dans le contexte courant (thread ou tâche asyncio)
+_token_trackers: ContextVar[tuple] = ContextVar("claude_token_trackers", default=())
+
+
+@contextmanager
+def track_claude_tokens():
+    """Compte les tokens (entrée + sortie) de tous les appels faits dans le bloc, quel que soit le chemin d'appel."""
+    totals = {"tokens": 0}
+    token = _token_trackers.set(_token_trackers.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _token_trackers.reset(token)
+
+
+# Tarif de l'API Message Batches : moitié du prix des appels unitaires
+BATCH_PRICE_FACTOR = 0.5
+
+
+def record_claude_usage(model: str, response, price_factor: float = 1.0):
+    """Tokens, motif d'arrêt et coût d'une réponse (appel unitaire ou résultat d'un lot, sans latence propre)."""
+    usage = getattr(response, "usage", None)
+
+    stop_reason = getattr(response, "stop_reason", None)
+    if isinstance(stop_reason, str):
+        CLAUDE_STOP_REASONS.labels(model=model, stop_reason=stop_reason).inc()
+
+    if usage is not None:
+        for token_type, field in (("input", "input_tokens"), ("output", "output_tokens"),
+                                  ("cache_read", "cache_read_input_tokens"),
+                                  ("cache_creation", "cache_creation_input_tokens")):
+            CLAUDE_TOKENS.labels(model=model, type=token_type).inc(_token_count(usage, field))
+        CLAUDE_COST_USD.labels(model=model).inc(compute_claude_cost(model, usage) * price_factor)
+        for totals in _token_trackers.get():
+            totals["tokens"] += _token_count(usage, "input_tokens") + _token_count(usage, "output_tokens")
+
+
 def push_metrics_to_gateway(job_name="verbatim_pipeline", instance="dev"):
     # 1) on nettoie le groupe précédent (même job/instance)
     delete_from_gateway(
@@ -0,0 +1,15 @@
+# Mock des réponses de l'API Messages de Claude et lecture des métriques Prometheus, partagées par les tests.
+
+
+class MockMessageContent:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockResponse:
+    def __init__(self, text_content):
+        self.content = [MockMessageContent(text_content)]
+
+
+def metric_value(metric, name, **labels):
+    return next((s.value for m in metric.collect() for s in m.samples if s.name == name and s.labels == labels), 0.0)
@@ -0,0 +1,197 @@
+# Faux serveur de l'API Messages d'Anthropic, lancé localement dans un thread.
+# Permet de tester les appels réels du SDK (HTTP, pool de connexions, concurrence) sans réseau
+# ni clé API, avec une latence injectée pour mesurer les gains de parallélisme.
+
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 2.0}]})
+
+
+class _Server(ThreadingHTTPServer):
+    # File d'attente de listen() par défaut à 5 : au-delà, les connexions simultanées du pool perdent leur
+    # SYN et attendent ~1 s la retransmission, ce qui fausse les mesures de parallélisme
+    request_queue_size = 128
+
+
+class MockClaudeServer:
+    def __init__(self, latency: float = 0.0, response_text: str = DEFAULT_RESPONSE, batch_polls: int = 1,
+                 trailing_delay: float = 0.0):
+        self.latency = latency
+        self.response_text = response_text
+        # Streaming : pause avant les tokens de fin (balise ```), pour mesurer la complétion anticipée
+        self.trailing_delay = trailing_delay
+        # Nombre de consultations d'un lot renvoyant "in_progress" avant "ended"
+        self.batch_polls = batch_polls
+        self.batches = {}
+        self.failing_custom_ids = set()
+        self.requests = []
+        self.client_ports = set()
+        self.active = 0
+        self.peak_concurrency = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def message_payload(self, body: dict) -> dict:
+        return {
+            "id": f"msg_{len(self.requests)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "claude-3-haiku-20240307"),
+            "content": [{"type": "text", "text": self.response_text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 5},
+        }
+
+    def handle_post(self, path: str, body: dict) -> tuple[int, dict]:
+        """Point d'extension pour les autres endpoints simulés."""
+        if path == "/v1/messages":
+            return 200, self.message_payload(body)
+        if path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{len(self.batches)}"
+            self.batches[batch_id] = {"requests": body["requests"], "polls": 0}
+            return 200, self.batch_payload(batch_id)
+        parts = path.strip("/").split("/")  # v1/messages/batches/<id>/cancel
+        if len(parts) == 5 and parts[4] == "cancel" and parts[3] in self.batches:
+            self.batches[parts[3]]["canceled"] = True
+            return 200, self.batch_payload(parts[3])
+        return 404, {"type": "error", "error": {"type": "not_found_error", "message": path}}
+
+    def handle_get(self, path: str) -> tuple[int, dict | str]:
+        parts = path.strip("/").split("/")  # v1/messages/batches/<id>[/results]
+        if len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"] and parts[3] in self.batches:
+            batch_id = parts[3]
+            if len(parts) == 5 and parts[4] == "results":
+                return 200, self.batch_results(batch_id)
+            self.batches[batch_id]["polls"] += 1
+            return 200, self.batch_payload(batch_id)
+        return 404, {"type": "error", "error": {"type": "not_found_error", "message": path}}
+
+    def stream_events(self, body: dict):
+        """Événements SSE d'une réponse en streaming : (nom, données, pause avant envoi)."""
+        message = {**self.message_payload(body), "content": [], "stop_reason": None}
+        message["usage"] = {"input_tokens": 10, "output_tokens": 1}
+        yield "message_start", {"type": "message_start", "message": message}, 0
+        yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}}, 0
+        text = "```json\n" + self.response_text
+        step = max(1, len(text) // 4)
+        for i in range(0, len(text), step):
+            yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": text[i:i + step]}}, 0
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                      "delta": {"type": "text_delta", "text": "\n```"}}, self.trailing_delay
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}, 0
+        yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": 5}}, 0
+        yield "message_stop", {"type": "message_stop"}, 0
+
+    def batch_payload(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = batch["polls"] > self.batch_polls
+        n = len(batch["requests"])
+        failed = sum(1 for r in batch["requests"] if r["custom_id"] in self.failing_custom_ids)
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else n,
+                "succeeded": n - failed if ended else 0,
+                "errored": failed if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T01:00:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": "2025-01-01T00:30:00Z" if batch.get("canceled") else None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def batch_results(self, batch_id: str) -> str:
+        """Résultats au format JSONL, dans l'ordre inverse des requêtes (l'API ne garantit pas l'ordre)."""
+        lines = []
+        for request in reversed(self.batches[batch_id]["requests"]):
+            if request["custom_id"] in self.failing_custom_ids:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "boom"}}}
+            else:
+                result = {"type": "succeeded", "message": self.message_payload(request["params"])}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        return "\n".join(lines) + "\n"
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for name, data, pause in events:
+                        time.sleep(pause)
+                        self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client parti avant la fin du flux
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if body.get("stream"):
+                    with mock._lock:
+                        mock.requests.append({"path": self.path, "body": body})
+                    time.sleep(mock.latency)
+                    self._stream(mock.stream_events(body))
+                    return
+                with mock._lock:
+                    mock.requests.append({"path": self.path, "body": body})
+                    mock.client_ports.add(self.client_address[1])
+                    mock.active += 1
+                    mock.peak_concurrency = max(mock.peak_concurrency, mock.active)
+                try:
+                    time.sleep(mock.latency)
+                    status, payload = mock.handle_post(self.path.split("?")[0], body)
+                finally:
+                    with mock._lock:
+                        mock.active -= 1
+                self._send(status, payload)
+
+            def do_GET(self):
+                status, payload = mock.handle_get(self.path.split("?")[0])
+                content_type = "application/x-jsonl" if isinstance(payload, str) else "application/json"
+                self._send(status, payload, content_type)
+
+        return Handler
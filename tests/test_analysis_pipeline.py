@@ -0,0 +1,110 @@
+import threading, time
+import pytest
+from unittest.mock import MagicMock, patch
+from api.analysis_pipeline import run_pipelined_analysis
+from monitoring.metrics import PIPELINE_QUEUE_DEPTH, PIPELINE_STAGE_THROUGHPUT
+
+LABEL_TO_ID = {"Livraison et retrait": "t1", "Prix et promotions": "t2"}
+
+
+def verbatims(n):
+    return [{"review_id": f"r{i}", "content": f"avis {i}", "rating": 1 + i % 5} for i in range(n)]
+
+
+def fake_classify(content, rating=None):
+    time.sleep(0.01)
+    index = int(content.split()[1])
+    if index % 10 == 0:
+        return []
+    if index % 10 == 1:
+        raise RuntimeError("surcharge")
+    return [{"theme": "Livraison et retrait", "note": 2.0}, {"theme": "Prix et promotions", "note": 4.0}]
+
+
+def run(source, classify_fn=fake_classify, **kwargs):
+    client = MagicMock()
+    client.insert_rows_json.return_value = []
+    with patch("api.analysis_pipeline.load_topic_ids", return_value=LABEL_TO_ID), \
+         patch("api.analysis_pipeline.refresh_topic_aggregates") as refresh:
+        stats = run_pipelined_analysis("2025-06-01", classify_fn=classify_fn, verbatims=source,
+                                       client=client, **kwargs)
+    return stats, client, refresh
+
+
+def test_pipeline_matches_sequential_stats_and_batches_inserts():
+    stats, client, refresh = run(verbatims(40), workers=4, queue_size=5, batch_rows=20)
+
+    assert stats == {"scrape_date": "2025-06-01", "verbatims": 40, "analyzed": 32, "empty": 4, "errors": 4,
+                     "skipped": 0, "deferred": 0}
+    inserted = [row for call in client.insert_rows_json.call_args_list for row in call.args[1]]
+    assert len(inserted) == 64
+    assert {row["review_id"] for row in inserted} == {f"r{i}" for i in range(40) if i % 10 > 1}
+    assert client.insert_rows_json.call_count < 32
+    assert sorted(refresh.call_args.args[0]) == sorted(f"r{i}" for i in range(40) if i % 10 > 1)
+
+
+def test_reader_is_throttled_by_bounded_queue():
+    read = []
+    lead = []
+
+    def source():
+        for v in verbatims(30):
+            read.append(v["review_id"])
+            yield v
+
+    def observing_classify(content, rating=None):
+        # avance du lecteur sur l'avis en cours de classification
+        lead.append(len(read) - int(content.split()[1]))
+        return fake_classify(content, rating)
+
+    stats, _, _ = run(source(), classify_fn=observing_classify, workers=1, queue_size=3, batch_rows=100)
+
+    assert stats["verbatims"] == 30
+    # file de 3 + l'avis en cours de classification + celui que le lecteur tente d'ajouter
+    assert max(lead) <= 5
+
+
+def test_pipeline_exports_queue_depth_and_stage_throughput():
+    run(verbatims(12), workers=2, queue_size=4, batch_rows=10)
+
+    for stage in ("read", "classify", "write"):
+        assert PIPELINE_STAGE_THROUGHPUT.labels(stage=stage)._value.get() > 0
+    assert PIPELINE_QUEUE_DEPTH.labels(queue="verbatims")._value.get() <= 4
+
+
+def test_reanalysis_replaces_previous_rows_and_keeps_them_when_deletion_fails():
+    stats, client, _ = run(verbatims(4), workers=1, batch_rows=100)
+
+    delete = client.query.call_args_list[0]
+    assert delete.args[0].startswith("DELETE FROM")
+    assert delete.kwargs["job_config"].query_parameters[0].values == ["r2", "r3"]
+    assert stats["analyzed"] == 2
+
+    client = MagicMock()
+    client.query.side_effect = RuntimeError("rows in the streaming buffer")
+    with patch("api.analysis_pipeline.load_topic_ids", return_value=LABEL_TO_ID), \
+         patch("api.analysis_pipeline.refresh_topic_aggregates"):
+        stats = run_pipelined_analysis("2025-06-01", classify_fn=fake_classify, verbatims=verbatims(4),
+                                       client=client, workers=1, batch_rows=100)
+
+    client.insert_rows_json.assert_not_called()
+    assert stats["analyzed"] == 0
+
+
+def test_failed_write_stops_and_joins_the_pipeline_threads():
+    classified = []
+
+    def counting_classify(content, rating=None):
+        classified.append(content)
+        return fake_classify(content, rating)
+
+    client = MagicMock()
+    client.insert_rows_json.side_effect = RuntimeError("BigQuery indisponible")
+    with patch("api.analysis_pipeline.load_topic_ids", return_value=LABEL_TO_ID), \
+         patch("api.analysis_pipeline.refresh_topic_aggregates"), \
+         pytest.raises(RuntimeError, match="BigQuery indisponible"):
+        run_pipelined_analysis("2025-06-01", classify_fn=counting_classify, verbatims=verbatims(200),
+                               client=client, workers=2, queue_size=2, batch_rows=2)
+
+    assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
+    assert len(classified) < 200
@@ -0,0 +1,18 @@
+from unittest.mock import MagicMock
+from google.cloud import bigquery
+from api.analysis_schema import add_source_column
+
+
+def test_migration_adds_the_source_column_once():
+    client = MagicMock()
+    client.get_table.return_value.schema = [bigquery.SchemaField("review_id", "STRING")]
+
+    assert add_source_column(client) is True
+
+    table = client.update_table.call_args.args[0]
+    assert [field.name for field in table.schema] == ["review_id", "source"]
+
+    client.update_table.reset_mock()
+    client.get_table.return_value.schema = table.schema
+    assert add_source_column(client) is False
+    client.update_table.assert_not_called()
@@ -65,3 +65,22 @@ def test_insert_topic_analysis_invalid_note(mock_get_project_id, mock_bq_client,
     assert "Note invalide pour KnownTheme1 : 0" in captured.out
     assert "Note invalide pour KnownTheme2 : 6" in captured.out
     assert "Note invalide pour KnownTheme3 : abc" in captured.out
+
+@patch('api.analyze_and_insert.bigquery.Client')
+@patch('api.analyze_and_insert.get_project_id', return_value='test-project')
+def test_insert_topic_analysis_replaces_previous_rows(mock_get_project_id, mock_bq_client):
+    """
+    Une nouvelle analyse d'un avis supprime ses lignes précédentes avant d'insérer les nouvelles.
+    """
+    client = mock_bq_client.return_value
+    client.insert_rows_json.return_value = []
+    calls = MagicMock()
+    calls.attach_mock(client.query, "query")
+    calls.attach_mock(client.insert_rows_json, "insert")
+
+    insert_topic_analysis("r1", [{"theme": "KnownTheme1", "note": 2}], {"KnownTheme1": "t1"})
+
+    assert [name for name, _, _ in calls.mock_calls if name in ("query", "insert")] == ["query", "insert"]
+    delete = client.query.call_args
+    assert delete.args[0].startswith("DELETE FROM")
+    assert delete.kwargs["job_config"].query_parameters[0].values == ["r1"]
@@ -0,0 +1,106 @@
+import json, threading, time
+from unittest.mock import patch
+from api import backfill as bf
+
+
+def fake_stats(scrape_date, **kwargs):
+    return {"scrape_date": scrape_date, "verbatims": 2, "analyzed": 2, "empty": 0, "errors": 0}
+
+
+def test_date_range_inclusive():
+    assert bf.date_range("2025-01-30", "2025-02-02") == ["2025-01-30", "2025-01-31", "2025-02-01", "2025-02-02"]
+
+
+@patch("api.backfill.get_gcp_credentials_path")
+@patch("api.backfill.run_analysis", side_effect=fake_stats)
+def test_backfill_tracks_progress_and_throughput(mock_run, mock_creds, tmp_path):
+    """Chaque date est analysée une fois, l'avancement est persisté et le débit total est calculé."""
+    progress_path = tmp_path / "progress.json"
+
+    totals = bf.backfill("2025-01-01", "2025-01-05", max_workers=3, progress_path=str(progress_path))
+
+    assert mock_run.call_count == 5
+    assert totals["dates_done"] == 5
+    assert totals["verbatims"] == 10
+    assert totals["verbatims_per_second"] > 0
+    saved = json.loads(progress_path.read_text())["dates"]
+    assert all(saved[d]["status"] == "done" for d in bf.date_range("2025-01-01", "2025-01-05"))
+
+
+@patch("api.backfill.get_gcp_credentials_path")
+@patch("api.backfill.run_analysis", side_effect=fake_stats)
+def test_backfill_resumes_after_interruption(mock_run, mock_creds, tmp_path):
+    """Les dates terminées lors d'un précédent backfill sont ignorées, les dates en échec sont relancées."""
+    progress_path = tmp_path / "progress.json"
+    progress_path.write_text(json.dumps({"dates": {
+        "2025-01-01": {"status": "done"},
+        "2025-01-02": {"status": "failed"},
+    }}))
+
+    bf.backfill("2025-01-01", "2025-01-03", progress_path=str(progress_path))
+
+    processed = sorted(call[0][0] for call in mock_run.call_args_list)
+    assert processed == ["2025-01-02", "2025-01-03"]
+
+
+@patch("api.backfill.get_gcp_credentials_path")
+def test_dates_with_errors_or_deferred_reviews_are_retried(mock_creds, tmp_path):
+    """Une date avec des avis en erreur ou reportés reste à relancer ; la relance reprend par avis."""
+    progress_path = tmp_path / "progress.json"
+    first_run = {"2025-01-01": {"errors": 1}, "2025-01-02": {"deferred": 3}, "2025-01-03": {}}
+
+    def partial_stats(scrape_date, **kwargs):
+        return {**fake_stats(scrape_date), **first_run[scrape_date]}
+
+    with patch("api.backfill.run_analysis", side_effect=partial_stats):
+        totals = bf.backfill("2025-01-01", "2025-01-03", progress_path=str(progress_path),
+                             checkpoint_dir=str(tmp_path))
+    with patch("api.backfill.run_analysis", side_effect=fake_stats) as mock_run:
+        bf.backfill("2025-01-01", "2025-01-03", progress_path=str(progress_path), checkpoint_dir=str(tmp_path))
+
+    assert totals["dates_partial"] == 2
+    assert sorted(call[0][0] for call in mock_run.call_args_list) == ["2025-01-01", "2025-01-02"]
+    assert all(call.kwargs["checkpoint_dir"] == str(tmp_path) for call in mock_run.call_args_list)
+    saved = json.loads(progress_path.read_text())["dates"]
+    assert {d["status"] for d in saved.values()} == {"done"}
+
+
+@patch("api.backfill.get_gcp_credentials_path")
+def test_bigquery_errors_mark_the_date_failed_instead_of_done(mock_creds, tmp_path):
+    """Une lecture en échec ne donne pas une date vide terminée : la date est en échec, donc relancée."""
+    progress_path = tmp_path / "progress.json"
+
+    with patch("api.bq_connect.bigquery.Client") as mock_client, \
+         patch("api.analyze_and_insert.get_verbatims_by_date", return_value=[]):
+        mock_client.return_value.query.side_effect = RuntimeError("BigQuery indisponible")
+        totals = bf.backfill("2025-01-01", "2025-01-01", progress_path=str(progress_path), checkpoint_dir="")
+
+    assert totals["dates_failed"] == 1 and totals["dates_done"] == 0
+    saved = json.loads(progress_path.read_text())["dates"]
+    assert saved["2025-01-01"]["status"] == "failed"
+    assert "BigQuery indisponible" in saved["2025-01-01"]["error"]
+
+
+def test_limit_concurrency_caps_simultaneous_calls():
+    """Le plafond global d'appels à Claude est respecté même avec plus de threads que de places."""
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def slow_classify(verbatim):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return []
+
+    limited = bf.limit_concurrency(slow_classify, 2)
+    threads = [threading.Thread(target=limited, args=("avis",)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak == 2
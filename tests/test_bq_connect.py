@@ -17,8 +17,8 @@ def test_get_verbatims_by_date_success(mock_bq_client_class):
     mock_bq_client = mock_bq_client_class.return_value
     # créé des résultats fictifs
     mock_query_result = [
-        create_mock_row({"review_id": "id1", "content": "Avis 1"}),
-        create_mock_row({"review_id": "id2", "content": "Avis 2"})
+        create_mock_row({"review_id": "id1", "content": "Avis 1", "rating": 1}),
+        create_mock_row({"review_id": "id2", "content": "Avis 2", "rating": 5})
     ]
     #on simule le retour de la méthode query().result()
     mock_bq_client.query.return_value.result.return_value = mock_query_result
@@ -30,8 +30,8 @@ def test_get_verbatims_by_date_success(mock_bq_client_class):
     # et que les résultats sont bien formatés comme attendu
     mock_bq_client.query.assert_called_once()
     assert len(results) == 2
-    assert results[0] == {"review_id": "id1", "content": "Avis 1"}
-    assert results[1] == {"review_id": "id2", "content": "Avis 2"}
+    assert results[0] == {"review_id": "id1", "content": "Avis 1", "rating": 1}
+    assert results[1] == {"review_id": "id2", "content": "Avis 2", "rating": 5}
 
 @patch('api.bq_connect.bigquery.Client')
 def test_get_verbatims_by_date_no_results(mock_bq_client_class):
@@ -122,6 +122,7 @@ def test_insert_topic_analysis_valid_notes(mock_bq_client_class):
     assert rows[1]["topic_id"] == 102
     assert rows[1]["score_0_1"] == round((5 - 3.0) / 4, 2)
     assert rows[1]["label_sentiment"] == "Neutre"
+    assert {row["source"] for row in rows} == {"claude"}
 
 
 
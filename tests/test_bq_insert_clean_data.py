@@ -89,3 +89,80 @@ def test_deduplicate_reviews_bigquery_error(mock_bq_client, capsys):
     mock_client_instance.query.assert_called_once() # Query to identify duplicates
     captured = capsys.readouterr()
     assert "BigQuery connection error" not in captured.out # Error should be raised, not printed
+
+
+@patch('api.bq_insert_clean_data.bigquery.Client')
+def test_insert_clean_reviews_explicit_schema_gzip(mock_bq_client, tmp_path, capsys):
+    """
+    Le CSV est envoyé compressé (gzip) avec un schéma explicite, et le nombre de lignes vient du job.
+    """
+    import gzip
+    from api.bq_insert_clean_data import insert_clean_reviews_to_bq, REVIEWS_SCHEMA
+
+    csv_path = tmp_path / "avis_clean.csv"
+    csv_content = b"review_id,rating,content,author,publication_date,scrape_date\nid1,5,Super,A,2025-08-27,2025-08-28\n"
+    csv_path.write_bytes(csv_content)
+
+    mock_client_instance = mock_bq_client.return_value
+    uploaded = {}
+
+    def fake_load(file_obj, table_id, job_config):
+        uploaded["data"] = file_obj.read()
+        uploaded["job_config"] = job_config
+        return MagicMock(output_rows=1)
+
+    mock_client_instance.load_table_from_file.side_effect = fake_load
+    mock_client_instance.query.return_value.num_dml_affected_rows = 1
+
+    insert_clean_reviews_to_bq(str(csv_path))
+
+    assert gzip.decompress(uploaded["data"]) == csv_content
+    assert uploaded["job_config"].autodetect is not True
+    assert [f.name for f in uploaded["job_config"].schema] == [f.name for f in REVIEWS_SCHEMA]
+    mock_client_instance.query.assert_called_once()
+    captured = capsys.readouterr()
+    assert "1 lignes chargées dans trustpilot-satisfaction.reviews_dataset.temp_reviews" in captured.out
+
+
+@patch('api.bq_insert_clean_data.bigquery.Client')
+def test_insert_clean_reviews_multiple_files_single_merge(mock_bq_client, tmp_path):
+    """
+    Plusieurs fichiers sont chargés dans la table temporaire, puis un seul MERGE est exécuté.
+    """
+    from api.bq_insert_clean_data import insert_clean_reviews_to_bq
+
+    paths = []
+    for name in ("brand_a.csv", "brand_b.csv", "brand_c.csv"):
+        p = tmp_path / name
+        p.write_text("review_id,rating,content,author,publication_date,scrape_date\nid,1,x,y,2025-01-01,2025-01-02\n")
+        paths.append(str(p))
+
+    mock_client_instance = mock_bq_client.return_value
+    mock_client_instance.load_table_from_file.return_value = MagicMock(output_rows=1)
+
+    insert_clean_reviews_to_bq(paths)
+
+    assert mock_client_instance.load_table_from_file.call_count == 3
+    mock_client_instance.delete_table.assert_called_once()
+    mock_client_instance.create_table.assert_called_once()
+    mock_client_instance.query.assert_called_once()
+
+
+@patch('api.bq_insert_clean_data.bigquery.Client')
+def test_insert_clean_reviews_no_rows_skips_merge(mock_bq_client, tmp_path, capsys):
+    """
+    Un fichier ne contenant que l'en-tête ne déclenche pas de MERGE.
+    """
+    from api.bq_insert_clean_data import insert_clean_reviews_to_bq
+
+    csv_path = tmp_path / "header_only.csv"
+    csv_path.write_text("review_id,rating,content,author,publication_date,scrape_date\n")
+
+    mock_client_instance = mock_bq_client.return_value
+    mock_client_instance.load_table_from_file.return_value = MagicMock(output_rows=0)
+
+    insert_clean_reviews_to_bq(str(csv_path))
+
+    mock_client_instance.query.assert_not_called()
+    captured = capsys.readouterr()
+    assert "Rien à insérer dans BigQuery" in captured.out
@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import patch
+from api.analyze_and_insert import build_topic_rows, run_analysis
+from api.checkpoint import AnalysisCheckpoint
+
+LABEL_TO_ID = {"Livraison et retrait": "t1", "Prix et promotions": "t2"}
+VERBATIMS = [{"review_id": f"r{i}", "content": f"avis {i}", "rating": 2} for i in range(6)]
+THEMES = [{"theme": "Livraison et retrait", "note": 2.0}, {"theme": "Prix et promotions", "note": 4.0}]
+
+
+class Crash(BaseException):
+    """Arrêt brutal du processus (non intercepté par run_analysis)."""
+
+
+def test_row_ids_are_deterministic_per_version():
+    rows, _ = build_topic_rows("r1", THEMES, LABEL_TO_ID, version="v1")
+    again, _ = build_topic_rows("r1", THEMES, LABEL_TO_ID, version="v1")
+    other, _ = build_topic_rows("r1", THEMES, LABEL_TO_ID, version="v2")
+
+    assert [r["id"] for r in rows] == [r["id"] for r in again]
+    assert len({r["id"] for r in rows}) == 2
+    assert not {r["id"] for r in rows} & {r["id"] for r in other}
+
+
+def test_interrupted_run_resumes_without_reclassifying(tmp_path):
+    classified = []
+
+    def classify(content, rating=None, crash_at=None):
+        if len(classified) == crash_at:
+            raise Crash()
+        classified.append(content)
+        return [] if content == "avis 1" else THEMES
+
+    with patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS), \
+         patch("api.analyze_and_insert.load_topic_ids", return_value=LABEL_TO_ID), \
+         patch("api.analyze_and_insert.refresh_topic_aggregates"), \
+         patch("api.analyze_and_insert.bigquery.Client") as mock_client:
+        mock_client.return_value.insert_rows_json.return_value = []
+        with pytest.raises(Crash):
+            run_analysis("2025-06-01", classify_fn=lambda c, rating=None: classify(c, rating, crash_at=3),
+                         checkpoint_dir=str(tmp_path))
+        stats = run_analysis("2025-06-01", classify_fn=classify, checkpoint_dir=str(tmp_path))
+
+    assert classified == [f"avis {i}" for i in range(6)]
+    assert stats["skipped"] == 3 and stats["verbatims"] == 6 and stats["analyzed"] == 3
+    calls = mock_client.return_value.insert_rows_json.call_args_list
+    ids = [row["id"] for call in calls for row in call.args[1]]
+    assert len(ids) == len(set(ids)) == 10
+    assert all(call.kwargs["row_ids"] == [row["id"] for row in call.args[1]] for call in calls)
+
+
+def test_checkpoint_ignores_truncated_last_line(tmp_path):
+    path = tmp_path / "run.jsonl"
+    checkpoint = AnalysisCheckpoint(str(path))
+    checkpoint.mark_done(["r1", "r2"])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"review_id": "r3", "sta')
+
+    reloaded = AnalysisCheckpoint(str(path))
+
+    assert reloaded.is_done("r1") and reloaded.is_done("r2") and not reloaded.is_done("r3")
+    assert reloaded.pending(VERBATIMS[:4]) == [VERBATIMS[0], VERBATIMS[3]]
+
+
+def test_default_checkpoint_dir_survives_reboots():
+    import os, tempfile
+    from api.checkpoint import DEFAULT_CHECKPOINT_DIR
+
+    # hors du répertoire temporaire : la reprise d'une exécution ne peut pas reposer sur l'insertId seul
+    assert not DEFAULT_CHECKPOINT_DIR.startswith(tempfile.gettempdir())
+    assert DEFAULT_CHECKPOINT_DIR.endswith(os.path.join("data", "checkpoints"))
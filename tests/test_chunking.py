@@ -0,0 +1,77 @@
+import json
+import pytest
+from unittest.mock import patch
+from api.chunking import merge_chunk_themes, split_verbatim
+from api.claude_interface import classify_with_claude
+from api.prompt_utils import estimate_tokens
+from tests.claude_mocks import MockResponse
+
+LONG_REVIEW = " ".join(
+    f"Phrase numéro {i} de cet avis très détaillé sur la livraison et le service client." for i in range(60)
+)
+
+
+def test_short_verbatim_is_not_split():
+    assert split_verbatim("Livraison rapide, merci.", max_tokens=600) == ["Livraison rapide, merci."]
+
+
+def test_long_verbatim_is_split_on_sentences_within_limit():
+    chunks = split_verbatim(LONG_REVIEW, max_tokens=200)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 200 for c in chunks)
+    assert all(c.endswith(".") for c in chunks)
+    assert " ".join(chunks) == LONG_REVIEW
+
+
+def test_sentence_longer_than_limit_is_split_on_words():
+    chunks = split_verbatim("mot " * 500, max_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 100 for c in chunks)
+
+
+def test_merge_averages_notes_per_theme():
+    merged = merge_chunk_themes([
+        [{"theme": "Livraison et retrait", "note": 2.0}],
+        None,
+        [{"theme": "Livraison et retrait", "note": 3.0}, {"theme": "Service client / SAV", "note": 5.0}],
+    ])
+
+    assert merged == [
+        {"theme": "Livraison et retrait", "note": 2.5},
+        {"theme": "Service client / SAV", "note": 5.0},
+    ]
+    assert merge_chunk_themes([None, None]) is None
+
+
+@patch("api.chunking.MAX_VERBATIM_TOKENS", 200)
+def test_classify_with_claude_sends_one_request_per_chunk():
+    responses = [
+        MockResponse(json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 2.0}]})),
+        MockResponse(json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 4.0}]})),
+    ] * 10
+    with patch("api.claude_interface.client.messages.create", side_effect=responses) as mock_create:
+        result = classify_with_claude(LONG_REVIEW)
+
+    assert mock_create.call_count == len(split_verbatim(LONG_REVIEW, max_tokens=200))
+    assert [t["theme"] for t in result] == ["Livraison et retrait"]
+
+
+@patch("api.chunking.MAX_VERBATIM_TOKENS", 200)
+def test_failed_chunk_does_not_discard_the_others():
+    n = len(split_verbatim(LONG_REVIEW, max_tokens=200))
+    responses = [RuntimeError("surcharge")] + [
+        MockResponse(json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 2.0}]}))
+    ] * (n - 1)
+    with patch("api.claude_interface.client.messages.create", side_effect=responses):
+        result = classify_with_claude(LONG_REVIEW)
+
+    assert result == [{"theme": "Livraison et retrait", "note": 2.0}]
+
+
+@patch("api.chunking.MAX_VERBATIM_TOKENS", 200)
+def test_verbatim_fails_only_when_every_chunk_fails():
+    with patch("api.claude_interface.client.messages.create", side_effect=RuntimeError("surcharge")):
+        with pytest.raises(RuntimeError):
+            classify_with_claude(LONG_REVIEW)
@@ -0,0 +1,147 @@
+import json
+import anthropic
+import pytest
+from unittest.mock import patch
+from api import response_cache
+from api.claude_batch import classify_batch, make_custom_id
+from api.prompt_utils import build_verbatim_prompt
+from api.scheduler import AnalysisScheduler
+from api.response_cache import ResponseCache
+from monitoring.metrics import BATCH_PRICE_FACTOR, CLAUDE_COST_USD, CLAUDE_TOKENS
+from tests.mock_claude_server import MockClaudeServer
+from tests.claude_mocks import metric_value
+
+VERBATIMS = [
+    {"review_id": "b9a7f9f8a9e00230d62a4ba781bd9732", "content": "Livraison en retard"},
+    {"review_id": "b4c4e7d6bca997abf89bb448d6d89f0a", "content": "Colis perdu"},
+    {"review_id": "id avec espaces", "content": "Toujours pas livré"},
+]
+
+
+def test_make_custom_id_sanitizes_invalid_ids():
+    assert make_custom_id(0, "abc_123-X") == "abc_123-X"
+    assert make_custom_id(2, "id avec espaces") == "verbatim-2"
+
+
+def test_classify_batch_submits_once_and_returns_results_in_order():
+    """Tous les prompts partent dans un seul lot ; les résultats (dans le désordre) sont remis dans l'ordre d'entrée."""
+    with MockClaudeServer(batch_polls=2) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        server.failing_custom_ids = {"b4c4e7d6bca997abf89bb448d6d89f0a"}
+        outcomes = classify_batch(VERBATIMS, client=client, poll_seconds=0.01)
+
+    submissions = [r for r in server.requests if r["path"] == "/v1/messages/batches"]
+    assert len(submissions) == 1
+    sent = submissions[0]["body"]["requests"]
+    assert [r["params"]["messages"][0]["content"] for r in sent] == [build_verbatim_prompt(v["content"]) for v in VERBATIMS]
+
+    assert outcomes[0]["themes"] == [{"theme": "Livraison et retrait", "note": 2.0}]
+    assert outcomes[0]["error"] is None
+    assert outcomes[1]["themes"] is None and outcomes[1]["error"] is not None
+    assert outcomes[2]["themes"] == [{"theme": "Livraison et retrait", "note": 2.0}]
+
+
+@patch("api.analyze_and_insert.refresh_topic_aggregates")
+@patch("api.analyze_and_insert.insert_topic_analysis", return_value={"insert_errors": False, "new_topics": []})
+@patch("api.analyze_and_insert.load_topic_ids", return_value={"Livraison et retrait": "T2"})
+@patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS)
+def test_run_analysis_batch_mode(mock_get, mock_topics, mock_insert, mock_refresh):
+    """En mode batch, run_analysis passe par le lot et insère chaque résultat validé."""
+    from api.analyze_and_insert import run_analysis
+
+    with MockClaudeServer(batch_polls=0) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        with patch("api.claude_interface.client", client), patch("api.claude_batch.BATCH_POLL_SECONDS", 0.01):
+            stats = run_analysis("2025-08-28", mode="batch")
+
+    assert not [r for r in server.requests if r["path"] == "/v1/messages"]
+    assert mock_insert.call_count == 3
+    assert stats["analyzed"] == 3
+
+
+# --- Même chemin que le mode interactif : cache, cascade, découpage, métriques ---
+
+CASCADE = ["claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"]
+
+
+class CascadeServer(MockClaudeServer):
+    """Le premier modèle de la cascade ne trouve aucun thème, le second répond normalement."""
+
+    def message_payload(self, body: dict) -> dict:
+        payload = super().message_payload(body)
+        if body.get("model") == CASCADE[0]:
+            payload["content"] = [{"type": "text", "text": json.dumps({"themes": []})}]
+        return payload
+
+
+def submitted_batches(server):
+    return [r["body"]["requests"] for r in server.requests if r["path"] == "/v1/messages/batches"]
+
+
+@patch("api.claude_interface.CLAUDE_MODEL_CASCADE", CASCADE)
+def test_cascade_escalates_in_a_second_batch():
+    with CascadeServer(batch_polls=0) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        outcomes = classify_batch(VERBATIMS[:2], client=client, poll_seconds=0.01)
+
+    batches = submitted_batches(server)
+    assert [[r["params"]["model"] for r in batch] for batch in batches] == [[CASCADE[0]] * 2, [CASCADE[1]] * 2]
+    assert [o["themes"] for o in outcomes] == [[{"theme": "Livraison et retrait", "note": 2.0}]] * 2
+
+
+def test_cached_verbatims_are_not_resubmitted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    with patch.object(response_cache, "_cache", cache), patch.object(response_cache, "RESPONSE_CACHE_ENABLED", True), \
+         MockClaudeServer(batch_polls=0) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        first = classify_batch(VERBATIMS[:2], client=client, poll_seconds=0.01)
+        second = classify_batch(VERBATIMS, client=client, poll_seconds=0.01)
+    cache.close()
+
+    batches = submitted_batches(server)
+    assert len(batches) == 2
+    assert [r["custom_id"] for r in batches[1]] == ["verbatim-0"]  # seul le verbatim absent du cache
+    assert [o["themes"] for o in second[:2]] == [o["themes"] for o in first]
+
+
+@patch("api.chunking.MAX_VERBATIM_TOKENS", 200)
+def test_long_verbatims_are_submitted_in_chunks_and_merged():
+    from api.chunking import split_verbatim
+    long_review = " ".join(f"Phrase numéro {i} sur la livraison du colis." for i in range(60))
+
+    with MockClaudeServer(batch_polls=0) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        outcomes = classify_batch([{"review_id": "long", "content": long_review}], client=client, poll_seconds=0.01)
+
+    chunks = split_verbatim(long_review, max_tokens=200)
+    assert len(chunks) > 1
+    assert [r["custom_id"] for r in submitted_batches(server)[0]] == [f"long_{j}" for j in range(len(chunks))]
+    assert outcomes[0]["themes"] == [{"theme": "Livraison et retrait", "note": 2.0}]
+
+
+def test_batch_results_record_tokens_and_discounted_cost():
+    model = CASCADE[0]
+    before = {
+        "output": metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="output"),
+        "cost": metric_value(CLAUDE_COST_USD, "claude_cost_usd_total", model=model),
+    }
+
+    with MockClaudeServer(batch_polls=0) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        classify_batch(VERBATIMS, client=client, poll_seconds=0.01)
+
+    assert metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="output") == before["output"] + 15
+    assert metric_value(CLAUDE_COST_USD, "claude_cost_usd_total", model=model) == pytest.approx(
+        before["cost"] + 3 * BATCH_PRICE_FACTOR * (10 * 0.25 + 5 * 1.25) / 1_000_000)
+
+
+def test_batch_unfinished_at_the_deadline_is_canceled_and_deferred():
+    """L'attente est limitée au temps restant avant l'échéance : le lot est annulé et ses avis reportés."""
+    scheduler = AnalysisScheduler(deadline_seconds=0.2, token_budget=0, reserve_seconds=0.1)
+    with MockClaudeServer(batch_polls=1000) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        outcomes = classify_batch(VERBATIMS, client=client, poll_seconds=0.02, scheduler=scheduler)
+
+    assert outcomes == [None, None, None]
+    assert [batch.get("canceled") for batch in server.batches.values()] == [True]
+    assert scheduler.stop_reason == "deadline"
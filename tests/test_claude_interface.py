@@ -1,17 +1,11 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from api.claude_interface import classify_with_claude, validate_claude_response
+from api.claude_interface import classify_with_claude, validate_claude_response, classify_many
+from api.prompt_utils import build_verbatim_prompt
+from tests.claude_mocks import MockResponse, metric_value
+from tests.mock_claude_server import MockClaudeServer
 import json
 
-# Mock de la réponse réussie de Claude
-class MockMessageContent:
-    def __init__(self, text):
-        self.text = text
-
-class MockResponse:
-    def __init__(self, text_content):
-        self.content = [MockMessageContent(text_content)]
-
 def test_classify_with_claude_success():
     """Teste que classify_with_claude gère une réponse réussie de Claude."""
     mock_claude_output = {
@@ -155,3 +149,204 @@ def test_validate_claude_response_non_json_string_input():
     """Teste que validate_claude_response lève une erreur pour une chaîne non-JSON."""
     with pytest.raises(ValueError, match="Réponse Claude invalide"):
         validate_claude_response("Ceci n'est pas du JSON")
+
+# --- Classification asynchrone (serveur Claude simulé avec latence) ---
+
+
+def test_classify_many_preserves_order_and_reports_errors():
+    """Les résultats sont renvoyés dans l'ordre d'entrée, avec la durée de chaque appel."""
+    with MockClaudeServer(latency=0.01) as server:
+        outcomes = classify_many(["avis 1", "avis 2", "avis 3"], concurrency=3, base_url=server.base_url)
+
+    assert [o["themes"] for o in outcomes] == [[{"theme": "Livraison et retrait", "note": 2.0}]] * 3
+    assert all(o["error"] is None and o["duration"] > 0 for o in outcomes)
+    sent = [r["body"]["messages"][0]["content"] for r in server.requests]
+    assert sorted(sent) == sorted(build_verbatim_prompt(v) for v in ["avis 1", "avis 2", "avis 3"])
+
+
+def test_classify_many_near_linear_speedup():
+    """Avec une latence injectée, le temps total baisse quasi linéairement jusqu'à la limite de concurrence."""
+    import time
+    latency, n = 0.1, 16
+
+    def timed(concurrency):
+        with MockClaudeServer(latency=latency) as server:
+            start = time.time()
+            classify_many([f"avis {i}" for i in range(n)], concurrency=concurrency, base_url=server.base_url)
+            return time.time() - start, server
+
+    sequential, _ = timed(1)
+    parallel, server = timed(8)
+
+    assert server.peak_concurrency <= 8
+    # Pool keep-alive partagé : pas plus de connexions que la limite de concurrence
+    assert len(server.client_ports) <= 8
+    assert sequential / parallel > 4
+
+
+def test_build_request_caches_static_instructions():
+    """Consignes et thèmes dans un bloc system mis en cache ; seul le verbatim varie d'un appel à l'autre."""
+    from api.claude_interface import build_request
+    from api.taxonomy import get_theme_block
+
+    first, second = build_request("avis 1"), build_request("avis 2")
+    assert first["system"] == second["system"]
+    assert first["system"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert get_theme_block() in first["system"][-1]["text"]
+    assert first["messages"] == [{"role": "user", "content": build_verbatim_prompt("avis 1")}]
+    assert get_theme_block() not in first["messages"][0]["content"]
+
+
+def test_classify_with_claude_records_prompt_cache_usage():
+    from monitoring.metrics import CLAUDE_API_LATENCY, CLAUDE_TOKENS
+    model = "claude-3-haiku-20240307"
+
+    response = MockResponse('{"themes": []}')
+    response.usage = MagicMock(input_tokens=20, cache_read_input_tokens=1500, cache_creation_input_tokens=0)
+    read_before = metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="cache_read")
+    hits_before = metric_value(CLAUDE_API_LATENCY, "claude_api_latency_seconds_count", model=model, cache="hit")
+
+    with patch('api.claude_interface.client.messages.create', return_value=response):
+        classify_with_claude("avis")
+
+    assert metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="cache_read") == read_before + 1500
+    assert metric_value(CLAUDE_API_LATENCY, "claude_api_latency_seconds_count",
+                        model=model, cache="hit") == hits_before + 1
+
+
+# --- Mode tool-use (sortie structurée) ---
+
+def tool_message(themes_input, block_id="toolu_1"):
+    from anthropic.types import Message, ToolUseBlock, Usage
+    return Message(
+        id="msg_1", type="message", role="assistant", model="claude-3-haiku-20240307",
+        content=[ToolUseBlock(type="tool_use", id=block_id, name="enregistrer_themes", input=themes_input)],
+        stop_reason="tool_use", stop_sequence=None, usage=Usage(input_tokens=10, output_tokens=5),
+    )
+
+
+@patch("api.claude_interface.CLAUDE_OUTPUT_MODE", "tool")
+def test_tool_mode_declares_constrained_schema_and_reads_arguments():
+    from api.taxonomy import get_theme_labels
+    answer = {"themes": [{"theme": "Livraison et retrait", "note": 2}]}
+
+    with patch("api.claude_interface.client.messages.create", return_value=tool_message(answer)) as mock_create:
+        assert classify_with_claude("Colis livré avec deux semaines de retard.") == answer["themes"]
+
+    kwargs = mock_create.call_args.kwargs
+    mock_create.assert_called_once()
+    assert kwargs["tool_choice"] == {"type": "tool", "name": "enregistrer_themes"}
+    item_schema = kwargs["tools"][0]["input_schema"]["properties"]["themes"]["items"]["properties"]
+    assert set(item_schema["theme"]["enum"]) == set(get_theme_labels())
+    assert (item_schema["note"]["minimum"], item_schema["note"]["maximum"]) == (1, 5)
+
+
+@patch("api.claude_interface.CLAUDE_OUTPUT_MODE", "tool")
+def test_tool_mode_repairs_only_invalid_arguments():
+    invalid = tool_message({"themes": [{"theme": "Livraison et retrait", "note": 7}]}, block_id="toolu_bad")
+    fixed = tool_message({"themes": [{"theme": "Livraison et retrait", "note": 2}]})
+
+    with patch("api.claude_interface.client.messages.create", side_effect=[invalid, fixed]) as mock_create:
+        result = classify_with_claude("Colis livré avec deux semaines de retard.")
+
+    assert result == [{"theme": "Livraison et retrait", "note": 2}]
+    assert mock_create.call_count == 2
+    repair_messages = mock_create.call_args_list[1].kwargs["messages"]
+    assert repair_messages[1]["content"][0]["id"] == "toolu_bad"
+    tool_result = repair_messages[2]["content"][0]
+    assert tool_result["tool_use_id"] == "toolu_bad" and tool_result["is_error"] is True
+    assert "Note invalide" in tool_result["content"]
+
+
+# --- Mode streaming ---
+
+def test_json_scanner_completes_on_closing_brace():
+    from api.streaming import JsonObjectScanner
+    scanner = JsonObjectScanner()
+
+    assert scanner.feed('```json\n{"themes": [{"theme": "Prix ') is None
+    assert scanner.feed('{et} promotions", "note": 2}') is None
+    assert scanner.feed(']}\n```') == '{"themes": [{"theme": "Prix {et} promotions", "note": 2}]}'
+
+
+@patch("api.claude_interface.CLAUDE_STREAMING", True)
+def test_streaming_returns_before_trailing_tokens():
+    import anthropic, time
+    from api import claude_interface
+
+    with MockClaudeServer(trailing_delay=2.0) as server:
+        streaming_client = anthropic.Anthropic(api_key="test", base_url=server.base_url, max_retries=0)
+        with patch.object(claude_interface, "client", streaming_client):
+            start = time.time()
+            result = classify_with_claude("Colis livré en retard.")
+            elapsed = time.time() - start
+
+    assert result == [{"theme": "Livraison et retrait", "note": 2.0}]
+    assert server.requests[0]["body"]["stream"] is True
+    assert elapsed < 1.5
+
+
+# --- Cascade de modèles ---
+
+CASCADE = ["claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"]
+
+
+@patch("api.claude_interface.CLAUDE_MODEL_CASCADE", CASCADE)
+def test_cascade_keeps_fast_tier_answer_when_consistent():
+    answer = MockResponse(json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 1.0}]}))
+    with patch('api.claude_interface.client.messages.create', return_value=answer) as mock_create:
+        assert classify_with_claude("Colis jamais arrivé.", rating=1) == [{"theme": "Livraison et retrait", "note": 1.0}]
+
+    assert [c.kwargs["model"] for c in mock_create.call_args_list] == CASCADE[:1]
+
+
+@pytest.mark.parametrize("first_answer, rating", [
+    ("pas du JSON", None),                                                          # réponse invalide
+    (json.dumps({"themes": []}), None),                                             # aucun thème
+    (json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 5.0}]}), 1),  # 1 étoile, notes positives
+])
+@patch("api.claude_interface.CLAUDE_MODEL_CASCADE", CASCADE)
+def test_cascade_escalates_on_failure_or_ambiguity(first_answer, rating):
+    strong = MockResponse(json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 1.0}]}))
+    with patch('api.claude_interface.client.messages.create',
+               side_effect=[MockResponse(first_answer), strong]) as mock_create:
+        result = classify_with_claude("Colis jamais arrivé.", rating=rating)
+
+    assert result == [{"theme": "Livraison et retrait", "note": 1.0}]
+    assert [c.kwargs["model"] for c in mock_create.call_args_list] == CASCADE
+
+
+# --- Instrumentation par appel ---
+
+def test_compute_claude_cost_uses_model_prices():
+    from monitoring.metrics import compute_claude_cost
+    usage = MagicMock(input_tokens=1_000_000, output_tokens=1_000_000,
+                      cache_creation_input_tokens=0, cache_read_input_tokens=1_000_000)
+
+    assert compute_claude_cost("claude-3-haiku-20240307", usage) == pytest.approx(0.25 + 1.25 + 0.03)
+    assert compute_claude_cost("modele-inconnu", usage) == 0.0
+
+
+def test_each_api_call_exports_latency_tokens_stop_reason_and_cost():
+    import anthropic
+    from api import claude_interface
+    from monitoring.metrics import CLAUDE_API_LATENCY, CLAUDE_COST_USD, CLAUDE_STOP_REASONS, CLAUDE_TOKENS
+    model = "claude-3-haiku-20240307"
+    before = {
+        "calls": metric_value(CLAUDE_API_LATENCY, "claude_api_latency_seconds_count", model=model, cache="none"),
+        "output": metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="output"),
+        "end_turn": metric_value(CLAUDE_STOP_REASONS, "claude_stop_reasons_total", model=model, stop_reason="end_turn"),
+        "cost": metric_value(CLAUDE_COST_USD, "claude_cost_usd_total", model=model),
+    }
+
+    with MockClaudeServer() as server:
+        mock_client = anthropic.Anthropic(api_key="test", base_url=server.base_url, max_retries=0)
+        with patch.object(claude_interface, "client", mock_client):
+            classify_with_claude("Colis livré en retard.")
+
+    assert metric_value(CLAUDE_API_LATENCY, "claude_api_latency_seconds_count", model=model, cache="none") == before["calls"] + 1
+    assert metric_value(CLAUDE_TOKENS, "claude_tokens_total", model=model, type="output") == before["output"] + 5
+    assert metric_value(CLAUDE_STOP_REASONS, "claude_stop_reasons_total",
+                        model=model, stop_reason="end_turn") == before["end_turn"] + 1
+    assert metric_value(CLAUDE_COST_USD, "claude_cost_usd_total", model=model) == pytest.approx(
+        before["cost"] + (10 * 0.25 + 5 * 1.25) / 1_000_000)
@@ -0,0 +1,76 @@
+import genericpath, gzip, json, logging, time
+from unittest.mock import patch
+from api import claude_logging
+from api.claude_interface import logger, parse_text_response
+from api.claude_logging import build_file_handler, configure_async_logging, should_log_raw_body, stop_listener
+
+
+class SlowHandler(logging.Handler):
+    """Handler dont chaque écriture prend 0,2 s (disque saturé)."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        time.sleep(0.2)
+        self.messages.append(record.getMessage())
+
+
+def test_logging_call_does_not_wait_for_slow_handler():
+    slow = SlowHandler()
+    test_logger = logging.getLogger("test_claude_logging_async")
+    test_logger.setLevel(logging.INFO)
+    test_logger.propagate = False
+
+    listener = configure_async_logging(test_logger, handlers=[slow])
+    start = time.time()
+    for i in range(5):
+        test_logger.info(f"message {i}")
+    elapsed = time.time() - start
+    stop_listener(listener)
+
+    assert elapsed < 0.1
+    assert slow.messages == [f"message {i}" for i in range(5)]
+
+
+def test_rotated_logs_are_compressed(tmp_path):
+    with patch.object(claude_logging, "CLAUDE_LOG_DIR", str(tmp_path)), \
+         patch.object(claude_logging, "CLAUDE_LOG_MAX_BYTES", 200):
+        handler = build_file_handler("claude.log")
+    rotating_logger = logging.getLogger("test_claude_logging_rotation")
+    rotating_logger.propagate = False
+    rotating_logger.addHandler(handler)
+    # conftest force os.path.exists à True : la rotation a besoin de la vraie réponse
+    with patch("os.path.exists", genericpath.exists):
+        for i in range(20):
+            rotating_logger.warning(f"ligne de log numéro {i}")
+    handler.close()
+
+    archives = sorted(tmp_path.glob("claude.log.*.gz"))
+    assert archives
+    assert "ligne de log" in gzip.open(archives[0], "rt", encoding="utf-8").read()
+
+
+def test_raw_bodies_sampled_for_successes_and_kept_for_failures():
+    assert should_log_raw_body(valid=False, sample_rate=0.0)
+    assert not should_log_raw_body(valid=True, sample_rate=0.0)
+    assert should_log_raw_body(valid=True, sample_rate=1.0)
+
+
+def test_parse_text_response_logs_only_sampled_valid_bodies():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    valid = json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 2.0}]})
+    try:
+        with patch.object(claude_logging, "CLAUDE_LOG_SAMPLE_RATE", 0.0):
+            parse_text_response(valid)
+            parse_text_response(json.dumps({"autre": []}))
+    finally:
+        logger.removeHandler(handler)
+
+    messages = [r.getMessage() for r in records]
+    assert not [m for m in messages if valid in m]
+    assert [m for m in messages if m.startswith("Réponse non valide")]
@@ -0,0 +1,87 @@
+import importlib.util, sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+import pytest
+from tests.test_import_time import HEAVY_MODULES, import_times
+
+CLOUD_FUNCTION_DIR = Path(__file__).resolve().parent.parent / "cloud_function"
+
+
+def load_cloud_function_module(path: str):
+    """Charge un module de la Cloud Function par son chemin (son package api masquerait celui du projet)."""
+    name = "cloud_function_" + path.removesuffix(".py").replace("/", "_")
+    spec = importlib.util.spec_from_file_location(name, CLOUD_FUNCTION_DIR / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    monkeypatch.syspath_prepend(str(CLOUD_FUNCTION_DIR))
+    module = load_cloud_function_module("clients.py")
+    monkeypatch.setitem(sys.modules, "clients", module)
+    yield module
+    module.reset_clients()
+
+
+@pytest.fixture
+def cloud_main(clients):
+    return load_cloud_function_module("main.py")
+
+
+def test_clients_are_created_once_and_reused(clients):
+    with patch("google.cloud.bigquery.Client") as bigquery_client:
+        first = clients.get_bigquery_client()
+        second = clients.get_bigquery_client()
+
+    assert first is second
+    bigquery_client.assert_called_once_with()
+
+    clients.reset_clients()
+    with patch("google.cloud.bigquery.Client") as bigquery_client:
+        assert clients.get_bigquery_client() is not first
+
+
+def test_loading_main_defers_heavy_imports(tmp_path):
+    times = import_times("import sys; sys.path.insert(0, '.'); import main", CLOUD_FUNCTION_DIR)
+
+    assert not [m for m in HEAVY_MODULES if m in {n.strip() for n in times}]
+
+
+def test_pipeline_stages_are_imported_on_first_use(cloud_main, tmp_path, monkeypatch):
+    (tmp_path / "cf_stage_probe.py").write_text("def run():\n    return 'ok'\n", encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "cf_stage_probe", raising=False)
+
+    run = cloud_main.load_stage("cf_stage_probe", "run")
+
+    assert "cf_stage_probe" in sys.modules
+    assert run() == "ok"
+    assert cloud_main.load_stage("cf_stage_probe", "run") is run
+
+
+def test_startup_records_import_time_then_first_and_warm_requests(cloud_main):
+    assert cloud_main.STARTUP["import_seconds"] > 0
+    assert cloud_main.STARTUP["first_request_seconds"] is None
+
+    with patch.object(cloud_main, "run_pipeline"):
+        assert cloud_main.main(MagicMock()).status_code == 200
+        first = cloud_main.STARTUP["first_request_seconds"]
+        cloud_main.main(MagicMock())
+
+    assert first is not None
+    assert cloud_main.STARTUP["first_request_seconds"] == first
+    assert cloud_main.STARTUP["invocations"] == 2
+
+
+def test_bigquery_helpers_use_the_instance_client(clients):
+    module = load_cloud_function_module("api/bq_insert_clean_data.py")
+    shared = clients._clients["bigquery"] = MagicMock()
+    shared.query.return_value.result.return_value = [{"nb_to_delete": 0, "ids": []}]
+
+    with patch("google.cloud.bigquery.Client") as bigquery_client:
+        module.deduplicate_reviews()
+
+    bigquery_client.assert_not_called()
+    shared.query.assert_called_once()
@@ -0,0 +1,175 @@
+import importlib, json, sys, types
+from unittest.mock import MagicMock
+import pytest
+from tests.test_cloud_function_startup import CLOUD_FUNCTION_DIR, clients  # noqa: F401 (fixture)
+
+THEMES = [{"theme": "Livraison et retrait", "note": 2.0}, {"theme": "Prix et promotions", "note": 4.0}]
+LABEL_TO_ID = {"Livraison et retrait": "t1", "Prix et promotions": "t2"}
+
+
+@pytest.fixture
+def cloud_api(clients, monkeypatch):
+    """Package api de la Cloud Function sous un autre nom (celui du projet s'appelle aussi api)."""
+    package = types.ModuleType("cloud_function_api")
+    package.__path__ = [str(CLOUD_FUNCTION_DIR / "api")]
+    monkeypatch.setitem(sys.modules, "cloud_function_api", package)
+    yield lambda name: importlib.import_module(f"cloud_function_api.{name}")
+    for name in [n for n in sys.modules if n.startswith("cloud_function_api.")]:
+        del sys.modules[name]
+
+
+def test_topic_rows_get_stable_ids_sent_as_insert_ids(cloud_api, clients):
+    module = cloud_api("analyze_and_insert")
+    client = clients._clients["bigquery"] = MagicMock()
+    client.insert_rows_json.return_value = []
+
+    module.insert_topic_analysis("r1", THEMES, LABEL_TO_ID)
+    module.insert_topic_analysis("r1", THEMES, LABEL_TO_ID)
+
+    first, second = client.insert_rows_json.call_args_list
+    ids = [row["id"] for row in first.args[1]]
+    assert ids == [module.analysis_row_id("r1", "t1"), module.analysis_row_id("r1", "t2")]
+    assert first.kwargs["row_ids"] == ids
+    assert [row["id"] for row in second.args[1]] == ids
+
+
+def shard_message(fanout, review_ids, shard=0, offset=0):
+    return {"scrape_date": "2025-06-01", "run_id": "run", "shard": shard, "shards": 1, "review_ids": review_ids,
+            "token": fanout.encode_token("run", shard, offset)}
+
+
+def test_shard_without_progress_is_not_republished(cloud_api):
+    fanout = cloud_api("fanout")
+    queue = fanout.LocalQueue()
+
+    result = fanout.process_shard(shard_message(fanout, ["a", "b"]), lambda ids, should_stop: ({}, ids), queue)
+
+    assert not queue.topics[fanout.WORK]
+    assert result["stalled"] == 2 and not result["final"]
+    assert not fanout.aggregate_results([result])["complete"]
+
+
+def test_each_invocation_analyzes_at_least_one_review(cloud_api, monkeypatch):
+    module = cloud_api("analyze_and_insert")
+    monkeypatch.setattr(module, "get_verbatims_by_ids", lambda ids: [{"review_id": i, "content": i} for i in ids])
+    monkeypatch.setattr(module, "load_topic_ids", lambda: LABEL_TO_ID)
+    monkeypatch.setattr(module, "analyze_verbatim", lambda v, label_to_id: "analyzed")
+
+    counts, remaining = module.analyze_review_ids(["a", "b", "c"], should_stop=lambda: True)
+
+    assert counts["analyzed"] == 1
+    assert remaining == ["b", "c"]
+
+
+def test_review_ids_are_split_into_fixed_size_shards(cloud_api):
+    fanout = cloud_api("fanout")
+
+    assert fanout.shard_ids(list("abcde"), shard_size=2) == [["a", "b"], ["c", "d"], ["e"]]
+    assert fanout.shard_ids([], shard_size=2) == []
+
+
+def test_continuation_token_round_trips(cloud_api):
+    fanout = cloud_api("fanout")
+
+    assert fanout.decode_token(fanout.encode_token("run", 3, 150)) == {"run_id": "run", "shard": 3, "offset": 150}
+
+
+def test_shard_near_timeout_republishes_the_rest_with_a_new_token(cloud_api):
+    fanout = cloud_api("fanout")
+    queue = fanout.LocalQueue()
+
+    def analyze(ids, should_stop):
+        return {"analyzed": 2}, ids[2:]
+
+    result = fanout.process_shard(shard_message(fanout, list("abcde"), offset=10), analyze, queue)
+
+    (event,) = queue.topics[fanout.WORK]
+    continuation = fanout.decode_event(event)
+    assert continuation["review_ids"] == ["c", "d", "e"]
+    assert fanout.decode_token(continuation["token"]) == {"run_id": "run", "shard": 0, "offset": 12}
+    assert not result["final"] and result["analyzed"] == 2
+    assert fanout.decode_event(queue.topics[fanout.RESULTS][0]) == result
+
+
+def test_should_stop_leaves_the_reserve_before_the_timeout(cloud_api):
+    fanout = cloud_api("fanout")
+    now = [0.0]
+    stops = []
+
+    def analyze(ids, should_stop):
+        for t in (0, 479, 480):
+            now[0] = t
+            stops.append(should_stop())
+        return {}, []
+
+    fanout.process_shard(shard_message(fanout, ["a"]), analyze, fanout.LocalQueue(), timeout_seconds=540,
+                         reserve_seconds=60, clock=lambda: now[0])
+
+    assert stops == [False, False, True]
+
+
+def test_redelivered_results_are_counted_once(cloud_api):
+    fanout = cloud_api("fanout")
+    first = {"token": "t0", "shard": 0, "shards": 2, "final": False, "analyzed": 3, "errors": 1}
+    rest = {"token": "t1", "shard": 0, "shards": 2, "final": True, "analyzed": 2}
+    other = {"token": "t2", "shard": 1, "shards": 2, "final": True, "analyzed": 4, "empty": 1}
+
+    summary = fanout.aggregate_results([first, rest, first, other, other])
+
+    assert summary == {"invocations": 3, "continuations": 1, "shards_done": 2, "shards": 2,
+                       "analyzed": 9, "empty": 1, "errors": 1, "stalled": 0, "complete": True}
+
+
+def test_local_fanout_processes_every_shard_and_continuation(cloud_api, monkeypatch):
+    module = cloud_api("analyze_and_insert")
+    fanout = cloud_api("fanout")
+    monkeypatch.setattr(module, "get_review_ids_by_date", lambda scrape_date: list("abcde"))
+    analyzed = []
+
+    def analyze(ids, should_stop):
+        analyzed.append(ids[0])  # un avis par invocation : chaque lot se poursuit par continuation
+        return {"analyzed": 1}, ids[1:]
+
+    monkeypatch.setattr(module, "analyze_review_ids", analyze)
+
+    summary = module.run_fanout("2025-06-01", queue=fanout.LocalQueue(), shard_size=2)
+
+    assert sorted(analyzed) == list("abcde")
+    assert summary["complete"] and summary["shards"] == 3 and summary["analyzed"] == 5
+    assert summary["continuations"] == 2
+
+
+def test_results_trigger_stores_each_result_and_summarizes_final_ones(cloud_api, monkeypatch):
+    module = cloud_api("analyze_and_insert")
+    fanout = cloud_api("fanout")
+    stored = []
+    monkeypatch.setattr(module, "insert_shard_result", lambda result, received_at: stored.append(result))
+    monkeypatch.setattr(module, "get_shard_results", lambda run_id: list(stored))
+    queue = fanout.LocalQueue()
+    partial = {"run_id": "run", "scrape_date": "2025-06-01", "token": "t0", "shard": 0, "shards": 1,
+               "final": False, "analyzed": 1}
+    final = {**partial, "token": "t1", "final": True}
+    for result in (partial, final, final):  # le dernier bilan est redélivré
+        queue.publish(fanout.RESULTS, result)
+
+    queue.drain(fanout.RESULTS, lambda event: module.results_trigger(event, None))
+
+    assert len(stored) == 3
+    summary = module.summarize_run("run")
+    assert summary["complete"] and summary["invocations"] == 2 and summary["analyzed"] == 2
+
+
+def test_shard_results_are_stored_with_their_token_as_insert_id(cloud_api, clients):
+    bq_connect = cloud_api("bq_connect")
+    client = clients._clients["bigquery"] = MagicMock()
+    client.insert_rows_json.return_value = []
+    result = {"run_id": "run", "token": "t1", "final": True, "analyzed": 2}
+
+    bq_connect.insert_shard_result(result, received_at="2025-06-01T00:00:00")
+    bq_connect.insert_shard_result(result, received_at="2025-06-01T00:00:01")
+
+    client.create_table.assert_called_once()
+    table_id, rows = client.insert_rows_json.call_args.args
+    assert table_id == bq_connect.SHARD_RESULTS_TABLE_ID
+    assert client.insert_rows_json.call_args.kwargs["row_ids"] == ["t1"]
+    assert json.loads(rows[0]["result"]) == result
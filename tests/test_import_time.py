@@ -0,0 +1,61 @@
+import ast, os, subprocess, sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DAG_PATH = PROJECT_ROOT / "airflow" / "dags" / "trustpilot_dag.py"
+
+# Budget d'import (µs) des modules chargés au parsing du DAG, hors Airflow lui-même
+DAG_IMPORT_BUDGET_US = 150_000
+CLAUDE_INTERFACE_IMPORT_BUDGET_US = 150_000
+HEAVY_MODULES = ("anthropic", "google.cloud.bigquery", "pandas", "bs4")
+
+
+def import_times(statements: str, cwd) -> dict:
+    """Temps cumulés (µs) de `python -X importtime`, par module, hors imports du démarrage de l'interpréteur."""
+    env = {**os.environ, "PYTHONPATH": str(PROJECT_ROOT)}
+    env.pop("PYTEST_RUNNING", None)
+
+    def run(code):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                cwd=cwd, env=env, capture_output=True, text=True, check=True)
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+                _, cumulative, name = line.split("|")
+                times[name[1:].rstrip()] = int(cumulative)  # indentation = profondeur d'import
+        return times
+
+    startup = {name.strip() for name in run("pass")}
+    return {name: us for name, us in run(statements).items() if name.strip() not in startup}
+
+
+def top_level_total(times: dict) -> int:
+    return sum(us for name, us in times.items() if not name.startswith(" "))
+
+
+def dag_import_statements() -> str:
+    """Imports de premier niveau du DAG, hors Airflow / pendulum (non installés hors du conteneur)."""
+    statements = []
+    for node in ast.parse(DAG_PATH.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names if a.name.split(".")[0] not in ("airflow", "pendulum")]
+            statements += [f"import {n}" for n in names]
+        elif isinstance(node, ast.ImportFrom) and node.module.split(".")[0] not in ("airflow", "pendulum"):
+            statements.append(ast.unparse(node))
+    return "; ".join(statements)
+
+
+def test_dag_parsing_imports_stay_within_budget(tmp_path):
+    times = import_times(dag_import_statements(), tmp_path)
+
+    assert not [m for m in HEAVY_MODULES if m in {n.strip() for n in times}]
+    assert top_level_total(times) < DAG_IMPORT_BUDGET_US
+
+
+def test_importing_claude_interface_is_cheap_and_side_effect_free(tmp_path):
+    # Pas de .env chargé, pas de client créé, pas de fichier de log ouvert dans le répertoire courant
+    times = import_times("import api.claude_interface", tmp_path)
+
+    assert not [m for m in HEAVY_MODULES if m in {n.strip() for n in times}]
+    assert top_level_total(times) < CLAUDE_INTERFACE_IMPORT_BUDGET_US
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,99 @@
+import time
+from unittest.mock import patch
+from api.local_classifier import LocalThemeClassifier, agreement_report, classify_local, split_holdout
+
+LABELS = ["Livraison et retrait", "Prix et promotions", "Service client / SAV"]
+
+TEMPLATES = [
+    ("Colis livré en retard de {n} jours, livraison catastrophique.", [("Livraison et retrait", 1.5)]),
+    ("Prix très intéressants, promo de {n} euros, pas cher.", [("Prix et promotions", 4.5)]),
+    ("Le service client ne répond pas depuis {n} jours, SAV injoignable.", [("Service client / SAV", 1.0)]),
+    ("Livraison rapide en {n} jours et prix imbattables.", [("Livraison et retrait", 4.5), ("Prix et promotions", 4.5)]),
+]
+
+
+def labelled_samples(n):
+    return [{
+        "review_id": f"r{i}",
+        "content": TEMPLATES[i % len(TEMPLATES)][0].format(n=i),
+        "themes": [{"theme": t, "note": note} for t, note in TEMPLATES[i % len(TEMPLATES)][1]],
+    } for i in range(n)]
+
+
+def trained_model():
+    return LocalThemeClassifier(LABELS, n_features=2 ** 14).fit(labelled_samples(200), epochs=20)
+
+
+def test_local_model_reproduces_claude_labels():
+    model = trained_model()
+    _, test = split_holdout(labelled_samples(400), holdout=0.2)
+
+    report = agreement_report(model, test)
+
+    assert report["f1"] >= 0.95
+    assert report["note_mae"] <= 0.5
+    assert model.predict(["Livraison rapide en 3 jours et prix imbattables."])[0] == [
+        {"theme": "Livraison et retrait", "note": 4.5}, {"theme": "Prix et promotions", "note": 4.5},
+    ]
+
+
+def test_saved_model_predicts_identically(tmp_path):
+    model = trained_model()
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+
+    texts = [s["content"] for s in labelled_samples(20)]
+    loaded = LocalThemeClassifier.load(path)
+    assert loaded.predict(texts) == model.predict(texts)
+    assert loaded.version == model.version
+
+
+def test_retrained_model_gets_a_new_version():
+    model = trained_model()
+    retrained = LocalThemeClassifier(LABELS, n_features=2 ** 14).fit(labelled_samples(100), epochs=20)
+
+    assert model.version == trained_model().version
+    assert retrained.version != model.version
+
+
+def test_local_mode_scores_thousands_of_reviews_per_second():
+    model = trained_model()
+    verbatims = [{"review_id": s["review_id"], "content": s["content"]} for s in labelled_samples(5000)]
+
+    start = time.time()
+    outcomes = classify_local(verbatims, model=model)
+
+    assert len(outcomes) == 5000 and all(o["error"] is None for o in outcomes)
+    assert 5000 / (time.time() - start) > 1000
+
+
+@patch("api.analyze_and_insert.refresh_topic_aggregates")
+@patch("api.analyze_and_insert.insert_topic_analysis", return_value={"insert_errors": False, "new_topics": []})
+@patch("api.analyze_and_insert.load_topic_ids", return_value={label: f"T{i}" for i, label in enumerate(LABELS)})
+@patch("api.analyze_and_insert.get_verbatims_by_date")
+def test_run_analysis_local_mode_makes_no_api_call(mock_get, mock_topics, mock_insert, mock_refresh):
+    from api.analyze_and_insert import run_analysis
+
+    mock_get.return_value = [{"review_id": s["review_id"], "content": s["content"]} for s in labelled_samples(8)]
+    model = trained_model()
+    with patch("api.local_classifier.get_local_classifier", return_value=model), \
+         patch("api.claude_interface.client.messages.create") as mock_create:
+        stats = run_analysis("2025-08-28", mode="local")
+
+    mock_create.assert_not_called()
+    assert stats["analyzed"] == 8
+
+    # Prédictions du modèle local marquées comme telles dans topic_analysis
+    assert {c.kwargs["source"] for c in mock_insert.call_args_list} == {"local"}
+    # ... et rattachées à la version du modèle qui les a produites
+    assert {c.kwargs["version"] for c in mock_insert.call_args_list} == {f"local:{model.version}"}
+
+
+def test_training_labels_exclude_local_predictions():
+    from api.local_classifier import fetch_claude_labels
+
+    with patch("google.cloud.bigquery.Client") as mock_client:
+        mock_client.return_value.query.return_value.result.return_value = []
+        fetch_claude_labels("2025-06-01", "2025-06-30")
+
+    assert "COALESCE(ta.source, 'claude') = 'claude'" in mock_client.return_value.query.call_args.args[0]
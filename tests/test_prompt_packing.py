@@ -0,0 +1,158 @@
+import json
+from unittest.mock import MagicMock, patch
+from api.prompt_packing import (
+    pack_reviews, build_packed_prompt, build_packed_system_blocks, validate_packed_response, classify_packed,
+    benchmark_packing,
+)
+from api.prompt_utils import estimate_tokens
+
+
+def make_verbatims(lengths):
+    return [{"review_id": f"r{i}", "content": "x" * n} for i, n in enumerate(lengths)]
+
+
+def claude_message(text, input_tokens=100, output_tokens=20):
+    response = MagicMock()
+    response.content = [MagicMock(text=text)]
+    response.usage.input_tokens = input_tokens
+    response.usage.output_tokens = output_tokens
+    return response
+
+
+def test_pack_reviews_respects_token_budget():
+    """Chaque paquet reste sous le budget, sauf un avis trop long qui est isolé."""
+    verbatims = make_verbatims([350, 700, 70, 1400, 35, 3500])
+    budget = 400
+
+    packs = pack_reviews(verbatims, token_budget=budget, max_reviews=10)
+
+    assert sorted(v["review_id"] for p in packs for v in p) == sorted(v["review_id"] for v in verbatims)
+    for pack in packs:
+        total = sum(estimate_tokens(v["content"]) for v in pack)
+        assert total <= budget or len(pack) == 1
+    assert len(packs) < len(verbatims)
+
+
+def test_pack_reviews_respects_max_reviews():
+    packs = pack_reviews(make_verbatims([10] * 7), token_budget=10_000, max_reviews=3)
+    assert [len(p) for p in packs] == [3, 3, 1]
+
+
+def test_build_packed_prompt_lists_each_review_once():
+    verbatims = [{"review_id": "abc", "content": "Livraison rapide"}, {"review_id": "def", "content": "Prix trop élevés"}]
+    prompt = build_packed_prompt(verbatims)
+    assert '[abc] "Livraison rapide"' in prompt
+    assert '[def] "Prix trop élevés"' in prompt
+    # consignes et thèmes dans le bloc system mis en cache, pas dans la partie variable
+    assert "Liste des thèmes" not in prompt
+    system = build_packed_system_blocks()
+    assert system[0]["text"].count("Liste des thèmes") == 1
+    assert system[0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_validate_packed_response_splits_per_review():
+    """Chaque avis est validé séparément ; les entrées manquantes ou malformées sont à relancer."""
+    response = json.dumps({
+        "a": {"themes": [{"theme": "Prix et promotions", "note": 2}]},
+        "b": {"themes": []},
+        "c": "pas un objet",
+    })
+    results, failed = validate_packed_response(response, ["a", "b", "c", "d"])
+
+    assert results == {"a": [{"theme": "Prix et promotions", "note": 2}], "b": None}
+    assert failed == ["c", "d"]
+
+
+def test_validate_packed_response_invalid_json_fails_all():
+    results, failed = validate_packed_response("{pas du json", ["a", "b"])
+    assert results == {} and failed == ["a", "b"]
+
+
+@patch("api.prompt_packing.classify_with_claude", return_value=[{"theme": "Qualité des produits", "note": 1}])
+def test_classify_packed_retries_only_failed_reviews(mock_single):
+    """Un seul appel pour le paquet ; seul l'avis absent de la réponse est relancé individuellement."""
+    verbatims = [{"review_id": "a", "content": "Prix ok"}, {"review_id": "b", "content": "Produit cassé"}]
+    client = MagicMock()
+    client.messages.create.return_value = claude_message(json.dumps({
+        "a": {"themes": [{"theme": "Prix et promotions", "note": 4}]},
+    }))
+
+    outcomes = classify_packed(verbatims, client=client)
+
+    client.messages.create.assert_called_once()
+    mock_single.assert_called_once_with("Produit cassé", rating=None)
+    assert outcomes[0]["themes"] == [{"theme": "Prix et promotions", "note": 4}]
+    assert outcomes[1]["themes"] == [{"theme": "Qualité des produits", "note": 1}]
+
+
+def test_benchmark_packing_reports_tokens_and_throughput():
+    verbatims = [{"review_id": f"r{i}", "content": "Livraison en retard"} for i in range(4)]
+    packed_answer = json.dumps({v["review_id"]: {"themes": [{"theme": "Livraison et retrait", "note": 1}]} for v in verbatims})
+    single_answer = json.dumps({"themes": [{"theme": "Livraison et retrait", "note": 1}]})
+    client = MagicMock()
+    client.messages.create.side_effect = (
+        [claude_message(single_answer, 700, 30)] * 4 + [claude_message(packed_answer, 760, 120)]
+    )
+
+    report = benchmark_packing(verbatims, client=client)
+
+    assert report["single"]["tokens_per_review"] == 730
+    assert report["packed"]["tokens_per_review"] == 220
+    assert report["packed"]["calls"] == 1
+    assert report["packed"]["reviews_per_second"] > 0
+
+
+CASCADE = ["claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"]
+
+
+@patch("api.claude_interface.CLAUDE_MODEL_CASCADE", CASCADE)
+def test_classify_packed_escalates_ambiguous_reviews_in_a_new_pack():
+    """Pack envoyé au premier modèle de la cascade ; l'avis ambigu repart dans un paquet pour le suivant."""
+    verbatims = [{"review_id": "a", "content": "Prix ok", "rating": 4},
+                 {"review_id": "b", "content": "Colis perdu", "rating": 1}]
+    client = MagicMock()
+    client.messages.create.side_effect = [
+        claude_message(json.dumps({"a": {"themes": [{"theme": "Prix et promotions", "note": 4}]},
+                                   "b": {"themes": [{"theme": "Livraison et retrait", "note": 5}]}})),
+        claude_message(json.dumps({"b": {"themes": [{"theme": "Livraison et retrait", "note": 1}]}})),
+    ]
+
+    outcomes = classify_packed(verbatims, client=client)
+
+    calls = client.messages.create.call_args_list
+    assert [c.kwargs["model"] for c in calls] == CASCADE
+    assert calls[0].kwargs["system"] == build_packed_system_blocks()
+    assert "[b]" in calls[1].kwargs["messages"][0]["content"] and "[a]" not in calls[1].kwargs["messages"][0]["content"]
+    assert outcomes[0]["themes"] == [{"theme": "Prix et promotions", "note": 4}]
+    assert outcomes[1]["themes"] == [{"theme": "Livraison et retrait", "note": 1}]
+
+
+def test_classify_packed_counts_tokens_of_individual_retries():
+    verbatims = [{"review_id": "a", "content": "Prix ok"}, {"review_id": "b", "content": "Produit cassé"}]
+    client = MagicMock()
+    client.messages.create.return_value = claude_message(json.dumps({
+        "a": {"themes": [{"theme": "Prix et promotions", "note": 4}]},
+    }), 300, 40)
+    single = claude_message(json.dumps({"themes": [{"theme": "Qualité des produits", "note": 1}]}), 700, 30)
+
+    stats = {}
+    with patch("api.claude_interface.client.messages.create", return_value=single):
+        classify_packed(verbatims, client=client, stats=stats)
+
+    assert stats == {"calls": 1, "tokens": 340 + 730, "retried": 1}
+
+
+@patch("api.claude_logging.CLAUDE_LOG_SAMPLE_RATE", 0.0)
+@patch("api.prompt_packing.classify_with_claude", return_value=None)
+def test_raw_pack_body_logged_only_when_a_review_fails(mock_single):
+    verbatims = [{"review_id": "a", "content": "Prix ok"}, {"review_id": "b", "content": "Produit cassé"}]
+    complete = json.dumps({"a": {"themes": []}, "b": {"themes": []}})
+    partial = json.dumps({"a": {"themes": []}})
+    client = MagicMock()
+    client.messages.create.side_effect = [claude_message(complete), claude_message(partial)]
+
+    with patch("api.prompt_packing.logger") as logger:
+        classify_packed(verbatims, client=client)
+        assert not any("Réponse brute" in c.args[0] for c in logger.info.call_args_list)
+        classify_packed(verbatims, client=client)
+        assert any(partial in c.args[0] for c in logger.info.call_args_list)
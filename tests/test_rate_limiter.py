@@ -0,0 +1,80 @@
+import anthropic
+import httpx
+import pytest
+from unittest.mock import MagicMock, patch
+from api.rate_limiter import RateLimiter, call_with_retries, retry_delay
+
+
+def api_error(cls, status, headers=None):
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("erreur simulée", response=response, body=None)
+
+
+def test_requests_per_minute_are_spread_once_burst_is_used():
+    now = [0.0]
+    limiter = RateLimiter(rpm=2, input_tpm=0, output_tpm=0, clock=lambda: now[0])
+
+    assert limiter.reserve(1000, 100) == 0.0
+    assert limiter.reserve(1000, 100) == 0.0
+    # Seau vide : 1 requête toutes les 30 s, les réservations suivantes s'empilent
+    assert limiter.reserve(1000, 100) == pytest.approx(30.0)
+    assert limiter.reserve(1000, 100) == pytest.approx(60.0)
+
+
+def test_input_tokens_per_minute_limit():
+    now = [0.0]
+    limiter = RateLimiter(rpm=0, input_tpm=600, output_tpm=0, clock=lambda: now[0])
+
+    assert limiter.reserve(600, 0) == 0.0
+    assert limiter.reserve(300, 0) == pytest.approx(30.0)
+    now[0] = 60.0
+    assert limiter.reserve(300, 0) == 0.0
+
+
+def test_settle_returns_unused_output_tokens():
+    limiter = RateLimiter(rpm=0, input_tpm=0, output_tpm=600, clock=lambda: 0.0)
+
+    limiter.reserve(0, 600)
+    limiter.settle(600, MagicMock(output_tokens=0))
+    assert limiter.reserve(0, 600) == 0.0
+
+
+@patch("api.rate_limiter.time.sleep")
+def test_rate_limited_call_is_retried_after_retry_after(mock_sleep):
+    send = MagicMock(side_effect=[
+        api_error(anthropic.RateLimitError, 429, {"retry-after": "2"}),
+        api_error(anthropic.InternalServerError, 529),
+        "réponse",
+    ])
+
+    assert call_with_retries(send, 1000, 100, max_retries=3) == "réponse"
+    assert send.call_count == 3
+    first_delay = mock_sleep.call_args_list[0].args[0]
+    assert first_delay >= 2.0
+
+
+@patch("api.rate_limiter.time.sleep")
+def test_non_transient_errors_are_not_retried(mock_sleep):
+    send = MagicMock(side_effect=api_error(anthropic.BadRequestError, 400))
+
+    with pytest.raises(anthropic.BadRequestError):
+        call_with_retries(send, 1000, 100, max_retries=3)
+    send.assert_called_once()
+    mock_sleep.assert_not_called()
+
+
+@patch("api.rate_limiter.time.sleep")
+def test_retries_are_bounded(mock_sleep):
+    send = MagicMock(side_effect=anthropic.APITimeoutError(httpx.Request("POST", "https://api.anthropic.com")))
+
+    with pytest.raises(anthropic.APITimeoutError):
+        call_with_retries(send, 1000, 100, max_retries=2)
+    assert send.call_count == 3
+
+
+def test_backoff_is_exponential_and_capped():
+    error = api_error(anthropic.InternalServerError, 500)
+    with patch("api.rate_limiter.random.uniform", side_effect=lambda a, b: b):
+        assert [retry_delay(error, attempt) for attempt in range(3)] == [1.0, 2.0, 4.0]
+        assert retry_delay(error, 20) == 60.0
@@ -0,0 +1,89 @@
+import time
+import pytest
+from unittest.mock import patch
+from api.claude_interface import classify_with_claude
+from api.replay import Cassette, benchmark_replay, record_analysis, use_cassette
+from tests.mock_claude_server import MockClaudeServer
+
+VERBATIMS = [
+    {"review_id": "r1", "content": "Colis arrivé en retard.", "rating": 2},
+    {"review_id": "r2", "content": "Livraison correcte mais lente.", "rating": 3},
+]
+
+
+@pytest.fixture
+def cassette_path(tmp_path, monkeypatch):
+    """Cassette enregistrée contre le faux serveur (0,1 s de latence par appel)."""
+    path = str(tmp_path / "cassette.jsonl.gz")
+    with MockClaudeServer(latency=0.1) as server:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+        with use_cassette(path, mode="record") as cassette:
+            cassette.meta["verbatims"] = VERBATIMS
+            recorded = [classify_with_claude(v["content"]) for v in VERBATIMS]
+        assert len(server.requests) == len(VERBATIMS)
+    monkeypatch.delenv("ANTHROPIC_BASE_URL")
+    return path, recorded
+
+
+def test_recorded_cassette_keeps_responses_and_latencies(cassette_path):
+    path, _ = cassette_path
+    cassette = Cassette.load(path)
+
+    assert len(cassette) == len(VERBATIMS)
+    assert cassette.meta["verbatims"] == VERBATIMS
+    assert all(latency >= 0.1 for latency in cassette.latencies())
+
+
+def test_replay_serves_recorded_responses_without_network(cassette_path):
+    path, recorded = cassette_path
+
+    start = time.time()
+    with use_cassette(path, latency="none"):
+        replayed = [classify_with_claude(v["content"]) for v in VERBATIMS]
+    assert replayed == recorded
+    assert time.time() - start < 0.1
+
+    start = time.time()
+    with use_cassette(path, latency="recorded"):
+        classify_with_claude(VERBATIMS[0]["content"])
+    assert time.time() - start >= 0.1
+
+
+def test_replay_fails_on_unrecorded_request(cassette_path):
+    path, _ = cassette_path
+
+    with use_cassette(path), pytest.raises(Exception):
+        classify_with_claude("Avis jamais enregistré.")
+
+
+def test_benchmark_replay_runs_concurrent_pipeline(cassette_path):
+    path, _ = cassette_path
+
+    report = benchmark_replay(path, concurrency=2, latency="sampled")
+
+    assert report["verbatims"] == len(VERBATIMS)
+    assert report["errors"] == 0
+    assert report["verbatims_per_second"] > 0
+
+
+def test_record_analysis_bypasses_response_cache_and_bigquery_writes(tmp_path, monkeypatch):
+    from api import response_cache
+    from api.claude_interface import _lookup_cache
+    from api.response_cache import ResponseCache
+
+    path = str(tmp_path / "cassette.jsonl.gz")
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    with patch.object(response_cache, "_cache", cache), patch.object(response_cache, "RESPONSE_CACHE_ENABLED", True):
+        _, key, _ = _lookup_cache(VERBATIMS[0]["content"], VERBATIMS[0]["rating"])
+        cache.put(key, [{"theme": "Livraison et retrait", "note": 2.0}])  # verbatim déjà en cache
+        with MockClaudeServer() as server, \
+             patch("api.bq_connect.get_verbatims_by_date", return_value=VERBATIMS), \
+             patch("api.analyze_and_insert.run_analysis") as run_analysis:
+            monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+            record_analysis(path, "2025-06-01")
+        assert response_cache.RESPONSE_CACHE_ENABLED
+    monkeypatch.delenv("ANTHROPIC_BASE_URL")
+    cache.close()
+
+    run_analysis.assert_not_called()
+    assert len(Cassette.load(path)) == len(VERBATIMS)
@@ -0,0 +1,101 @@
+import json
+import pytest
+from unittest.mock import patch
+from api import response_cache
+from api.claude_interface import classify_with_claude
+from api.response_cache import MISS, ResponseCache, make_cache_key
+from tests.claude_mocks import MockResponse
+
+THEMES = [{"theme": "Service client / SAV", "note": 4.0}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Cache activé sur un fichier SQLite propre au test."""
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_entries=100)
+    with patch.object(response_cache, "_cache", cache), patch.object(response_cache, "RESPONSE_CACHE_ENABLED", True):
+        yield cache
+    cache.close()
+
+
+def test_cache_key_normalizes_verbatim_and_depends_on_prompt_version():
+    assert make_cache_key("  Livraison   rapide\n", "v1") == make_cache_key("Livraison rapide", "v1")
+    assert make_cache_key("Livraison rapide", "v1") != make_cache_key("Livraison rapide", "v2")
+    assert make_cache_key("Livraison rapide", "v1") != make_cache_key("Livraison lente", "v1")
+
+
+def test_cache_persists_values_including_no_theme(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(path)
+    cache.put("a", THEMES)
+    cache.put("b", None)
+    cache.close()
+
+    reopened = ResponseCache(path)
+    assert reopened.get("a") == THEMES
+    assert reopened.get("b") is None
+    assert reopened.get("c") is MISS
+    reopened.close()
+
+
+def test_cache_evicts_least_recently_used(cache):
+    cache.max_entries = 2
+    with patch("api.response_cache.time.time", side_effect=[1, 2, 3, 4, 5]):
+        cache.put("a", THEMES)   # 1
+        cache.put("b", THEMES)   # 2
+        cache.get("a")           # 3 : "a" devient la plus récente
+        cache.put("c", THEMES)   # 4 : "b" est évincée
+
+    assert len(cache) == 2
+    assert cache.get("b") is MISS
+    assert cache.get("a") == THEMES
+
+
+def test_classify_with_claude_calls_api_once_per_normalized_verbatim(cache):
+    with patch("api.claude_interface.client.messages.create",
+               return_value=MockResponse(json.dumps({"themes": THEMES}))) as mock_create:
+        assert classify_with_claude("Le SAV a été très réactif.") == THEMES
+        assert classify_with_claude("  Le SAV a été   très réactif. ") == THEMES
+
+    mock_create.assert_called_once()
+
+
+def test_prompt_change_invalidates_cached_responses(cache):
+    with patch("api.claude_interface.client.messages.create",
+               return_value=MockResponse(json.dumps({"themes": THEMES}))) as mock_create:
+        classify_with_claude("Le SAV a été très réactif.")
+        with patch("api.claude_interface.build_static_instructions", return_value="Nouvelles consignes"):
+            classify_with_claude("Le SAV a été très réactif.")
+
+    assert mock_create.call_count == 2
+
+
+def test_api_errors_are_not_cached(cache):
+    with patch("api.claude_interface.client.messages.create", side_effect=RuntimeError("API indisponible")):
+        with pytest.raises(RuntimeError):
+            classify_with_claude("Avis en erreur")
+
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize("bad_answer", [
+    json.dumps({"autre": []}),                                          # clé "themes" absente
+    json.dumps({"themes": [{"theme": "Thème inventé", "note": 2}]}),   # tous les éléments rejetés
+])
+def test_rejected_answers_are_never_cached(cache, bad_answer):
+    answers = [MockResponse(bad_answer), MockResponse(json.dumps({"themes": THEMES}))]
+    with patch("api.claude_interface.client.messages.create", side_effect=answers) as mock_create:
+        assert classify_with_claude("Le SAV a été très réactif.") is None
+        assert classify_with_claude("Le SAV a été très réactif.") == THEMES
+
+    assert mock_create.call_count == 2
+    assert len(cache) == 1
+
+
+def test_declared_absence_of_theme_is_cached(cache):
+    with patch("api.claude_interface.client.messages.create",
+               return_value=MockResponse(json.dumps({"themes": []}))) as mock_create:
+        assert classify_with_claude("Rien à signaler.") is None
+        assert classify_with_claude("Rien à signaler.") is None
+
+    mock_create.assert_called_once()
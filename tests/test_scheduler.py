@@ -0,0 +1,210 @@
+import json, os
+from functools import partial
+from unittest.mock import MagicMock, patch
+from api.analysis_pipeline import run_pipelined_analysis
+from api.analyze_and_insert import run_analysis
+from api.prompt_packing import classify_packed
+from api.scheduler import AnalysisScheduler, estimate_review_tokens, load_continuation, write_continuation
+
+VERBATIMS = [
+    {"review_id": "a", "rating": 5, "content": "Très bien."},
+    {"review_id": "b", "rating": 1, "content": "Court."},
+    {"review_id": "c", "rating": 1, "content": "Colis jamais arrivé, service client injoignable depuis trois semaines."},
+    {"review_id": "d", "rating": None, "content": "Sans note."},
+    {"review_id": "e", "rating": 3, "content": "Correct dans l'ensemble."},
+]
+THEMES = [{"theme": "Livraison et retrait", "note": 2.0}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_low_ratings_then_long_reviews_first():
+    scheduler = AnalysisScheduler(criteria="rating,length")
+
+    assert [v["review_id"] for v in scheduler.order(VERBATIMS)] == ["c", "b", "e", "a", "d"]
+
+
+def test_stops_before_deadline_using_observed_durations():
+    clock = FakeClock()
+    scheduler = AnalysisScheduler(deadline_seconds=60, token_budget=0, margin=1.5, reserve_seconds=10, clock=clock)
+    admitted = 0
+    for v in scheduler.order(VERBATIMS * 4):
+        if not scheduler.admit(v):
+            break
+        clock.now += 8
+        scheduler.record(8)
+        admitted += 1
+
+    # 60 s - 10 s de réserve, 12 s prévus par avis : à 40 s, il ne reste que 10 s utiles
+    assert admitted == 5
+    assert scheduler.stop_reason == "deadline"
+
+
+def test_token_budget_defers_lowest_priority_reviews_to_continuation(tmp_path):
+    budget = sum(estimate_review_tokens(v["content"]) for v in VERBATIMS if v["review_id"] in ("b", "c"))
+    classified = []
+
+    def classify(content, rating=None):
+        classified.append(content)
+        return THEMES
+
+    with patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS), \
+         patch("api.analyze_and_insert.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analyze_and_insert.refresh_topic_aggregates"), \
+         patch("api.analyze_and_insert.bigquery.Client") as mock_client, \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        mock_client.return_value.insert_rows_json.return_value = []
+        stats = run_analysis("2025-06-01", classify_fn=classify, checkpoint_dir="", token_budget=budget)
+        continuation = load_continuation("2025-06-01", "interactive")
+
+    assert classified == [VERBATIMS[2]["content"], VERBATIMS[1]["content"]]
+    assert stats["analyzed"] == 2 and stats["deferred"] == 3
+    assert continuation["reason"] == "token_budget"
+    assert continuation["review_ids"] == ["e", "a", "d"]
+    assert json.loads((tmp_path / "continuation_2025-06-01_interactive.json").read_text()) == continuation
+
+
+def test_next_run_starts_with_the_continuation_then_clears_it(tmp_path):
+    classified = []
+
+    def classify(content, rating=None):
+        classified.append(next(v["review_id"] for v in VERBATIMS if v["content"] == content))
+        return THEMES
+
+    with patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS), \
+         patch("api.analyze_and_insert.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analyze_and_insert.refresh_topic_aggregates"), \
+         patch("api.analyze_and_insert.bigquery.Client") as mock_client, \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        mock_client.return_value.insert_rows_json.return_value = []
+        write_continuation("2025-06-01", "interactive", [VERBATIMS[3], VERBATIMS[0]], "deadline")
+        stats = run_analysis("2025-06-01", classify_fn=classify, checkpoint_dir="", token_budget=0)
+        continuation = load_continuation("2025-06-01", "interactive")
+
+    assert classified == ["d", "a", "c", "b", "e"]
+    assert stats["analyzed"] == 5 and stats["deferred"] == 0
+    assert continuation is None
+
+
+def test_batch_mode_skips_classification_when_no_review_fits_the_budget(tmp_path):
+    with patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS), \
+         patch("api.analyze_and_insert.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analyze_and_insert.refresh_topic_aggregates"), \
+         patch("api.analyze_and_insert.classify_batch") as classify_batch, \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        stats = run_analysis("2025-06-01", mode="batch", checkpoint_dir="", token_budget=1)
+        continuation = load_continuation("2025-06-01", "batch")
+
+    classify_batch.assert_not_called()
+    assert stats["analyzed"] == 0 and stats["deferred"] == len(VERBATIMS)
+    assert continuation["review_ids"] == ["c", "b", "e", "a", "d"]
+
+
+def test_packed_mode_admits_each_pack_before_sending_it():
+    clock = FakeClock()
+    scheduler = AnalysisScheduler(deadline_seconds=15, token_budget=0, margin=1.0, reserve_seconds=0, clock=clock)
+    sent = []
+
+    def classify_pack(pack, client=None, model=None):
+        sent.append([v["review_id"] for v in pack])
+        clock.now += 10
+        return {v["review_id"]: THEMES for v in pack}, [], 100
+
+    with patch("api.prompt_packing.classify_pack", side_effect=classify_pack), \
+         patch("api.prompt_packing.MAX_REVIEWS_PER_PACK", 2), \
+         patch("api.claude_interface.CLAUDE_MODEL_CASCADE", ["claude-test"]):
+        outcomes = classify_packed(scheduler.order(VERBATIMS), scheduler=scheduler)
+
+    # Paquets dans l'ordre de leur avis le plus prioritaire ; le dernier arrive après l'échéance
+    assert sent == [["c", "e"], ["b"]]
+    assert [o is None for o in outcomes] == [False, False, False, True, True]  # ordre c, b, e, a, d
+    assert scheduler.stop_reason == "deadline"
+
+
+def test_concurrent_mode_defers_reviews_once_the_deadline_is_near(tmp_path):
+    clock = FakeClock()
+
+    async def classify_async(verbatim, async_client, rating=None):
+        clock.now += 10
+        return THEMES
+
+    getenv = os.getenv  # déjà remplacé par conftest
+    with patch("api.analyze_and_insert.os.getenv",
+               side_effect=lambda key, default=None: "2" if key == "CLAUDE_CONCURRENCY" else getenv(key, default)), \
+         patch("api.analyze_and_insert.AnalysisScheduler",
+               partial(AnalysisScheduler, reserve_seconds=0, clock=clock)), \
+         patch("api.claude_interface.classify_with_claude_async", side_effect=classify_async), \
+         patch("api.claude_interface.build_async_client", return_value=MagicMock()), \
+         patch("api.analyze_and_insert.get_verbatims_by_date", return_value=VERBATIMS), \
+         patch("api.analyze_and_insert.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analyze_and_insert.refresh_topic_aggregates"), \
+         patch("api.analyze_and_insert.bigquery.Client") as mock_client, \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        mock_client.return_value.insert_rows_json.return_value = []
+        stats = run_analysis("2025-06-01", checkpoint_dir="", deadline_seconds=15, token_budget=0)
+        continuation = load_continuation("2025-06-01", "interactive")
+
+    assert stats["analyzed"] + stats["deferred"] == len(VERBATIMS)
+    assert 0 < stats["deferred"] < len(VERBATIMS)
+    assert continuation["reason"] == "deadline"
+    assert continuation["review_ids"] == ["c", "b", "e", "a", "d"][-stats["deferred"]:]
+
+
+def test_pipeline_applies_the_run_analysis_budget(tmp_path):
+    budget = sum(estimate_review_tokens(v["content"]) for v in VERBATIMS[:2])
+    client = MagicMock()
+    client.insert_rows_json.return_value = []
+
+    with patch("api.analysis_pipeline.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analysis_pipeline.refresh_topic_aggregates"), \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        stats = run_pipelined_analysis("2025-06-01", classify_fn=lambda content, rating=None: THEMES,
+                                       workers=1, verbatims=VERBATIMS, client=client, checkpoint_dir="",
+                                       scheduler=AnalysisScheduler(token_budget=budget))
+        continuation = load_continuation("2025-06-01", "interactive")
+
+    assert stats["analyzed"] == 2 and stats["deferred"] == 3
+    assert continuation["review_ids"] == ["c", "d", "e"]
+
+
+def test_pipeline_reads_the_continuation_first_and_keeps_it_after_a_read_failure(tmp_path):
+    classified = []
+    client = MagicMock()
+    client.insert_rows_json.return_value = []
+
+    def classify(content, rating=None):
+        classified.append(next(v["review_id"] for v in VERBATIMS if v["content"] == content))
+        return THEMES
+
+    def failing_source():
+        yield VERBATIMS[0]
+        raise RuntimeError("lecture BigQuery interrompue")
+
+    def run_pipeline(source):
+        return run_pipelined_analysis("2025-06-01", classify_fn=classify, workers=1, verbatims=source,
+                                      client=client, checkpoint_dir="", scheduler=AnalysisScheduler(token_budget=0))
+
+    with patch("api.analysis_pipeline.load_topic_ids", return_value={"Livraison et retrait": "t1"}), \
+         patch("api.analysis_pipeline.refresh_topic_aggregates"), \
+         patch("api.analysis_pipeline.get_verbatims_by_ids",
+               side_effect=lambda ids: [v for i in ids for v in VERBATIMS if v["review_id"] == i]), \
+         patch("api.scheduler.ANALYSIS_CONTINUATION_DIR", str(tmp_path)):
+        write_continuation("2025-06-01", "interactive", [VERBATIMS[3], VERBATIMS[4]], "deadline")
+        try:
+            run_pipeline(failing_source())
+        except RuntimeError:
+            pass
+        kept = load_continuation("2025-06-01", "interactive")
+        run_pipeline(VERBATIMS)
+        cleared = load_continuation("2025-06-01", "interactive")
+
+    assert classified[:3] == ["d", "e", "a"]
+    assert kept["review_ids"] == ["d", "e"]
+    assert classified[3:] == ["d", "e", "a", "b", "c"]
+    assert cleared is None
@@ -0,0 +1,82 @@
+import json, os
+import pytest
+from unittest.mock import patch
+from api import taxonomy
+
+BQ_TOPICS = [
+    {"topic_id": "T1", "topic_label": "Prix et promotions", "description": None},
+    {"topic_id": "T2", "topic_label": "Livraison et retrait", "description": "Délais et suivi de colis"},
+]
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path):
+    """Chaque test utilise son propre fichier de cache et un cache mémoire vide."""
+    with patch.object(taxonomy, "TAXONOMY_CACHE_PATH", str(tmp_path / "topics.json")):
+        taxonomy.clear_taxonomy_cache()
+        yield tmp_path / "topics.json"
+    taxonomy.clear_taxonomy_cache()
+
+
+@patch("api.taxonomy.fetch_topics_from_bq", return_value=BQ_TOPICS)
+def test_topics_loaded_once_within_ttl(mock_fetch):
+    """La table topics n'est interrogée qu'une fois tant que le TTL n'est pas expiré."""
+    taxonomy.get_theme_labels()
+    taxonomy.get_label_to_id()
+    taxonomy.get_theme_block()
+
+    mock_fetch.assert_called_once()
+
+
+@patch("api.taxonomy.fetch_topics_from_bq", return_value=BQ_TOPICS)
+def test_single_load_compiles_prompt_labels_and_index(mock_fetch):
+    """Le bloc du prompt, les labels du validateur et label_to_id proviennent du même chargement."""
+    tax = taxonomy.get_taxonomy()
+
+    assert tax["labels"] == {"Prix et promotions", "Livraison et retrait"}
+    assert tax["label_to_id"] == {"Prix et promotions": "T1", "Livraison et retrait": "T2"}
+    # Description absente de la table -> description par défaut
+    assert "- Prix et promotions : Rapport qualité/prix" in tax["theme_block"]
+    assert "- Livraison et retrait : Délais et suivi de colis" in tax["theme_block"]
+
+
+def test_disk_cache_avoids_bigquery(isolated_cache):
+    """Un cache disque encore frais est réutilisé par un nouveau processus sans appel BigQuery."""
+    import time
+    isolated_cache.write_text(json.dumps({"loaded_at": time.time(), "topics": BQ_TOPICS}))
+
+    with patch("api.taxonomy.fetch_topics_from_bq") as mock_fetch:
+        tax = taxonomy.get_taxonomy()
+
+    mock_fetch.assert_not_called()
+    assert tax["source"] == "disk"
+    assert tax["label_to_id"]["Livraison et retrait"] == "T2"
+
+
+def test_expired_disk_cache_is_refreshed(isolated_cache):
+    """Un cache disque expiré déclenche un rechargement depuis BigQuery."""
+    isolated_cache.write_text(json.dumps({"loaded_at": 0, "topics": BQ_TOPICS[:1]}))
+
+    with patch("api.taxonomy.fetch_topics_from_bq", return_value=BQ_TOPICS) as mock_fetch:
+        tax = taxonomy.get_taxonomy()
+
+    mock_fetch.assert_called_once()
+    assert tax["source"] == "bigquery"
+    assert len(json.loads(isolated_cache.read_text())["topics"]) == 2
+
+
+@patch("api.taxonomy.fetch_topics_from_bq", side_effect=Exception("BigQuery indisponible"))
+def test_fallback_to_default_themes(mock_fetch):
+    """Sans BigQuery ni cache, les thèmes par défaut servent au prompt mais aucun topic_id n'est inventé."""
+    labels = taxonomy.get_theme_labels()
+
+    assert labels == {t["nom"] for t in taxonomy.DEFAULT_THEMES}
+    with pytest.raises(RuntimeError):
+        taxonomy.get_label_to_id()
+
+
+def test_topics_are_read_in_the_configured_project():
+    with patch("google.cloud.bigquery.Client") as mock_client:
+        mock_client.return_value.query.return_value.result.return_value = []
+        taxonomy.fetch_topics_from_bq()
+
+    mock_client.assert_called_once_with(project=os.getenv("PROJECT_ID"))
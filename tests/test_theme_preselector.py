@@ -0,0 +1,62 @@
+import json
+from unittest.mock import patch
+from api.taxonomy import DEFAULT_THEMES
+from api.theme_preselector import evaluate_preselector, preselect_themes
+from tests.claude_mocks import MockResponse
+
+THEMES = [dict(t) for t in DEFAULT_THEMES]
+
+# Avis déjà classifiés avec le référentiel complet (jeu tenu à l'écart du réglage des lexiques)
+HELD_OUT = [
+    {"content": "Le service client était excellent, très réactif et à l'écoute.", "themes": ["Service client / SAV"]},
+    {"content": "Produit reçu cassé et le remboursement a pris des semaines.",
+     "themes": ["Retour et remboursement", "Qualité des produits"]},
+    {"content": "Commande arrivée 1 mois aprés la date prévue, c'est indamissible!", "themes": ["Livraison et retrait"]},
+    {"content": "J'ai adoré l'expérience d'achat en ligne, le site est très intuitif.",
+     "themes": ["Expérience d'achat en ligne"]},
+]
+
+
+def test_preselection_keeps_matching_themes_only():
+    labels = [t["nom"] for t in preselect_themes("Colis livré en retard et le SAV ne répond pas.", THEMES)]
+
+    assert "Livraison et retrait" in labels
+    assert "Service client / SAV" in labels
+    assert "Programme fidélité" not in labels
+    assert len(labels) < len(THEMES)
+
+
+def test_no_keyword_falls_back_to_full_taxonomy():
+    assert preselect_themes("Bof.", THEMES) == THEMES
+
+
+def test_theme_without_lexicon_is_always_candidate():
+    themes = THEMES + [{"nom": "Nouveau thème", "description": "Ajouté dans la table topics"}]
+    labels = [t["nom"] for t in preselect_themes("Le site plante sans arrêt.", themes)]
+
+    assert "Nouveau thème" in labels
+
+
+@patch("api.theme_preselector.get_themes", return_value=THEMES)
+def test_evaluation_reports_recall_and_prompt_reduction(mock_themes):
+    report = evaluate_preselector(HELD_OUT)
+
+    assert report["reviews"] == 4
+    assert report["recall"] == 1.0
+    assert report["mean_candidates"] < len(THEMES)
+    assert report["theme_block_tokens_mean"] < report["theme_block_tokens_full"]
+
+
+@patch("api.claude_interface.THEME_PRESELECTION_ENABLED", True)
+def test_prompt_lists_only_preselected_themes():
+    with patch("api.claude_interface.client.messages.create",
+               return_value=MockResponse(json.dumps({"themes": []}))) as mock_create:
+        from api.claude_interface import classify_with_claude
+        classify_with_claude("Le remboursement n'est jamais arrivé.")
+
+    (system_block,) = mock_create.call_args.kwargs["system"]
+    assert system_block["cache_control"] == {"type": "ephemeral"}
+    assert "- Programme fidélité :" in system_block["text"]  # préfixe mis en cache : référentiel complet
+    user_text = mock_create.call_args.kwargs["messages"][0]["content"]
+    assert "- Retour et remboursement\n" in user_text
+    assert "Programme fidélité" not in user_text
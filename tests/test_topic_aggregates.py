@@ -0,0 +1,53 @@
+from datetime import date
+from unittest.mock import patch, MagicMock
+from api import topic_aggregates
+from api.topic_aggregates import refresh_topic_aggregates, rebuild_topic_aggregates, split_date_range
+
+
+def test_refresh_without_reviews_does_nothing():
+    """Aucun avis analysé : aucune requête n'est lancée."""
+    client = MagicMock()
+    assert refresh_topic_aggregates([], client=client) == 0
+    client.query.assert_not_called()
+
+
+def test_refresh_merges_only_affected_cells():
+    """Le MERGE est paramétré par les review_id du lot et ne recalcule que les cellules touchées."""
+    client = MagicMock()
+    client.query.return_value.num_dml_affected_rows = 3
+
+    updated = refresh_topic_aggregates(["r2", "r1", "r1"], client=client)
+
+    assert updated == 3
+    query, kwargs = client.query.call_args[0][0], client.query.call_args[1]
+    assert query.strip().startswith(f"MERGE `{topic_aggregates.AGGREGATE_TABLE_ID}`")
+    assert "IN UNNEST(@review_ids)" in query
+    assert "NOT MATCHED BY SOURCE" not in query
+    assert "COALESCE(ta.source, 'claude') = 'claude'" in query  # prédictions du modèle local exclues
+    param = kwargs["job_config"].query_parameters[0]
+    assert param.values == ["r1", "r2"]
+
+
+def test_split_date_range():
+    """La période est découpée en tranches contiguës et disjointes."""
+    chunks = split_date_range(date(2025, 1, 1), date(2025, 1, 10), chunk_days=4)
+    assert chunks == [
+        (date(2025, 1, 1), date(2025, 1, 4)),
+        (date(2025, 1, 5), date(2025, 1, 8)),
+        (date(2025, 1, 9), date(2025, 1, 10)),
+    ]
+
+
+@patch("api.topic_aggregates.bigquery.Client")
+def test_rebuild_runs_one_merge_per_chunk(mock_bq_client):
+    """La reconstruction lance un MERGE (avec suppression des cellules obsolètes) par tranche de dates."""
+    client = mock_bq_client.return_value
+    client.query.return_value.num_dml_affected_rows = 5
+
+    total = rebuild_topic_aggregates("2025-01-01", "2025-03-01", chunk_days=30, max_workers=2)
+
+    assert client.query.call_count == 2
+    assert total == 10
+    for call in client.query.call_args_list:
+        assert "WHEN NOT MATCHED BY SOURCE AND T.day BETWEEN @start AND @end THEN DELETE" in call[0][0]
+        assert "COALESCE(ta.source, 'claude') = 'claude'" in call[0][0]